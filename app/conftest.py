@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# The app imports its packages from this directory (the container's working directory), wherever pytest starts.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True, scope="session")
+def scratch_directories(tmp_path_factory):
+    from core.config import get_settings
+    from db.session import get_ingest_log, get_write_spool
+
+    # Spool and ingest log directories default to the working directory; keep them out of the tree.
+    env = pytest.MonkeyPatch()
+    env.setenv("INFLUX_SPOOL_DIR", str(tmp_path_factory.mktemp("spool")))
+    env.setenv("INGEST_LOG_DIR", str(tmp_path_factory.mktemp("ingest-log")))
+    for factory in (get_settings, get_write_spool, get_ingest_log):
+        factory.cache_clear()
+    yield
+    env.undo()
+    for factory in (get_settings, get_write_spool, get_ingest_log):
+        factory.cache_clear()
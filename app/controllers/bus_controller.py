@@ -1,55 +1,240 @@
+import hmac
 from datetime import datetime
-from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, Query, status
-from typing import AsyncIterator, Generator, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional
 from core.config import get_settings
 from db.session import get_session_factory
-from repos.bus_repository import BusRepository
-from repos.influx_repository import TelemetryRepository
+from repos.influx_repository import AsyncTelemetryRepository
 from schemas.response import ResponseModel
-from schemas.bus import Bus
+from schemas.bus import Bus, BusImportResult, BusSummary
 from schemas.telemetry import BusTelemetry, TelemetryAggregates
+from schemas.telemetry_formats import (
+    ARROW_MEDIA_TYPE,
+    COLUMNAR_JSON_MEDIA_TYPE,
+    CSV_MEDIA_TYPE,
+    HISTORY_FORMATS,
+    JSON_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    ArrowStreamEncoder,
+    TelemetryRow,
+    encode_columnar_json,
+    encode_csv,
+    negotiate_media_type,
+)
+from services.bus_import import parse_bus_rows
 from services.bus_service import BusService
 from services.telemetry_service import TelemetryService
 
 router = APIRouter(prefix="/api/v1/buses", tags=["buses"])
 
-async def get_db_session() -> AsyncIterator[AsyncSession]:
-    session_factory = get_session_factory()
-    async with session_factory() as session:
-        yield session
+SNAPSHOT_FIELDS = [name for name in BusTelemetry.model_fields if name != "bus_id"]
 
-def get_service(session: AsyncSession = Depends(get_db_session)) -> BusService:
-    repository = BusRepository(session)
-    return BusService(repository)
+HISTORY_MEDIA_TYPES = [JSON_MEDIA_TYPE, COLUMNAR_JSON_MEDIA_TYPE, CSV_MEDIA_TYPE, ARROW_MEDIA_TYPE]
+# application/json stays accepted for streams so existing NDJSON clients keep working.
+HISTORY_STREAM_MEDIA_TYPES = [NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE, ARROW_MEDIA_TYPE, JSON_MEDIA_TYPE]
 
-def get_telemetry_service() -> Generator[TelemetryService, None, None]:
-    repository = TelemetryRepository()
+def get_service() -> BusService:
+    return BusService(get_session_factory())
+
+async def require_admin(admin_key: Optional[str] = Header(None, alias="X-Admin-Api-Key")) -> None:
+    expected = get_settings().admin_api_key
+    if not expected:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not admin_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing admin API key")
+    if not hmac.compare_digest(expected.encode(), admin_key.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin API key")
+
+async def get_telemetry_service() -> AsyncIterator[TelemetryService]:
+    repository = AsyncTelemetryRepository()
     service = TelemetryService(repository)
     
     yield service
 
 
 
+@router.get("", response_model=ResponseModel[List[BusSummary]])
+async def list_buses(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000, description="Maximum buses to return"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    route: Optional[str] = Query(None, description="Only buses on this route"),
+    plate_prefix: Optional[str] = Query(None, min_length=1, description="Only plate numbers starting with this"),
+    driver: Optional[str] = Query(None, description="Only buses with this driver"),
+    bus_service: BusService = Depends(get_service),
+) -> ResponseModel[List[BusSummary]]:
+    page = await bus_service.list_buses(limit, cursor, route, plate_prefix, driver)
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=page.items)
+
+@router.get("/telemetry/latest", response_model=ResponseModel[List[Dict[str, Any]]])
+async def get_fleet_latest_telemetry(
+    route: Optional[str] = Query(None, description="Only buses on this route"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. latitude,longitude"),
+    bus_service: BusService = Depends(get_service),
+    telemetry_service: TelemetryService = Depends(get_telemetry_service),
+) -> ResponseModel[List[Dict[str, Any]]]:
+    include = set(SNAPSHOT_FIELDS)
+    if fields:
+        include = {field.strip() for field in fields.split(",") if field.strip()}
+        unknown = include.difference(SNAPSHOT_FIELDS)
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}",
+            )
+    include.add("bus_id")
+
+    bus_ids = await bus_service.list_bus_ids(route)
+    snapshot = await telemetry_service.get_fleet_latest_telemetry(bus_ids)
+    data = [telemetry.model_dump(mode="json", include=include) for telemetry in snapshot]
+    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=data)
+
+@router.post(
+    "/import",
+    response_model=ResponseModel[BusImportResult],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                JSON_MEDIA_TYPE: {"schema": {"type": "array", "items": Bus.model_json_schema()}},
+                CSV_MEDIA_TYPE: {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def import_buses(
+    request: Request,
+    overwrite: bool = Query(False, description="Update buses that already exist instead of reporting them"),
+    _: None = Depends(require_admin),
+    bus_service: BusService = Depends(get_service),
+) -> ResponseModel[BusImportResult]:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        rows = parse_bus_rows(await request.body(), "csv" if content_type == CSV_MEDIA_TYPE else "json")
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    result = await bus_service.import_buses(rows, overwrite=overwrite)
+    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=result)
+
 @router.get("/{bus_id}/telemetry/latest", response_model=ResponseModel[BusTelemetry])
 async def get_latest_bus_telemetry(
     bus_id: str, telemetry_service: TelemetryService = Depends(get_telemetry_service)
 ) -> ResponseModel[BusTelemetry]:
     
-    latest = telemetry_service.get_latest_bus_telemetry(bus_id)
+    latest = await telemetry_service.get_latest_bus_telemetry(bus_id)
     return ResponseModel(status=status.HTTP_200_OK, message="Success", data=latest)
 
-@router.get("/{bus_id}/telemetry/history", response_model=ResponseModel[List[BusTelemetry]])
+def _history_media_type(accept: Optional[str], format: Optional[str], stream: bool) -> str:
+    offered = HISTORY_STREAM_MEDIA_TYPES if stream else HISTORY_MEDIA_TYPES
+    if format is not None:
+        media_type = HISTORY_FORMATS.get(format.strip().lower())
+        if media_type is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"format must be one of {', '.join(HISTORY_FORMATS)}",
+            )
+        media_type = media_type if media_type in offered else None
+    else:
+        media_type = negotiate_media_type(accept, offered)
+    if media_type is None:
+        supported = "NDJSON, CSV or Arrow" if stream else "JSON, columnar JSON, CSV or Arrow"
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail=f"History is available as {supported}")
+    if stream and media_type == JSON_MEDIA_TYPE:
+        return NDJSON_MEDIA_TYPE
+    return media_type
+
+
+def _arrow_encoder() -> ArrowStreamEncoder:
+    try:
+        return ArrowStreamEncoder()
+    except ImportError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Arrow output is not available on this server"
+        ) from exc
+
+
+async def _csv_stream(batches: AsyncIterator[List[TelemetryRow]]) -> AsyncIterator[bytes]:
+    header = True
+    async for batch in batches:
+        yield encode_csv(batch, header=header)
+        header = False
+    if header:
+        yield encode_csv([])
+
+
+async def _arrow_stream(batches: AsyncIterator[List[TelemetryRow]], encoder: ArrowStreamEncoder) -> AsyncIterator[bytes]:
+    yield encoder.encode([])
+    async for batch in batches:
+        yield encoder.encode(batch)
+    yield encoder.close()
+
+
+@router.get(
+    "/{bus_id}/telemetry/history",
+    response_model=ResponseModel[List[BusTelemetry]],
+    responses={
+        200: {
+            "content": {
+                COLUMNAR_JSON_MEDIA_TYPE: {},
+                CSV_MEDIA_TYPE: {},
+                ARROW_MEDIA_TYPE: {},
+                NDJSON_MEDIA_TYPE: {},
+            }
+        }
+    },
+)
 async def get_bus_telemetry_history(
+    response: Response,
     bus_id: str,
     start: Optional[datetime] = Query(None, description="Start time Defaults to end-24h."),
     end: Optional[datetime] = Query(None, description="End time. Defaults to now."),
     limit: int = Query(100, ge=1, le=5000, description="Maximum points to return"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    stream: bool = Query(False, description="Stream every point in the range as NDJSON, oldest first; ignores limit"),
+    max_points: Optional[int] = Query(
+        None, ge=1, le=5000, description="Downsample the range to about this many points for charts"
+    ),
+    resolution: Optional[str] = Query(None, description="Downsample to one point per window, e.g. 1m or 1h"),
+    format: Optional[str] = Query(
+        None, description="Overrides the Accept header: json, columnar, csv, arrow or ndjson (stream only)"
+    ),
+    accept: Optional[str] = Header(None),
     telemetry_service: TelemetryService = Depends(get_telemetry_service),
-) -> ResponseModel[List[BusTelemetry]]:
-    
-    history = telemetry_service.get_bus_telemetry_history(bus_id, start, end, limit)
-    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=history)
+):
+    media_type = _history_media_type(accept, format, stream)
+
+    if stream:
+        if media_type == NDJSON_MEDIA_TYPE:
+            rows = telemetry_service.stream_bus_telemetry_history(bus_id, start, end)
+            return StreamingResponse(rows, media_type=NDJSON_MEDIA_TYPE)
+        encoder = _arrow_encoder() if media_type == ARROW_MEDIA_TYPE else None
+        batches = telemetry_service.stream_bus_telemetry_history_rows(bus_id, start, end)
+        body = _arrow_stream(batches, encoder) if encoder is not None else _csv_stream(batches)
+        return StreamingResponse(body, media_type=media_type)
+
+    if media_type != JSON_MEDIA_TYPE:
+        encoder = _arrow_encoder() if media_type == ARROW_MEDIA_TYPE else None
+        row_page = await telemetry_service.get_bus_telemetry_history_rows(
+            bus_id, start, end, limit, cursor, max_points=max_points, resolution=resolution
+        )
+        if encoder is not None:
+            content = encoder.encode(row_page.rows) + encoder.close()
+        elif media_type == CSV_MEDIA_TYPE:
+            content = encode_csv(row_page.rows)
+        else:
+            content = encode_columnar_json(bus_id, row_page.rows)
+        headers = {"X-Next-Cursor": row_page.next_cursor} if row_page.next_cursor is not None else None
+        return Response(content=content, media_type=media_type, headers=headers)
+
+    page = await telemetry_service.get_bus_telemetry_history(
+        bus_id, start, end, limit, cursor, max_points=max_points, resolution=resolution
+    )
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=page.items)
 
 
 @router.get("/{bus_id}/telemetry/aggregates", response_model=ResponseModel[TelemetryAggregates])
@@ -59,5 +244,5 @@ async def get_bus_telemetry_aggregates(
     telemetry_service: TelemetryService = Depends(get_telemetry_service),
 ) -> ResponseModel[TelemetryAggregates]:
     
-    aggregates = telemetry_service.get_bus_telemetry_aggregates(bus_id, window)
+    aggregates = await telemetry_service.get_bus_telemetry_aggregates(bus_id, window)
     return ResponseModel(status=status.HTTP_200_OK, message="Success", data=aggregates)
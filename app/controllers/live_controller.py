@@ -0,0 +1,93 @@
+import asyncio
+import contextlib
+from typing import AsyncIterator, FrozenSet, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+from core.config import get_settings
+from db.session import get_session_factory
+from services.bus_service import BusService
+from services.live_hub import LiveSubscription, get_live_hub
+
+router = APIRouter(prefix="/api/v1/live", tags=["live"])
+
+
+async def _resolve_bus_filter(bus_ids: List[str], route: Optional[str]) -> Optional[FrozenSet[str]]:
+    # None subscribes to the whole fleet.
+    selected = {bus_id.strip() for bus_id in bus_ids if bus_id.strip()}
+    if route:
+        route_buses = set(await BusService(get_session_factory()).list_bus_ids(route))
+        if not route_buses:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No buses on route")
+        selected |= route_buses
+    return frozenset(selected) if selected else None
+
+
+async def _sse_events(request: Request, subscription: LiveSubscription) -> AsyncIterator[str]:
+    heartbeat = get_settings().live_heartbeat_seconds
+    hub = get_live_hub()
+    try:
+        while not subscription.closed:
+            batch = await subscription.next_batch(timeout=heartbeat)
+            if await request.is_disconnected():
+                break
+            if not batch:
+                yield ": keep-alive\n\n"
+                continue
+            for telemetry in batch:
+                yield f"event: telemetry\ndata: {telemetry.model_dump_json()}\n\n"
+    finally:
+        hub.unsubscribe(subscription)
+
+
+@router.get("/telemetry/sse")
+async def stream_telemetry_sse(
+    request: Request,
+    bus_id: List[str] = Query([], description="Only push these buses; repeatable"),
+    route: Optional[str] = Query(None, description="Only push buses on this route"),
+) -> StreamingResponse:
+    bus_filter = await _resolve_bus_filter(bus_id, route)
+    subscription = get_live_hub().subscribe(bus_filter)
+    return StreamingResponse(
+        _sse_events(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/telemetry/ws")
+async def stream_telemetry_ws(
+    websocket: WebSocket,
+    bus_id: List[str] = Query([]),
+    route: Optional[str] = Query(None),
+) -> None:
+    try:
+        bus_filter = await _resolve_bus_filter(bus_id, route)
+    except HTTPException as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+        return
+
+    await websocket.accept()
+    hub = get_live_hub()
+    subscription = hub.subscribe(bus_filter)
+
+    async def watch_disconnect() -> None:
+        # Client messages are ignored; this only notices when the socket goes away.
+        with contextlib.suppress(WebSocketDisconnect):
+            while True:
+                await websocket.receive_text()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    watcher.add_done_callback(lambda _: subscription.close())
+    heartbeat = get_settings().live_heartbeat_seconds
+    try:
+        while not subscription.closed:
+            batch = await subscription.next_batch(timeout=heartbeat)
+            if batch:
+                await websocket.send_json([telemetry.model_dump(mode="json") for telemetry in batch])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(subscription)
+        watcher.cancel()
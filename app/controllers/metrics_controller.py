@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from core.metrics import MULTIPROCESS
+from services.pipeline_metrics import get_pipeline_collector
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics() -> Response:
+    # Sync handler: rendering runs on the threadpool, off the event loop.
+    if MULTIPROCESS:
+        # Any worker may take the scrape; it reports the sum over every worker's metric files.
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    get_pipeline_collector()
+    return Response(content=generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
@@ -1,31 +1,103 @@
-from typing import AsyncIterator, Generator, List
+import asyncio
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, List, Type, Union
 
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
-from db.session import get_session_factory
-from repos.bus_repository import BusRepository
-from repos.influx_repository import TelemetryRepository
+from core.config import get_settings
+from core.metrics import STAGE_API_KEY, STAGE_VALIDATE
+from db.session import get_write_spool
+from repos.influx_repository import AsyncTelemetryRepository
 from schemas.response import ResponseModel
-from schemas.telemetry import BusTelemetryIn, BusTelemetry
-from services.bus_service import BusService
+from schemas.telemetry import (
+    BusTelemetryIn,
+    BusTelemetry,
+    GatewayBatchIn,
+    DedupStats,
+    GatewayIngestResult,
+    IngestStreamResult,
+    RejectedBus,
+    SpoolStats,
+)
+from schemas.telemetry_binary import BINARY_CONTENT_TYPE, BinaryTelemetryError, TelemetryFrame, decode_frame
+from services.admission import (
+    IngestAdmission,
+    TokenBucketLimiter,
+    get_ingest_admission,
+    get_ingest_rate_limiter,
+    rate_limited,
+)
+from services.bus_credential_cache import BusCredentialCache, get_bus_credential_cache
+from services.dedup import get_telemetry_deduplicator
+from services.ndjson import iter_ndjson_lines
 from services.telemetry_service import TelemetryService
 
 router = APIRouter(prefix="/api/v1/ingest", tags=["ingest"])
 
-def get_service() -> Generator[TelemetryService, None, None]:
-    repository = TelemetryRepository()
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+DUPLICATES_HEADER = "X-Telemetry-Duplicates"
+
+_BATCH_ADAPTER = TypeAdapter(List[BusTelemetryIn])
+
+
+def _inline_schema(model: Type[BaseModel]) -> dict:
+    # Bodies read by dependencies never reach the generated components, so nested models are inlined.
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def resolve(node: Any) -> Any:
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return resolve(definitions[node["$ref"].rsplit("/", 1)[-1]])
+            return {key: resolve(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [resolve(value) for value in node]
+        return node
+
+    return resolve(schema)
+
+
+def _request_body_openapi(model: Type[BaseModel], is_list: bool, binary: bool = True) -> dict:
+    schema = _inline_schema(model)
+    if is_list:
+        schema = {"type": "array", "items": schema}
+    content = {"application/json": {"schema": schema}}
+    if binary:
+        content[BINARY_CONTENT_TYPE] = {"schema": {"type": "string", "format": "binary"}}
+    return {"requestBody": {"required": True, "content": content}}
+
+
+def _content_type(request: Request) -> str:
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+async def get_service() -> AsyncIterator[TelemetryService]:
+    repository = AsyncTelemetryRepository()
     service = TelemetryService(repository)
     yield service
 
 
-async def get_bus_service() -> AsyncIterator[BusService]:
-    session_factory = get_session_factory()
-    async with session_factory() as session:
-        repository = BusRepository(session)
-        yield BusService(repository)
+async def get_credential_cache() -> BusCredentialCache:
+    return get_bus_credential_cache()
+
 
+async def get_rate_limiter() -> TokenBucketLimiter:
+    return get_ingest_rate_limiter()
 
-async def _validate_bus_api_key(bus_ids: List[str], api_key: str | None, bus_service: BusService) -> None:
+
+async def admit_ingest() -> IngestAdmission:
+    # Every ingest route declares this before the dependency that reads its body (none takes a body
+    # parameter, which FastAPI would read first), so an overloaded pipeline rejects without reading it.
+    admission = get_ingest_admission()
+    admission.check()
+    return admission
+
+
+async def _validate_bus_api_key(
+    bus_ids: List[str], api_key: str | None, credential_cache: BusCredentialCache
+) -> None:
     if not api_key:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing API key")
     unique_ids = {bus_id.strip() for bus_id in bus_ids if bus_id}
@@ -37,48 +109,257 @@ async def _validate_bus_api_key(bus_ids: List[str], api_key: str | None, bus_ser
             detail="Batch telemetry must belong to a single bus",
         )
     bus_id = unique_ids.pop()
-    bus = await bus_service.get_bus(bus_id)
-    if bus is None or str(bus.api_key) != api_key:
+    started = time.perf_counter()
+    verified = await credential_cache.verify(bus_id, api_key)
+    STAGE_API_KEY.observe(time.perf_counter() - started)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid API key")
 
 
+async def _decode_binary_body(request: Request) -> TelemetryFrame:
+    body = await request.body()
+    started = time.perf_counter()
+    try:
+        return decode_frame(body)
+    except BinaryTelemetryError as exc:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc)) from exc
+    finally:
+        STAGE_VALIDATE.observe(time.perf_counter() - started)
+
+
+def _body_validation_error(exc: ValidationError) -> RequestValidationError:
+    errors = exc.errors(include_url=False)
+    for error in errors:
+        error["loc"] = ("body", *error["loc"])
+    return RequestValidationError(errors)
+
+
+# Binary bodies stay a decoded TelemetryFrame, which the service normalizes in one pass.
+async def read_single_payload(request: Request) -> Union[BusTelemetryIn, TelemetryFrame]:
+    if _content_type(request) == BINARY_CONTENT_TYPE:
+        frame = await _decode_binary_body(request)
+        if frame.count != 1:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Single telemetry frame must contain exactly one record",
+            )
+        return frame
+    body = await request.body()
+    started = time.perf_counter()
+    try:
+        return BusTelemetryIn.model_validate_json(body)
+    except ValidationError as exc:
+        raise _body_validation_error(exc) from exc
+    finally:
+        STAGE_VALIDATE.observe(time.perf_counter() - started)
+
+
+async def read_batch_payloads(request: Request) -> Union[List[BusTelemetryIn], TelemetryFrame]:
+    if _content_type(request) == BINARY_CONTENT_TYPE:
+        return await _decode_binary_body(request)
+    body = await request.body()
+    started = time.perf_counter()
+    try:
+        return _BATCH_ADAPTER.validate_json(body)
+    except ValidationError as exc:
+        raise _body_validation_error(exc) from exc
+    finally:
+        STAGE_VALIDATE.observe(time.perf_counter() - started)
+
+
+def _enforce_rate_limit(limiter: TokenBucketLimiter, bus_id: str, points: int) -> None:
+    wait = limiter.acquire(bus_id.strip(), points)
+    if wait > 0:
+        raise rate_limited(wait)
+
+
 async def require_single_bus_api_key(
-    payload: BusTelemetryIn,
+    _admission: IngestAdmission = Depends(admit_ingest),
+    payload: Union[BusTelemetryIn, TelemetryFrame] = Depends(read_single_payload),
     api_key: str | None = Header(None, alias="X-Bus-Api-Key"),
-    bus_service: BusService = Depends(get_bus_service),
+    credential_cache: BusCredentialCache = Depends(get_credential_cache),
+    limiter: TokenBucketLimiter = Depends(get_rate_limiter),
 ) -> None:
-    await _validate_bus_api_key([payload.bus_id], api_key, bus_service)
+    await _validate_bus_api_key([payload.bus_id], api_key, credential_cache)
+    _enforce_rate_limit(limiter, payload.bus_id, 1)
 
 
 async def require_batch_bus_api_key(
-    payloads: List[BusTelemetryIn],
+    _admission: IngestAdmission = Depends(admit_ingest),
+    payloads: Union[List[BusTelemetryIn], TelemetryFrame] = Depends(read_batch_payloads),
     api_key: str | None = Header(None, alias="X-Bus-Api-Key"),
-    bus_service: BusService = Depends(get_bus_service),
+    credential_cache: BusCredentialCache = Depends(get_credential_cache),
+    limiter: TokenBucketLimiter = Depends(get_rate_limiter),
 ) -> None:
-    await _validate_bus_api_key([payload.bus_id for payload in payloads], api_key, bus_service)
+    if isinstance(payloads, TelemetryFrame):
+        await _validate_bus_api_key([payloads.bus_id] if payloads.count else [], api_key, credential_cache)
+        _enforce_rate_limit(limiter, payloads.bus_id, payloads.count)
+        return
+    await _validate_bus_api_key([payload.bus_id for payload in payloads], api_key, credential_cache)
+    _enforce_rate_limit(limiter, payloads[0].bus_id, len(payloads))
 
 
 
 
-@router.post("/bus", response_model=ResponseModel[BusTelemetry], status_code=status.HTTP_202_ACCEPTED)
+@router.post(
+    "/bus",
+    response_model=ResponseModel[BusTelemetry],
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=_request_body_openapi(BusTelemetryIn, is_list=False),
+)
 async def ingest_bus(
-    payload: BusTelemetryIn,
+    response: Response,
+    _admission: IngestAdmission = Depends(admit_ingest),
+    payload: Union[BusTelemetryIn, TelemetryFrame] = Depends(read_single_payload),
     service: TelemetryService = Depends(get_service),
     _: None = Depends(require_single_bus_api_key),
 ) -> ResponseModel[BusTelemetry]:
-    normalized = service.ingest_bus_telemetry(payload)
-    return ResponseModel(status=status.HTTP_202_ACCEPTED, message="Success", data=normalized)
+    if isinstance(payload, TelemetryFrame):
+        outcome = await service.ingest_bus_telemetry_frame(payload)
+    else:
+        outcome = await service.ingest_bus_telemetry(payload)
+    response.headers[DUPLICATES_HEADER] = str(outcome.duplicates)
+    return ResponseModel(status=status.HTTP_202_ACCEPTED, message="Success", data=outcome.telemetry[0])
 
 
 @router.post(
     "/bus/batch",
     response_model=ResponseModel[List[BusTelemetry]],
     status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=_request_body_openapi(BusTelemetryIn, is_list=True),
 )
 async def ingest_bus_batch(
-    payloads: List[BusTelemetryIn],
+    response: Response,
+    _admission: IngestAdmission = Depends(admit_ingest),
+    payloads: Union[List[BusTelemetryIn], TelemetryFrame] = Depends(read_batch_payloads),
     service: TelemetryService = Depends(get_service),
     _: None = Depends(require_batch_bus_api_key),
 ) -> ResponseModel[List[BusTelemetry]]:
-    normalized = service.ingest_bus_telemetry_batch(payloads)
-    return ResponseModel(status=status.HTTP_202_ACCEPTED, message="Success", data=normalized)
+    if isinstance(payloads, TelemetryFrame):
+        outcome = await service.ingest_bus_telemetry_frame(payloads)
+    else:
+        outcome = await service.ingest_bus_telemetry_batch(payloads)
+    response.headers[DUPLICATES_HEADER] = str(outcome.duplicates)
+    return ResponseModel(status=status.HTTP_202_ACCEPTED, message="Success", data=outcome.telemetry)
+
+
+@router.post(
+    "/bus/stream",
+    response_model=ResponseModel[IngestStreamResult],
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def ingest_bus_stream(
+    request: Request,
+    api_key: str | None = Header(None, alias="X-Bus-Api-Key"),
+    admission: IngestAdmission = Depends(admit_ingest),
+    service: TelemetryService = Depends(get_service),
+    credential_cache: BusCredentialCache = Depends(get_credential_cache),
+    limiter: TokenBucketLimiter = Depends(get_rate_limiter),
+) -> ResponseModel[IngestStreamResult]:
+    if not api_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing API key")
+    if _content_type(request) not in NDJSON_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Expected newline-delimited JSON (application/x-ndjson)",
+        )
+
+    async def authorize(bus_id: str) -> None:
+        await _validate_bus_api_key([bus_id], api_key, credential_cache)
+
+    async def throttle(bus_id: str, points: int) -> None:
+        # A stream is already open, so slow it down (and let TCP push back) instead of failing midway.
+        while admission.saturation() is not None:
+            await asyncio.sleep(get_settings().ingest_retry_after_seconds)
+        wait = limiter.acquire(bus_id, points)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = limiter.acquire(bus_id, points)
+
+    lines = iter_ndjson_lines(request.stream(), get_settings().ingest_stream_max_line_bytes)
+    result = await service.ingest_bus_telemetry_stream(lines, authorize, throttle)
+    return ResponseModel(status=status.HTTP_202_ACCEPTED, message="Success", data=result)
+
+
+async def read_gateway_payload(request: Request) -> GatewayBatchIn:
+    body = await request.body()
+    started = time.perf_counter()
+    try:
+        return GatewayBatchIn.model_validate_json(body)
+    except ValidationError as exc:
+        raise _body_validation_error(exc) from exc
+    finally:
+        STAGE_VALIDATE.observe(time.perf_counter() - started)
+
+
+async def _authorize_gateway_buses(
+    payload: GatewayBatchIn, credential_cache: BusCredentialCache
+) -> dict[str, str]:
+    # Returns the rejection reason for every bus that failed authentication.
+    bus_ids = sorted({item.bus_id for item in payload.telemetry})
+    keys = {bus_id.strip(): api_key for bus_id, api_key in payload.api_keys.items()}
+
+    async def check(bus_id: str) -> str | None:
+        api_key = keys.get(bus_id)
+        if not api_key:
+            return "Missing API key"
+        if not await credential_cache.verify(bus_id, api_key):
+            return "Invalid API key"
+        return None
+
+    reasons = await asyncio.gather(*(check(bus_id) for bus_id in bus_ids))
+    return {bus_id: reason for bus_id, reason in zip(bus_ids, reasons) if reason is not None}
+
+
+@router.post(
+    "/gateway/batch",
+    response_model=ResponseModel[GatewayIngestResult],
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=_request_body_openapi(GatewayBatchIn, is_list=False, binary=False),
+)
+async def ingest_gateway_batch(
+    _admission: IngestAdmission = Depends(admit_ingest),
+    payload: GatewayBatchIn = Depends(read_gateway_payload),
+    service: TelemetryService = Depends(get_service),
+    credential_cache: BusCredentialCache = Depends(get_credential_cache),
+    limiter: TokenBucketLimiter = Depends(get_rate_limiter),
+) -> ResponseModel[GatewayIngestResult]:
+    if not payload.telemetry:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No bus telemetry provided")
+
+    rejected = await _authorize_gateway_buses(payload, credential_cache)
+    if len(rejected) == len({item.bus_id for item in payload.telemetry}):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid API key")
+
+    # Each bus behind the gateway spends its own tokens; a noisy one is dropped, not the whole batch.
+    points = Counter(item.bus_id for item in payload.telemetry if item.bus_id not in rejected)
+    waits = {bus_id: limiter.acquire(bus_id, count) for bus_id, count in points.items()}
+    limited = {bus_id: wait for bus_id, wait in waits.items() if wait > 0}
+    if len(limited) == len(points):
+        raise rate_limited(min(limited.values()))
+    rejected.update((bus_id, "Rate limited") for bus_id in limited)
+    accepted = [item for item in payload.telemetry if item.bus_id not in rejected]
+
+    outcome = await service.ingest_bus_telemetry_batch(accepted)
+
+    dropped = Counter(item.bus_id for item in payload.telemetry if item.bus_id in rejected)
+    result = GatewayIngestResult(
+        accepted=len(accepted) - outcome.duplicates,
+        rejected=len(payload.telemetry) - len(accepted),
+        duplicates=outcome.duplicates,
+        rejected_buses=[
+            RejectedBus(bus_id=bus_id, reason=reason, count=dropped[bus_id])
+            for bus_id, reason in rejected.items()
+        ],
+    )
+    return ResponseModel(status=status.HTTP_202_ACCEPTED, message="Success", data=result)
+
+
+@router.get("/spool/stats", response_model=ResponseModel[SpoolStats])
+async def get_spool_stats() -> ResponseModel[SpoolStats]:
+    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=get_write_spool().stats())
+
+
+@router.get("/dedup/stats", response_model=ResponseModel[DedupStats])
+async def get_dedup_stats() -> ResponseModel[DedupStats]:
+    return ResponseModel(status=status.HTTP_200_OK, message="Success", data=get_telemetry_deduplicator().stats())
@@ -0,0 +1,126 @@
+import os
+import time
+from typing import Union
+
+from prometheus_client import Counter, Histogram, disable_created_metrics
+
+# Hot paths observe pre-bound children; label lookups and anything that walks internal state
+# (dedup index, spool, pools) are left to scrape time.
+# The *_created series would roughly double every scrape for no use here.
+disable_created_metrics()
+
+# Set by serve.py when it starts several workers; prometheus_client then keeps values in per-process files.
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_STAGE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0
+)
+_BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time until an HTTP response starts (headers sent), by route template",
+    ("method", "route", "status"),
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "telemetry_stage_duration_seconds",
+    "Time spent in one stage of ingest or query handling",
+    ("stage",),
+    buckets=_STAGE_BUCKETS,
+)
+INFLUX_QUERY_SECONDS = Histogram(
+    "influx_query_duration_seconds",
+    "Flux query execution time on the query executor, excluding time queued for a slot",
+    ("query",),
+    buckets=_LATENCY_BUCKETS,
+)
+INFLUX_WRITE_BATCHES = Counter(
+    "influx_write_batches_total",
+    "Influx write batches by outcome; retry counts every retried attempt",
+    ("mode", "result"),
+)
+INFLUX_WRITE_BATCH_LINES = Histogram(
+    "influx_write_batch_lines",
+    "Points per Influx write batch",
+    ("mode",),
+    buckets=_BATCH_BUCKETS,
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a Postgres connection from the pool",
+    buckets=_STAGE_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "In-process cache lookups by result",
+    ("cache", "result"),
+)
+
+STAGE_API_KEY = STAGE_SECONDS.labels("api_key")
+STAGE_VALIDATE = STAGE_SECONDS.labels("validate")
+STAGE_NORMALIZE = STAGE_SECONDS.labels("normalize")
+STAGE_DEDUP = STAGE_SECONDS.labels("dedup")
+STAGE_ENCODE = STAGE_SECONDS.labels("encode")
+STAGE_INFLUX_WRITE = STAGE_SECONDS.labels("influx_write")
+STAGE_INGEST_LOG_APPEND = STAGE_SECONDS.labels("ingest_log_append")
+STAGE_LATEST_STATE_FLUSH = STAGE_SECONDS.labels("latest_state_flush")
+
+CREDENTIALS_HIT = CACHE_LOOKUPS.labels("bus_credentials", "hit")
+CREDENTIALS_MISS = CACHE_LOOKUPS.labels("bus_credentials", "miss")
+LATEST_STATE_HIT = CACHE_LOOKUPS.labels("latest_state", "hit")
+LATEST_STATE_DB = CACHE_LOOKUPS.labels("latest_state", "db")
+LATEST_STATE_MISS = CACHE_LOOKUPS.labels("latest_state", "miss")
+ROLLING_AGGREGATES_HIT = CACHE_LOOKUPS.labels("rolling_aggregates", "hit")
+ROLLING_AGGREGATES_MISS = CACHE_LOOKUPS.labels("rolling_aggregates", "miss")
+
+_WRITE_OUTCOMES = {
+    (mode, result): INFLUX_WRITE_BATCHES.labels(mode, result)
+    for mode in ("batching", "sync")
+    for result in ("success", "failure", "retry")
+}
+_WRITE_LINES = {mode: INFLUX_WRITE_BATCH_LINES.labels(mode) for mode in ("batching", "sync")}
+
+
+def observe_influx_write(mode: str, result: str, data: Union[bytes, str]) -> None:
+    _WRITE_OUTCOMES[mode, result].inc()
+    if result != "retry":
+        newline = b"\n" if isinstance(data, bytes) else "\n"
+        _WRITE_LINES[mode].observe(data.count(newline) + 1)
+
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware: no extra task per request and streaming bodies pass straight through.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status_code: int) -> None:
+            nonlocal observed
+            observed = True
+            # The router leaves the matched route in the scope; the template keeps label cardinality bounded.
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - started)
+
+        async def send_wrapper(message):
+            # Timed to the response head: SSE and streamed history bodies last as long as the client reads,
+            # which is not handler latency.
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not observed:
+                observe(500)
@@ -1,14 +1,58 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
+from typing import Iterator, Optional
 from influxdb_client.client.influxdb_client import InfluxDBClient
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
-from influxdb_client.client.write_api import WriteOptions
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from influxdb_client.client.write_api import SYNCHRONOUS, WriteOptions
 
 from core.config import get_settings
+from core.metrics import DB_POOL_WAIT_SECONDS, observe_influx_write
+from repos.ingest_log import PartitionedLog
+from repos.write_spool import WriteSpool, claim_orphan_spool_directories, claim_spool_directory
+
+
+# Serializes schema set-up when several workers start at once; released when the set-up transaction ends.
+SCHEMA_LOCK_SQL = "SELECT pg_advisory_xact_lock(hashtext('telemetry-schema'))"
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # Records how long a checkout waits for a free connection (including connecting a new one).
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started)
+
 
 @lru_cache()
 def get_engine() -> AsyncEngine:
+    # The pool is per process, so Postgres sees up to workers x (size + overflow) connections.
+    # Pre-ping spends a round trip per checkout so a connection Postgres or a proxy dropped is replaced instead
+    # of failing a request; recycling keeps connections from outliving server and proxy idle limits.
+    # Each connection keeps an LRU of prepared statements keyed by SQL text; 0 is needed behind pgbouncer.
     settings = get_settings()
-    return create_async_engine(settings.database_url, echo=False, pool_pre_ping=True)
+    return create_async_engine(
+        settings.database_url,
+        echo=False,
+        poolclass=TimedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={"prepared_statement_cache_size": settings.db_prepared_statement_cache_size},
+    )
+
+
+def get_asyncpg_dsn() -> str:
+    # For connections that live outside the pool, such as LISTEN.
+    url = make_url(get_settings().database_url).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
 
 
 @lru_cache()
@@ -25,6 +69,46 @@ def get_influx_client() -> InfluxDBClient:
         url=str(settings.influx_url),
         token=settings.influx_token,
         org=settings.influx_org,
+        timeout=int(settings.influx_query_timeout * 1000),
+    )
+
+
+@lru_cache()
+def get_write_spool() -> WriteSpool:
+    settings = get_settings()
+    directory, lock_fd = claim_spool_directory(settings.influx_spool_dir)
+    return _open_write_spool(directory, lock_fd)
+
+
+def claim_orphan_write_spools() -> Iterator[WriteSpool]:
+    # Backlogs left in slots no running worker claims; the caller replays and closes each one.
+    for directory, lock_fd in claim_orphan_spool_directories(get_settings().influx_spool_dir):
+        yield _open_write_spool(directory, lock_fd)
+
+
+def _open_write_spool(directory: str, lock_fd: int) -> WriteSpool:
+    settings = get_settings()
+    return WriteSpool(
+        directory=directory,
+        segment_bytes=settings.influx_spool_segment_bytes,
+        max_pending_lines=settings.influx_write_max_pending_lines,
+        max_record_lines=settings.influx_write_chunk_size,
+        fsync=settings.influx_spool_fsync,
+        lock_fd=lock_fd,
+    )
+
+
+@lru_cache()
+def get_ingest_log() -> Optional[PartitionedLog]:
+    # None keeps ingest inline; with partitions configured the stream processors own storage writes.
+    settings = get_settings()
+    if settings.ingest_log_partitions <= 0:
+        return None
+    return PartitionedLog(
+        directory=settings.ingest_log_dir,
+        partitions=settings.ingest_log_partitions,
+        segment_bytes=settings.ingest_log_segment_bytes,
+        fsync=settings.ingest_log_fsync,
     )
 
 
@@ -38,11 +122,59 @@ def get_influx_write_api():
             flush_interval=1000,
             retry_interval=5000,
             max_retries=3,
-        )
+        ),
+        success_callback=_on_write_success,
+        error_callback=_on_write_error,
+        retry_callback=_on_write_retry,
     )
 
 
+def _on_write_success(conf, data) -> None:
+    observe_influx_write("batching", "success", data)
+    get_write_spool().on_write_success(conf, data)
+
+
+def _on_write_error(conf, data, exception) -> None:
+    observe_influx_write("batching", "failure", data)
+    if is_rejected_write(exception):
+        get_write_spool().on_write_rejected(conf, data, exception)
+    else:
+        get_write_spool().on_write_error(conf, data, exception)
+
+
+def is_rejected_write(exception: BaseException) -> bool:
+    # A 4xx refuses the batch itself (unparsable point, outside retention). 429 is back-pressure, and
+    # 401/403/404 mean a wrong token or bucket: those batches succeed once the setup is fixed, so they spool.
+    status = getattr(exception, "status", None)
+    if status is None:
+        status = getattr(getattr(exception, "response", None), "status", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (401, 403, 404, 429)
+
+
+def _on_write_retry(conf, data, exception) -> None:
+    observe_influx_write("batching", "retry", data)
+
+
+@lru_cache()
+def get_influx_sync_write_api():
+    # Blocking writes for callers that must know a batch landed: the spool replayer and stream processors.
+    return get_influx_client().write_api(write_options=SYNCHRONOUS)
+
+
 @lru_cache()
 def get_influx_query_api():
     client = get_influx_client()
     return client.query_api()
+
+
+@lru_cache()
+def get_influx_query_executor() -> ThreadPoolExecutor:
+    settings = get_settings()
+    return ThreadPoolExecutor(max_workers=settings.influx_query_workers, thread_name_prefix="influx-query")
+
+
+@lru_cache()
+def get_influx_query_limiter() -> asyncio.Semaphore:
+    settings = get_settings()
+    return asyncio.Semaphore(settings.influx_query_workers)
+
@@ -1,18 +1,43 @@
 import asyncio
+import contextlib
 import logging
+import os
 
 from fastapi import FastAPI
 from fastapi.concurrency import asynccontextmanager
+from prometheus_client import multiprocess
 
-from controllers import bus_controller, telemetry_controller
-from core.config import get_settings
-from db.session import get_influx_client, get_influx_write_api, get_session_factory
+from controllers import bus_controller, live_controller, metrics_controller, telemetry_controller
+from core.config import get_settings, worker_count
+from core.metrics import MULTIPROCESS, MetricsMiddleware
+from db.session import (
+    get_asyncpg_dsn,
+    get_influx_client,
+    get_influx_query_executor,
+    get_influx_write_api,
+    get_ingest_log,
+    get_session_factory,
+    get_write_spool,
+)
+from repos.influx_repository import AsyncTelemetryRepository
 from repos.bus_repository import BusRepository
+from repos.influx_rollups import ensure_rollups, get_rollup_registry
+from repos.latest_state_repository import LatestStateRepository
 from schemas.response import ResponseModel
+from services.bus_credential_cache import get_bus_credential_cache
+from services.latest_state_store import get_latest_state_store
+from services.live_fanout import get_live_fanout
+from services.pipeline_metrics import get_pipeline_publisher
 
 settings = get_settings()
 
 
+async def _cancel(task: asyncio.Task) -> None:
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger = logging.getLogger(__name__)
@@ -24,6 +49,7 @@ async def lifespan(app: FastAPI):
                 repo = BusRepository(session)
                 await repo.init_table()
                 await repo.seed_default_async()
+                await LatestStateRepository(session).init_table()
             break
         except Exception as exc:
             attempts += 1
@@ -33,21 +59,78 @@ async def lifespan(app: FastAPI):
     else:
         logger.error("DB init failed after retries; app may not serve bus endpoints")
 
-    get_influx_client()
-    get_influx_write_api()
+    latest_state = get_latest_state_store()
+    try:
+        await latest_state.warm_from_db()
+    except Exception as exc:
+        logger.warning("Latest state warm-up failed (%s); serving from Influx until ingest fills it", exc)
+    flusher = asyncio.create_task(latest_state.run_flusher(settings.latest_state_flush_interval))
+
+    client = get_influx_client()
+    write_api = get_influx_write_api()
+    replayer = asyncio.create_task(
+        AsyncTelemetryRepository().run_spool_replayer(settings.influx_spool_replay_interval)
+    )
+
+    listener = None
+    if settings.bus_credential_listen:
+        listener = asyncio.create_task(
+            get_bus_credential_cache().run_invalidation_listener(
+                get_asyncpg_dsn(), settings.bus_credential_listen_interval
+            )
+        )
+    fanout = None
+    if worker_count(settings) > 1:
+        fanout = asyncio.create_task(get_live_fanout().run(get_asyncpg_dsn()))
+    publisher = None
+    if MULTIPROCESS:
+        publisher = asyncio.create_task(get_pipeline_publisher().run(settings.metrics_publish_interval))
+
+    if settings.influx_rollups_enabled:
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                get_influx_query_executor(), ensure_rollups, client, get_rollup_registry()
+            )
+        except Exception as exc:
+            logger.warning("Rollup setup failed (%s); long queries will read raw telemetry", exc)
 
     yield
 
-    write_api = get_influx_write_api()
-    client = get_influx_client()
-    write_api.flush()
+    # Each worker runs this on its own shutdown: its latest state, batching queue and spool are its own.
+    if listener is not None:
+        await _cancel(listener)
+    if fanout is not None:
+        await _cancel(fanout)
+    await _cancel(flusher)
+    try:
+        await latest_state.flush()
+    except Exception as exc:
+        logger.warning("Final latest state flush failed (%s)", exc)
+
+    await _cancel(replayer)
+    # close() drains the batching queue; whatever still fails lands in the spool for the next start.
+    await asyncio.get_running_loop().run_in_executor(None, write_api.close)
+    get_write_spool().close()
+    ingest_log = get_ingest_log()
+    if ingest_log is not None:
+        ingest_log.close()
+    get_influx_query_executor().shutdown(wait=False, cancel_futures=True)
     client.close()
 
+    if publisher is not None:
+        await _cancel(publisher)
+        # Final counters stay in this worker's files; its live gauges go with it.
+        get_pipeline_publisher().publish()
+        multiprocess.mark_process_dead(os.getpid())
+
 
 app = FastAPI(title=settings.app_name, lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(telemetry_controller.router)
 app.include_router(bus_controller.router)
+app.include_router(live_controller.router)
+app.include_router(metrics_controller.router)
 
 
 @app.get("/", response_model=ResponseModel[None])
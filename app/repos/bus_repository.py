@@ -1,8 +1,10 @@
-from typing import List, Optional
-from uuid import UUID, uuid4
+from functools import lru_cache
+from typing import Dict, List, Optional
+from uuid import UUID
 
-from schemas.bus import Bus
-from sqlalchemy import text
+from db.session import SCHEMA_LOCK_SQL
+from schemas.bus import Bus, BusSummary
+from sqlalchemy import TextClause, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -17,30 +19,121 @@ CREATE TABLE IF NOT EXISTS buses (
 );
 """
 
+# Each listing filter walks its own index in bus_id order, which is also the keyset pagination order.
+# text_pattern_ops lets plate_number prefix (LIKE 'x%') searches use the index under any collation.
+# Plain CREATE INDEX blocks writes while it builds, which is fine at startup for a registry of this size.
+BUS_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS buses_route_name_idx ON buses (route_name, bus_id)",
+    "CREATE INDEX IF NOT EXISTS buses_driver_name_idx ON buses (driver_name, bus_id)",
+    "CREATE INDEX IF NOT EXISTS buses_plate_number_idx ON buses (plate_number text_pattern_ops)",
+]
+
+# Carries the bus_id of every changed bus to API workers caching its credentials.
+BUS_CHANGES_CHANNEL = "bus_changes"
+
 DEFAULT_BUS_KEYS: dict[str, UUID] = {
     "bus-1": UUID("7b0c3c0f-2f0a-4f93-9f3e-5c7e0c123001"),
     "bus-2": UUID("8e9a7b2d-1a23-4c45-8f17-03fa5a5f5b02"),
     "bus-3": UUID("0a815d8a-7cb2-4fba-8e44-9c3d5adcf603"),
 }
 
+_SELECT_BUS_IDS = text("SELECT bus_id FROM buses ORDER BY bus_id")
+_SELECT_ROUTE_BUS_IDS = text("SELECT bus_id FROM buses WHERE route_name = :route_name ORDER BY bus_id")
+_SELECT_BUS = text("SELECT bus_id, plate_number, driver_name, route_name, api_key FROM buses WHERE bus_id = :bus_id")
+_UPSERT_BUS = text(
+    """
+    INSERT INTO buses (bus_id, plate_number, driver_name, route_name, api_key)
+    VALUES (:bus_id, :plate_number, :driver_name, :route_name, :api_key)
+    ON CONFLICT (bus_id) DO UPDATE SET
+        plate_number = EXCLUDED.plate_number,
+        driver_name = EXCLUDED.driver_name,
+        route_name = EXCLUDED.route_name,
+        api_key = EXCLUDED.api_key
+    """
+)
+_NOTIFY_BUS_CHANGE = text("SELECT pg_notify(:channel, :bus_id)")
+
+# Whole fleets go in as one array per column. Rows whose values already match are left alone (no dead tuple,
+# no notification); RETURNING therefore lists exactly the rows written, xmax = 0 marking the new ones.
+_BULK_ROWS = """
+    INSERT INTO buses (bus_id, plate_number, driver_name, route_name, api_key)
+    SELECT * FROM unnest(
+        CAST(:bus_id AS text[]),
+        CAST(:plate_number AS text[]),
+        CAST(:driver_name AS text[]),
+        CAST(:route_name AS text[]),
+        CAST(:api_key AS text[])
+    )
+"""
+_BULK_UPSERT_BUSES = text(
+    _BULK_ROWS
+    + """
+    ON CONFLICT (bus_id) DO UPDATE SET
+        plate_number = EXCLUDED.plate_number,
+        driver_name = EXCLUDED.driver_name,
+        route_name = EXCLUDED.route_name,
+        api_key = EXCLUDED.api_key
+    WHERE (buses.plate_number, buses.driver_name, buses.route_name, buses.api_key)
+        IS DISTINCT FROM (EXCLUDED.plate_number, EXCLUDED.driver_name, EXCLUDED.route_name, EXCLUDED.api_key)
+    RETURNING bus_id, xmax = 0 AS created
+    """
+)
+_BULK_INSERT_BUSES_IF_MISSING = text(_BULK_ROWS + " ON CONFLICT (bus_id) DO NOTHING RETURNING bus_id, true AS created")
+_BULK_NOTIFY_BUS_CHANGES = text("SELECT pg_notify(:channel, bus_id) FROM unnest(CAST(:bus_ids AS text[])) AS bus_id")
+# Rows from before api_key existed get their seeded key, or a random one.
+_BACKFILL_API_KEYS = text(
+    """
+    UPDATE buses SET api_key = COALESCE(
+        (
+            SELECT defaults.api_key
+            FROM unnest(CAST(:bus_ids AS text[]), CAST(:api_keys AS text[])) AS defaults(bus_id, api_key)
+            WHERE defaults.bus_id = buses.bus_id
+        ),
+        gen_random_uuid()::text
+    )
+    WHERE api_key IS NULL OR api_key = ''
+    """
+)
+BULK_CHUNK_ROWS = 5000
+
+
+@lru_cache(maxsize=None)
+def _bus_page_statement(after: bool, route_name: bool, plate_prefix: bool, driver_name: bool) -> TextClause:
+    # One fixed statement per combination of filters rather than "(:x IS NULL OR ...)", so each one stays
+    # prepared and is planned against the index it can use. api_key never leaves the table here.
+    conditions = []
+    if after:
+        conditions.append("bus_id > :after")
+    if route_name:
+        conditions.append("route_name = :route_name")
+    if plate_prefix:
+        conditions.append("plate_number LIKE :plate_pattern")
+    if driver_name:
+        conditions.append("driver_name = :driver_name")
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return text(f"SELECT bus_id, plate_number, driver_name, route_name FROM buses{where} ORDER BY bus_id LIMIT :limit")
+
+
+def _like_prefix(prefix: str) -> str:
+    escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
 class BusRepository:
     def __init__(self, session: AsyncSession):
         self._session = session
 
     async def init_table(self) -> None:
+        await self._session.execute(text(SCHEMA_LOCK_SQL))
         await self._session.execute(text(BUS_TABLE_SQL))
         await self._session.execute(text("ALTER TABLE buses ADD COLUMN IF NOT EXISTS api_key TEXT"))
-        # Ensure any pre-existing rows have an API key
-        result = await self._session.execute(text("SELECT bus_id, api_key FROM buses"))
-        for row in result.mappings().all():
-            if row.get("api_key"):
-                continue
-            default_key = DEFAULT_BUS_KEYS.get(row["bus_id"], uuid4())
-            await self._session.execute(
-                text("UPDATE buses SET api_key = :api_key WHERE bus_id = :bus_id"),
-                {"api_key": str(default_key), "bus_id": row["bus_id"]},
-            )
+        await self._session.execute(
+            _BACKFILL_API_KEYS,
+            {"bus_ids": list(DEFAULT_BUS_KEYS), "api_keys": [str(key) for key in DEFAULT_BUS_KEYS.values()]},
+        )
         await self._session.execute(text("ALTER TABLE buses ALTER COLUMN api_key SET NOT NULL"))
+        for statement in BUS_INDEX_SQL:
+            await self._session.execute(text(statement))
         await self._session.commit()
 
     async def seed_default_async(self) -> None:
@@ -67,56 +160,73 @@ class BusRepository:
                 api_key=DEFAULT_BUS_KEYS["bus-3"],
             ),
         ]
-        for bus in defaults:
-            await self.insert_if_missing(bus)
+        await self.bulk_upsert_async(defaults, overwrite=False)
+
+    async def get_ids_async(self, route_name: Optional[str] = None) -> List[str]:
+        if route_name is None:
+            result = await self._session.execute(_SELECT_BUS_IDS)
+        else:
+            result = await self._session.execute(_SELECT_ROUTE_BUS_IDS, {"route_name": route_name})
+        return [row["bus_id"] for row in result.mappings().all()]
 
-    async def get_all_async(self) -> List[Bus]:
+    async def get_page_async(
+        self,
+        limit: int,
+        after: Optional[str] = None,
+        route_name: Optional[str] = None,
+        plate_prefix: Optional[str] = None,
+        driver_name: Optional[str] = None,
+    ) -> List[BusSummary]:
+        statement = _bus_page_statement(
+            after is not None, route_name is not None, plate_prefix is not None, driver_name is not None
+        )
+        params = {
+            "limit": limit,
+            "after": after,
+            "route_name": route_name,
+            "plate_pattern": _like_prefix(plate_prefix) if plate_prefix is not None else None,
+            "driver_name": driver_name,
+        }
         result = await self._session.execute(
-            text("SELECT bus_id, plate_number, driver_name, route_name, api_key FROM buses")
+            statement, {key: value for key, value in params.items() if value is not None}
         )
-        rows = result.mappings().all()
-        return [Bus(**row) for row in rows]
+        return [BusSummary(**row) for row in result.mappings().all()]
 
     async def get_by_id_async(self, bus_id: str) -> Optional[Bus]:
-        result = await self._session.execute(
-            text("SELECT bus_id, plate_number, driver_name, route_name, api_key FROM buses WHERE bus_id = :bus_id"),
-            {"bus_id": bus_id},
-        )
+        result = await self._session.execute(_SELECT_BUS, {"bus_id": bus_id})
         row = result.mappings().first()
         return Bus(**row) if row else None
 
     async def upsert_async(self, bus: Bus) -> Bus:
         payload = bus.model_dump()
         payload["api_key"] = str(payload["api_key"])
-        await self._session.execute(
-            text(
-                """
-                INSERT INTO buses (bus_id, plate_number, driver_name, route_name, api_key)
-                VALUES (:bus_id, :plate_number, :driver_name, :route_name, :api_key)
-                ON CONFLICT (bus_id) DO UPDATE SET
-                    plate_number = EXCLUDED.plate_number,
-                    driver_name = EXCLUDED.driver_name,
-                    route_name = EXCLUDED.route_name,
-                    api_key = EXCLUDED.api_key
-                """
-            ),
-            payload,
-        )
+        await self._session.execute(_UPSERT_BUS, payload)
+        # Delivered on commit, so no worker re-reads the old key.
+        await self._session.execute(_NOTIFY_BUS_CHANGE, {"channel": BUS_CHANGES_CHANNEL, "bus_id": bus.bus_id})
         await self._session.commit()
         return bus
 
-    async def insert_if_missing(self, bus: Bus) -> Bus:
-        payload = bus.model_dump()
-        payload["api_key"] = str(payload["api_key"])
-        await self._session.execute(
-            text(
-                """
-                INSERT INTO buses (bus_id, plate_number, driver_name, route_name, api_key)
-                VALUES (:bus_id, :plate_number, :driver_name, :route_name, :api_key)
-                ON CONFLICT (bus_id) DO NOTHING
-                """
-            ),
-            payload,
-        )
+    async def bulk_upsert_async(self, buses: List[Bus], overwrite: bool = True) -> Dict[str, bool]:
+        # One transaction for the whole list; bus_ids must be unique within it. Returns bus_id -> created for
+        # the rows written: the others already existed and were identical, or were kept as they were.
+        statement = _BULK_UPSERT_BUSES if overwrite else _BULK_INSERT_BUSES_IF_MISSING
+        written: Dict[str, bool] = {}
+        for start in range(0, len(buses), BULK_CHUNK_ROWS):
+            chunk = buses[start:start + BULK_CHUNK_ROWS]
+            result = await self._session.execute(
+                statement,
+                {
+                    "bus_id": [bus.bus_id for bus in chunk],
+                    "plate_number": [bus.plate_number for bus in chunk],
+                    "driver_name": [bus.driver_name for bus in chunk],
+                    "route_name": [bus.route_name for bus in chunk],
+                    "api_key": [str(bus.api_key) for bus in chunk],
+                },
+            )
+            written.update((row["bus_id"], row["created"]) for row in result.mappings().all())
+        if written:
+            await self._session.execute(
+                _BULK_NOTIFY_BUS_CHANGES, {"channel": BUS_CHANGES_CHANNEL, "bus_ids": list(written)}
+            )
         await self._session.commit()
-        return bus
+        return written
@@ -1,19 +1,70 @@
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
-
-from influxdb_client.client.write.point import Point
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, TypeVar
 
 from core.config import get_settings
-from db.session import get_influx_query_api, get_influx_query_api, get_influx_write_api
+from core.metrics import INFLUX_QUERY_SECONDS, STAGE_ENCODE, STAGE_INFLUX_WRITE, observe_influx_write
+from db.session import (
+    claim_orphan_write_spools,
+    get_influx_client,
+    get_influx_query_api,
+    get_influx_query_executor,
+    get_influx_query_limiter,
+    get_influx_sync_write_api,
+    get_influx_write_api,
+    get_write_spool,
+    is_rejected_write,
+)
+from repos.line_protocol import get_line_protocol_encoder
+from repos.write_spool import RejectedBatch
 from schemas.telemetry import BusTelemetry
+from schemas.telemetry_formats import TelemetryRow
 
 from influxdb_client.client.write_api import WriteOptions
+from influxdb_client.domain.dialect import Dialect
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+_STREAM_END = object()
+
+# Header row only, no annotations: the cheapest CSV Influx can send.
+_ROW_DIALECT = Dialect(header=True, delimiter=",", annotations=[], date_time_format="RFC3339Nano")
+_ROW_COLUMNS = ["bus_id", "_time", "latitude", "longitude", "temperature_c", "smoke_detected"]
+
+ROLLUP_TOTAL_FIELDS = ["count", "temperature_sum", "temperature_min", "temperature_max", "smoke_events"]
+
+
+def _record_to_telemetry(rec) -> BusTelemetry:
+    return BusTelemetry(
+        bus_id=rec.values["bus_id"],
+        latitude=float(rec.values["latitude"]),
+        longitude=float(rec.values["longitude"]),
+        temperature_c=float(rec.values["temperature_c"]),
+        smoke_detected=bool(rec.values.get("smoke_detected", 0)),
+        timestamp=rec.get_time(),
+    )
+
+
+def _timed_query(fn: Callable[..., R], *args: Any) -> R:
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        INFLUX_QUERY_SECONDS.labels(fn.__name__).observe(time.perf_counter() - started)
+
 
 class TelemetryRepository:
     def __init__(self):
         self.settings = get_settings()
         self._bucket = self.settings.influx_bucket
-        self._write_api = get_influx_write_api()
         self._query_api = get_influx_query_api()
 
     def write_bus_telemetry(self, telemetry: BusTelemetry) -> None:
@@ -23,23 +74,55 @@ class TelemetryRepository:
         if not telemetries:
             return
 
-        points: List[Point] = []
-
-        for t in telemetries:
-            points.append(
-                Point("bus_telemetry")
-                .tag("bus_id", t.bus_id)
-                .field("latitude", t.latitude)
-                .field("longitude", t.longitude)
-                .field("temperature_c", t.temperature_c)
-                .field("smoke_detected", int(t.smoke_detected))
-                .time(t.timestamp or datetime.utcnow())
+        encoder = get_line_protocol_encoder()
+        write_api = get_influx_write_api()
+        spool = get_write_spool()
+        started = time.perf_counter()
+        chunks = list(encoder.encode_chunks(telemetries, self.settings.influx_write_chunk_size))
+        STAGE_ENCODE.observe(time.perf_counter() - started)
+        for chunk in chunks:
+            # Spool instead of queueing while a backlog is draining or the batching queue is full.
+            if not spool.admit(chunk):
+                spool.append(chunk)
+                continue
+            write_api.write(
+                bucket=self.settings.influx_bucket,
+                record=chunk,
             )
 
-        self._write_api.write(
-            bucket=self.settings.influx_bucket,
-            record=points,
-        )
+    def write_bus_telemetry_batch_sync(self, telemetries: List[BusTelemetry]) -> None:
+        # Returns only once Influx has accepted every chunk; raises instead of spooling.
+        encoder = get_line_protocol_encoder()
+        for chunk in encoder.encode_chunks(telemetries, self.settings.influx_write_chunk_size):
+            self._write_sync(chunk)
+
+    def replay_spool(self) -> int:
+        spool = get_write_spool()
+        replayed = 0
+        if spool.has_backlog():
+            if not get_influx_client().ping():
+                return 0
+            replayed = spool.replay(self._write_sync)
+        # Then whatever workers from a larger previous run left behind; the slot lock keeps two workers off one.
+        for orphan in claim_orphan_write_spools():
+            try:
+                if orphan.has_backlog() and get_influx_client().ping():
+                    replayed += orphan.replay(self._write_sync)
+            finally:
+                orphan.close()
+        return replayed
+
+    def _write_sync(self, payload: bytes) -> None:
+        started = time.perf_counter()
+        try:
+            get_influx_sync_write_api().write(bucket=self.settings.influx_bucket, record=payload)
+        except Exception as exc:
+            observe_influx_write("sync", "failure", payload)
+            if is_rejected_write(exc):
+                raise RejectedBatch(str(exc)) from exc
+            raise
+        STAGE_INFLUX_WRITE.observe(time.perf_counter() - started)
+        observe_influx_write("sync", "success", payload)
 
     def get_latest_bus_telemetry(self, bus_id: str) -> Optional[BusTelemetry]:
         flux = f"""
@@ -60,18 +143,33 @@ class TelemetryRepository:
             if not table.records:
                 continue
 
-            rec = table.records[0]
-            return BusTelemetry(
-                bus_id=rec.values["bus_id"],
-                latitude=float(rec.values["latitude"]),
-                longitude=float(rec.values["longitude"]),
-                temperature_c=float(rec.values["temperature_c"]),
-                smoke_detected=bool(rec.values.get("smoke_detected", 0)),
-                timestamp=rec.get_time(),
-            )
+            return _record_to_telemetry(table.records[0])
 
         return None
 
+    def get_latest_fleet_telemetry(self, bus_ids: List[str]) -> List[BusTelemetry]:
+        if not bus_ids:
+            return []
+        flux = f"""
+        from(bucket: "{self.settings.influx_bucket}")
+          |> range(start: -7d)
+          |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+          |> filter(fn: (r) => contains(value: r["bus_id"], set: {json.dumps(sorted(bus_ids))}))
+          |> last()
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        """
+
+        tables = self._query_api.query(flux)
+        latest: Dict[str, BusTelemetry] = {}
+        for table in tables:
+            for rec in table.records:
+                telemetry = _record_to_telemetry(rec)
+                current = latest.get(telemetry.bus_id)
+                if current is None or current.timestamp < telemetry.timestamp:
+                    latest[telemetry.bus_id] = telemetry
+
+        return list(latest.values())
+
     def get_bus_telemetry_history(
         self,
         bus_id: str,
@@ -94,60 +192,343 @@ class TelemetryRepository:
 
         for table in tables:
             for rec in table.records:
-                results.append(
-                    BusTelemetry(
-                        bus_id=rec.values["bus_id"],
-                        latitude=float(rec.values["latitude"]),
-                        longitude=float(rec.values["longitude"]),
-                        temperature_c=float(rec.values["temperature_c"]),
-                        smoke_detected=bool(rec.values.get("smoke_detected", 0)),
-                        timestamp=rec.get_time(),
-                    )
-                )
+                results.append(_record_to_telemetry(rec))
 
         return results
 
-    def get_bus_telemetry_aggregates(
-        self, bus_id: str, window: str
-    ) -> Optional[Dict[str, float]]:
+    def get_bus_telemetry_downsampled(
+        self,
+        bus_id: str,
+        start: datetime,
+        end: datetime,
+        every: str,
+        limit: int,
+        bucket: Optional[str] = None,
+    ) -> List[BusTelemetry]:
+        # Positions keep the last fix per window, temperature is averaged and smoke uses max()
+        # so any window that saw smoke still reports it. Rollup buckets share the raw field names.
         flux = f"""
-        base = from(bucket: "{self.settings.influx_bucket}")
-          |> range(start: -{window})
+        base = from(bucket: "{bucket or self.settings.influx_bucket}")
+          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
           |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
           |> filter(fn: (r) => r["bus_id"] == "{bus_id}")
 
-        mean = base
-          |> filter(fn: (r) => r["_field"] == "temperature_c")
-          |> mean()
-          |> set(key: "metric", value: "temperature_avg")
+        position = base
+          |> filter(fn: (r) => r["_field"] == "latitude" or r["_field"] == "longitude")
+          |> aggregateWindow(every: {every}, fn: last, createEmpty: false, timeSrc: "_start")
 
-        min = base
+        temperature = base
           |> filter(fn: (r) => r["_field"] == "temperature_c")
-          |> min()
-          |> set(key: "metric", value: "temperature_min")
+          |> aggregateWindow(every: {every}, fn: mean, createEmpty: false, timeSrc: "_start")
 
-        max = base
-          |> filter(fn: (r) => r["_field"] == "temperature_c")
-          |> max()
-          |> set(key: "metric", value: "temperature_max")
+        smoke = base
+          |> filter(fn: (r) => r["_field"] == "smoke_detected")
+          |> aggregateWindow(every: {every}, fn: max, createEmpty: false, timeSrc: "_start")
 
-        count = base
-          |> filter(fn: (r) => r["_field"] == "temperature_c")
-          |> count()
-          |> toFloat()
-          |> set(key: "metric", value: "count")
+        union(tables: [position, temperature, smoke])
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> sort(columns: ["_time"], desc: true)
+          |> limit(n: {limit})
+        """
+
+        tables = self._query_api.query(flux)
+        results: List[BusTelemetry] = []
+
+        for table in tables:
+            for rec in table.records:
+                results.append(_record_to_telemetry(rec))
+
+        return results
 
-        union(tables: [mean, min, max, count])
-          |> keep(columns: ["metric", "_value"])
+    def iter_bus_telemetry_history(self, bus_id: str, start: datetime, end: datetime) -> Iterator[BusTelemetry]:
+        # Oldest first and unsorted, so Influx can stream rows without buffering the range.
+        flux = f"""
+        from(bucket: "{self.settings.influx_bucket}")
+          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+          |> filter(fn: (r) => r["bus_id"] == "{bus_id}")
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+        """
+
+        for rec in self._query_api.query_stream(flux):
+            yield _record_to_telemetry(rec)
+
+    def get_bus_telemetry_history_rows(
+        self, bus_id: str, start: datetime, end: datetime, limit: int
+    ) -> List[TelemetryRow]:
+        flux = f"""
+        from(bucket: "{self.settings.influx_bucket}")
+          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+          |> filter(fn: (r) => r["bus_id"] == "{bus_id}")
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> keep(columns: {json.dumps(_ROW_COLUMNS)})
+          |> sort(columns: ["_time"], desc: true)
+          |> limit(n: {limit})
+        """
+        return list(self._query_rows(flux))
+
+    def iter_bus_telemetry_history_rows(self, bus_id: str, start: datetime, end: datetime) -> Iterator[TelemetryRow]:
+        flux = f"""
+        from(bucket: "{self.settings.influx_bucket}")
+          |> range(start: {start.isoformat()}, stop: {end.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+          |> filter(fn: (r) => r["bus_id"] == "{bus_id}")
+          |> pivot(rowKey: ["_time"], columnKey: ["_field"], valueColumn: "_value")
+          |> keep(columns: {json.dumps(_ROW_COLUMNS)})
+        """
+        return self._query_rows(flux)
+
+    def _query_rows(self, flux: str) -> Iterator[TelemetryRow]:
+        # Reads Influx's CSV response directly into string tuples; no FluxRecord or model per row.
+        # Every table starts with its own header line, and column order is not guaranteed.
+        # Tables are separated, and the response ended, by a blank line.
+        positions: Optional[List[int]] = None
+        for row in self._query_api.query_csv(flux, dialect=_ROW_DIALECT):
+            if not row:
+                continue
+            if "_time" in row and "result" in row:
+                positions = [row.index(column) for column in _ROW_COLUMNS]
+                continue
+            if positions is None:
+                continue
+            yield tuple(row[position] for position in positions)
+
+    def get_bus_telemetry_aggregates(
+        self, bus_id: str, start: datetime, stop: datetime
+    ) -> Optional[Dict[str, float]]:
+        # One pass per field: temperature yields count/sum/min/max, smoke_detected's sum is the smoke event count.
+        flux = f"""
+        from(bucket: "{self.settings.influx_bucket}")
+          |> range(start: {start.isoformat()}, stop: {stop.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+          |> filter(fn: (r) => r["bus_id"] == "{bus_id}")
+          |> filter(fn: (r) => r["_field"] == "temperature_c" or r["_field"] == "smoke_detected")
+          |> map(fn: (r) => ({{r with _value: float(v: r._value)}}))
+          |> reduce(
+              identity: {{count: 0.0, sum: 0.0, min: 1000000.0, max: -1000000.0}},
+              fn: (r, accumulator) => ({{
+                  count: accumulator.count + 1.0,
+                  sum: accumulator.sum + r._value,
+                  min: if r._value < accumulator.min then r._value else accumulator.min,
+                  max: if r._value > accumulator.max then r._value else accumulator.max
+              }})
+          )
+          |> keep(columns: ["_field", "count", "sum", "min", "max"])
         """
 
         tables = self._query_api.query(flux)
-        if not tables:
+        totals: Dict[str, float] = {}
+        for table in tables:
+            for rec in table.records:
+                count = float(rec.values["count"])
+                if rec.get_field() == "smoke_detected":
+                    totals["smoke_events"] = float(rec.values["sum"])
+                elif count > 0:
+                    totals["count"] = count
+                    totals["temperature_sum"] = float(rec.values["sum"])
+                    totals["temperature_min"] = float(rec.values["min"])
+                    totals["temperature_max"] = float(rec.values["max"])
+
+        if "count" not in totals:
             return None
+        return totals
 
-        metrics: Dict[str, float] = {}
+    def get_rollup_aggregates(
+        self, bus_id: str, bucket: str, start: datetime, stop: datetime
+    ) -> Optional[Dict[str, float]]:
+        flux = f"""
+        from(bucket: "{bucket}")
+          |> range(start: {start.isoformat()}, stop: {stop.isoformat()})
+          |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+          |> filter(fn: (r) => r["bus_id"] == "{bus_id}")
+          |> filter(fn: (r) => contains(value: r["_field"], set: {json.dumps(ROLLUP_TOTAL_FIELDS)}))
+          |> map(fn: (r) => ({{r with _value: float(v: r._value)}}))
+          |> reduce(
+              identity: {{sum: 0.0, min: 1000000.0, max: -1000000.0}},
+              fn: (r, accumulator) => ({{
+                  sum: accumulator.sum + r._value,
+                  min: if r._value < accumulator.min then r._value else accumulator.min,
+                  max: if r._value > accumulator.max then r._value else accumulator.max
+              }})
+          )
+          |> keep(columns: ["_field", "sum", "min", "max"])
+        """
+
+        tables = self._query_api.query(flux)
+        totals: Dict[str, float] = {}
         for table in tables:
             for rec in table.records:
-                metrics[str(rec.values["metric"])] = float(rec.get_value())
+                field = rec.get_field()
+                if field == "temperature_min":
+                    totals[field] = float(rec.values["min"])
+                elif field == "temperature_max":
+                    totals[field] = float(rec.values["max"])
+                else:
+                    totals[field] = float(rec.values["sum"])
+
+        if not totals.get("count"):
+            return None
+        return totals
+
+
+class AsyncTelemetryRepository:
+    def __init__(self, repository: Optional[TelemetryRepository] = None):
+        self._repository = repository or TelemetryRepository()
+        self._executor = get_influx_query_executor()
+        self._limiter = get_influx_query_limiter()
+        self._timeout = get_settings().influx_query_timeout
+
+    # The batching write API only enqueues points, so writes stay on the event loop.
+    async def write_bus_telemetry(self, telemetry: BusTelemetry) -> None:
+        self._repository.write_bus_telemetry(telemetry)
+
+    async def write_bus_telemetry_batch(self, telemetries: List[BusTelemetry]) -> None:
+        self._repository.write_bus_telemetry_batch(telemetries)
+
+    async def get_latest_bus_telemetry(self, bus_id: str) -> Optional[BusTelemetry]:
+        return await self._run(self._repository.get_latest_bus_telemetry, bus_id)
+
+    async def get_latest_fleet_telemetry(self, bus_ids: List[str]) -> List[BusTelemetry]:
+        return await self._run(self._repository.get_latest_fleet_telemetry, bus_ids)
+
+    async def get_bus_telemetry_history(
+        self,
+        bus_id: str,
+        start: datetime,
+        end: datetime,
+        limit: int,
+    ) -> List[BusTelemetry]:
+        return await self._run(self._repository.get_bus_telemetry_history, bus_id, start, end, limit)
+
+    async def get_bus_telemetry_downsampled(
+        self,
+        bus_id: str,
+        start: datetime,
+        end: datetime,
+        every: str,
+        limit: int,
+        bucket: Optional[str] = None,
+    ) -> List[BusTelemetry]:
+        return await self._run(
+            self._repository.get_bus_telemetry_downsampled, bus_id, start, end, every, limit, bucket
+        )
+
+    async def iter_bus_telemetry_history(
+        self, bus_id: str, start: datetime, end: datetime, batch_size: int
+    ) -> AsyncIterator[List[BusTelemetry]]:
+        rows = partial(self._repository.iter_bus_telemetry_history, bus_id, start, end)
+        async for batch in self._stream(rows, batch_size):
+            yield batch
+
+    async def get_bus_telemetry_history_rows(
+        self, bus_id: str, start: datetime, end: datetime, limit: int
+    ) -> List[TelemetryRow]:
+        return await self._run(self._repository.get_bus_telemetry_history_rows, bus_id, start, end, limit)
+
+    async def iter_bus_telemetry_history_rows(
+        self, bus_id: str, start: datetime, end: datetime, batch_size: int
+    ) -> AsyncIterator[List[TelemetryRow]]:
+        rows = partial(self._repository.iter_bus_telemetry_history_rows, bus_id, start, end)
+        async for batch in self._stream(rows, batch_size):
+            yield batch
+
+    async def get_bus_telemetry_aggregates(
+        self, bus_id: str, start: datetime, stop: datetime
+    ) -> Optional[Dict[str, float]]:
+        return await self._run(self._repository.get_bus_telemetry_aggregates, bus_id, start, stop)
+
+    async def get_rollup_aggregates(
+        self, bus_id: str, bucket: str, start: datetime, stop: datetime
+    ) -> Optional[Dict[str, float]]:
+        return await self._run(self._repository.get_rollup_aggregates, bus_id, bucket, start, stop)
+
+    async def run_spool_replayer(self, interval: float) -> None:
+        # Runs on the default executor so a long replay never holds a query slot.
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                replayed = await loop.run_in_executor(None, self._repository.replay_spool)
+            except Exception as exc:
+                logger.warning("Spool replay stopped (%s); will retry", exc)
+                continue
+            if replayed:
+                logger.info("Replayed %s spooled write batches", replayed)
+
+    async def _run(self, fn: Callable[..., R], *args: Any) -> R:
+        # Queue time behind the limiter counts towards the timeout as well.
+        return await asyncio.wait_for(self._run_limited(fn, *args), timeout=self._timeout)
+
+    async def _run_limited(self, fn: Callable[..., R], *args: Any) -> R:
+        async with self._limiter:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(_timed_query, fn, *args))
+
+    async def _stream(self, rows: Callable[[], Iterator[R]], batch_size: int) -> AsyncIterator[List[R]]:
+        # Drains a blocking row iterator on the query executor through a small bounded queue,
+        # so at most a few batches are held in memory however large the result is.
+        # The query slot belongs to the producer, not the response: it is freed once the rows are read, and
+        # INFLUX_QUERY_TIMEOUT bounds the wait for a slot, for Influx between batches and for a client that
+        # stops taking them (the producer then abandons the query).
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=get_settings().influx_stream_queue_batches)
+        stopped = threading.Event()
+        timeout = self._timeout
+
+        def put(item: Any) -> bool:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    future.result(timeout=0.5)
+                    return True
+                except concurrent.futures.TimeoutError:
+                    if stopped.is_set() or time.monotonic() >= deadline:
+                        future.cancel()
+                        return False
+
+        def produce() -> None:
+            iterator = rows()
+            batch: List[R] = []
+            try:
+                for row in iterator:
+                    if stopped.is_set():
+                        return
+                    batch.append(row)
+                    if len(batch) >= batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch and not put(batch):
+                    return
+                put(_STREAM_END)
+            except Exception as exc:
+                put(exc)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
 
-        return metrics or None
\ No newline at end of file
+        await asyncio.wait_for(self._limiter.acquire(), timeout=timeout)
+        try:
+            producer = loop.run_in_executor(self._executor, produce)
+        except BaseException:
+            self._limiter.release()
+            raise
+        producer.add_done_callback(lambda _: self._limiter.release())
+        try:
+            while True:
+                if producer.done() and queue.empty():
+                    raise TimeoutError("Stream client stopped reading; query abandoned")
+                item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.shield(producer)
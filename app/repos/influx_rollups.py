@@ -0,0 +1,228 @@
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional
+
+from influxdb_client.client.influxdb_client import InfluxDBClient
+from influxdb_client.rest import ApiException
+from influxdb_client.domain.bucket_retention_rules import BucketRetentionRules
+from influxdb_client.domain.task_create_request import TaskCreateRequest
+
+from core.config import Settings, get_settings
+
+logger = logging.getLogger(__name__)
+
+# Fields written to every rollup tier. latitude/longitude/temperature_c/smoke_detected keep the raw
+# field names so history queries parse rollup rows like raw rows.
+ROLLUP_TASK_FLUX = """
+import "date"
+
+option task = {{name: "{name}", every: {every}, offset: {offset}}}
+
+stop = date.truncate(t: now(), unit: {every})
+start = date.sub(d: {lookback}, from: stop)
+
+base = from(bucket: "{source}")
+  |> range(start: start, stop: stop)
+  |> filter(fn: (r) => r["_measurement"] == "bus_telemetry")
+
+position = base
+  |> filter(fn: (r) => r["_field"] == "latitude" or r["_field"] == "longitude")
+  |> aggregateWindow(every: {every}, fn: last, createEmpty: false, timeSrc: "_start")
+
+temperature = base |> filter(fn: (r) => r["_field"] == "temperature_c")
+smoke = base |> filter(fn: (r) => r["_field"] == "smoke_detected")
+
+temperature_mean = temperature
+  |> aggregateWindow(every: {every}, fn: mean, createEmpty: false, timeSrc: "_start")
+temperature_sum = temperature
+  |> aggregateWindow(every: {every}, fn: sum, createEmpty: false, timeSrc: "_start")
+  |> set(key: "_field", value: "temperature_sum")
+temperature_min = temperature
+  |> aggregateWindow(every: {every}, fn: min, createEmpty: false, timeSrc: "_start")
+  |> set(key: "_field", value: "temperature_min")
+temperature_max = temperature
+  |> aggregateWindow(every: {every}, fn: max, createEmpty: false, timeSrc: "_start")
+  |> set(key: "_field", value: "temperature_max")
+count = temperature
+  |> aggregateWindow(every: {every}, fn: count, createEmpty: false, timeSrc: "_start")
+  |> set(key: "_field", value: "count")
+smoke_max = smoke
+  |> aggregateWindow(every: {every}, fn: max, createEmpty: false, timeSrc: "_start")
+smoke_events = smoke
+  |> aggregateWindow(every: {every}, fn: sum, createEmpty: false, timeSrc: "_start")
+  |> set(key: "_field", value: "smoke_events")
+
+union(tables: [position, temperature_mean, temperature_sum, temperature_min, temperature_max, count, smoke_max, smoke_events])
+  |> to(bucket: "{target}", org: "{org}")
+"""
+
+
+class RollupTier(NamedTuple):
+    name: str
+    bucket: str
+    every: str
+    seconds: int
+    retention_days: int
+    offset: str
+
+
+def get_rollup_tiers(settings: Optional[Settings] = None) -> List[RollupTier]:
+    # Finest first.
+    settings = settings or get_settings()
+    return [
+        RollupTier(
+            name="bus_telemetry_rollup_1m",
+            bucket=settings.influx_rollup_1m_bucket,
+            every="1m",
+            seconds=60,
+            retention_days=settings.influx_rollup_1m_retention_days,
+            offset="10s",
+        ),
+        RollupTier(
+            name="bus_telemetry_rollup_1h",
+            bucket=settings.influx_rollup_1h_bucket,
+            every="1h",
+            seconds=3600,
+            retention_days=settings.influx_rollup_1h_retention_days,
+            offset="1m",
+        ),
+    ]
+
+
+class RollupRegistry:
+    # Remembers since when each tier has been maintained; a tier only serves ranges it fully covers.
+    def __init__(self):
+        self._available_since: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def mark_available(self, tier: RollupTier, since: datetime) -> None:
+        with self._lock:
+            self._available_since[tier.bucket] = since
+
+    def coarsest_for(self, start: datetime, granularity_seconds: float, now: datetime) -> Optional[RollupTier]:
+        with self._lock:
+            for tier in reversed(get_rollup_tiers()):
+                since = self._available_since.get(tier.bucket)
+                if since is None or tier.seconds > granularity_seconds:
+                    continue
+                oldest = since
+                if tier.retention_days > 0:
+                    oldest = max(since, now - timedelta(days=tier.retention_days))
+                # The first window after the task was created may be partial.
+                if start >= oldest + timedelta(seconds=tier.seconds):
+                    return tier
+        return None
+
+
+def rollup_lookback_seconds(tier: RollupTier, max_lateness: int) -> int:
+    # Every run re-aggregates the windows a point up to max_lateness late can still land in, plus a margin.
+    return (-(-max_lateness // tier.seconds) + 5) * tier.seconds
+
+
+def rollup_boundary(tier: RollupTier, now: datetime, max_lateness: Optional[int] = None) -> datetime:
+    # Windows ending before this instant are final: no allowed point can still arrive for them, and the run after
+    # the latest possible one (a period plus the offset, plus a minute of slack) has rewritten them.
+    if max_lateness is None:
+        max_lateness = get_settings().influx_rollup_max_lateness_seconds
+    settled = max_lateness + tier.seconds + _duration_seconds(tier.offset) + 60
+    return align_down(tier, now - timedelta(seconds=settled))
+
+
+def align_up(tier: RollupTier, moment: datetime) -> datetime:
+    epoch_seconds = -(-moment.timestamp() // tier.seconds) * tier.seconds
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc)
+
+
+def align_down(tier: RollupTier, moment: datetime) -> datetime:
+    epoch_seconds = moment.timestamp() // tier.seconds * tier.seconds
+    return datetime.fromtimestamp(epoch_seconds, tz=timezone.utc)
+
+
+def ensure_rollups(client: InfluxDBClient, registry: "RollupRegistry", settings: Optional[Settings] = None) -> None:
+    settings = settings or get_settings()
+    buckets_api = client.buckets_api()
+    tasks_api = client.tasks_api()
+
+    if settings.influx_raw_retention_days > 0:
+        raw = buckets_api.find_bucket_by_name(settings.influx_bucket)
+        if raw is not None:
+            raw.retention_rules = [_retention(settings.influx_raw_retention_days)]
+            buckets_api.update_bucket(raw)
+
+    # Every API worker runs this at startup, so creating a bucket or task can race; all of them settle on the
+    # same survivor.
+    for tier in get_rollup_tiers(settings):
+        bucket = buckets_api.find_bucket_by_name(tier.bucket)
+        if bucket is None:
+            try:
+                buckets_api.create_bucket(
+                    bucket_name=tier.bucket,
+                    retention_rules=_retention(tier.retention_days),
+                    org=settings.influx_org,
+                )
+            except ApiException as exc:
+                # 422: another worker created it first.
+                if exc.status != 422:
+                    raise
+        elif [rule.every_seconds for rule in bucket.retention_rules or []] != [tier.retention_days * 86400]:
+            bucket.retention_rules = [_retention(tier.retention_days)]
+            buckets_api.update_bucket(bucket)
+
+        flux = ROLLUP_TASK_FLUX.format(
+            name=tier.name,
+            every=tier.every,
+            offset=tier.offset,
+            lookback=f"{rollup_lookback_seconds(tier, settings.influx_rollup_max_lateness_seconds)}s",
+            source=settings.influx_bucket,
+            target=tier.bucket,
+            org=settings.influx_org,
+        )
+        tasks = tasks_api.find_tasks(name=tier.name)
+        if not tasks:
+            tasks_api.create_task(
+                task_create_request=TaskCreateRequest(
+                    org=settings.influx_org,
+                    flux=flux,
+                    status="active",
+                    description=f"Rolls {settings.influx_bucket} up into {tier.bucket}",
+                )
+            )
+            logger.info("Created rollup task %s", tier.name)
+            tasks = tasks_api.find_tasks(name=tier.name)
+        task = _keep_oldest(tasks_api, tasks)
+        if task.flux != flux:
+            # Picks up a changed lateness allowance; the windows it newly covers are rewritten over the next runs.
+            task.flux = flux
+            tasks_api.update_task(task)
+            logger.info("Updated rollup task %s", tier.name)
+        registry.mark_available(tier, task.created_at or datetime.now(timezone.utc))
+
+
+def _keep_oldest(tasks_api, tasks: list):
+    # Deterministic across workers: each keeps the same task and deletes the rest.
+    tasks = sorted(tasks, key=lambda task: (task.created_at or datetime.max.replace(tzinfo=timezone.utc), task.id))
+    for duplicate in tasks[1:]:
+        try:
+            tasks_api.delete_task(duplicate.id)
+            logger.info("Deleted duplicate rollup task %s", duplicate.id)
+        except ApiException as exc:
+            # 404: another worker deleted it first.
+            if exc.status != 404:
+                raise
+    return tasks[0]
+
+
+def _retention(days: int) -> BucketRetentionRules:
+    return BucketRetentionRules(type="expire", every_seconds=days * 86400)
+
+
+def _duration_seconds(duration: str) -> int:
+    units = {"s": 1, "m": 60, "h": 3600}
+    return int(duration[:-1]) * units[duration[-1]]
+
+
+@lru_cache()
+def get_rollup_registry() -> RollupRegistry:
+    return RollupRegistry()
@@ -0,0 +1,254 @@
+import fcntl
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from schemas.telemetry import BusTelemetry
+
+logger = logging.getLogger(__name__)
+
+# One directory per partition holding numbered segments. Each segment is an 8-byte magic, then records of
+#   payload length u32 | CRC-32 of payload u32 | payload
+# and each payload is one normalized point:
+#   timestamp (unix ns) i64 | latitude f64 | longitude f64 | temperature_c f64 | smoke u8 | bus_id UTF-8
+# Several API processes may append to the same partition; a flock on the partition serializes them.
+SEGMENT_MAGIC = b"BTINGLG1"
+_RECORD = struct.Struct("<II")
+_POINT = struct.Struct("<qdddB")
+_SEGMENT_SUFFIX = ".log"
+_LOCK_FILE = ".lock"
+_POSITION_FILE = "consumer.pos"
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class LogPosition(NamedTuple):
+    segment: int
+    offset: int
+
+
+def partition_for(bus_id: str, partitions: int) -> int:
+    # Stable across processes, unlike hash().
+    return zlib.crc32(bus_id.encode("utf-8")) % partitions
+
+
+def encode_point(telemetry: BusTelemetry) -> bytes:
+    timestamp = telemetry.timestamp
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    delta = timestamp - _EPOCH
+    timestamp_ns = (delta.days * 86400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+    return _POINT.pack(
+        timestamp_ns,
+        telemetry.latitude,
+        telemetry.longitude,
+        telemetry.temperature_c,
+        1 if telemetry.smoke_detected else 0,
+    ) + telemetry.bus_id.encode("utf-8")
+
+
+def decode_point(payload: bytes) -> BusTelemetry:
+    timestamp_ns, latitude, longitude, temperature_c, smoke = _POINT.unpack_from(payload)
+    seconds, nanos = divmod(timestamp_ns, 1_000_000_000)
+    return BusTelemetry.model_construct(
+        bus_id=payload[_POINT.size :].decode("utf-8"),
+        latitude=latitude,
+        longitude=longitude,
+        temperature_c=temperature_c,
+        smoke_detected=bool(smoke),
+        timestamp=datetime.fromtimestamp(seconds, tz=timezone.utc).replace(microsecond=nanos // 1000),
+    )
+
+
+def _segment_path(directory: str, sequence: int) -> str:
+    return os.path.join(directory, f"{sequence:020d}{_SEGMENT_SUFFIX}")
+
+
+def _list_segments(directory: str) -> List[int]:
+    return sorted(int(name[: -len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory) if name.endswith(_SEGMENT_SUFFIX))
+
+
+def _read_position(directory: str) -> Optional[LogPosition]:
+    try:
+        with open(os.path.join(directory, _POSITION_FILE)) as handle:
+            segment, offset = handle.read().split()
+        return LogPosition(int(segment), int(offset))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class PartitionedLog:
+    # Producer side, used by the API: appends points to the partition that owns their bus.
+    def __init__(self, directory: str, partitions: int, segment_bytes: int, fsync: bool = True):
+        self._directory = directory
+        self._partitions = partitions
+        self._segment_bytes = segment_bytes
+        self._fsync = fsync
+        self._locks = [threading.Lock() for _ in range(partitions)]
+        self._lock_fds: Dict[int, int] = {}
+        self._active: Dict[int, Tuple[int, int]] = {}
+        self._backlog_cache: Tuple[float, int] = (0.0, 0)
+        for partition in range(partitions):
+            os.makedirs(self.partition_dir(partition), exist_ok=True)
+
+    @property
+    def partitions(self) -> int:
+        return self._partitions
+
+    def partition_dir(self, partition: int) -> str:
+        return os.path.join(self._directory, f"p{partition:03d}")
+
+    def append(self, telemetries: Iterable[BusTelemetry]) -> None:
+        buffers: Dict[int, bytearray] = {}
+        for telemetry in telemetries:
+            payload = encode_point(telemetry)
+            buffer = buffers.setdefault(partition_for(telemetry.bus_id, self._partitions), bytearray())
+            buffer += _RECORD.pack(len(payload), zlib.crc32(payload))
+            buffer += payload
+        for partition, buffer in buffers.items():
+            self._append_partition(partition, bytes(buffer))
+
+    def backlog_bytes(self, max_age: float = 1.0) -> int:
+        # Bytes appended but not yet committed by a consumer; cached because it walks every partition.
+        checked_at, backlog = self._backlog_cache
+        now = time.monotonic()
+        if now - checked_at < max_age:
+            return backlog
+        backlog = 0
+        for partition in range(self._partitions):
+            directory = self.partition_dir(partition)
+            position = _read_position(directory)
+            for sequence in _list_segments(directory):
+                try:
+                    size = os.path.getsize(_segment_path(directory, sequence))
+                except FileNotFoundError:
+                    continue
+                if position is not None and sequence < position.segment:
+                    continue
+                start = position.offset if position is not None and sequence == position.segment else len(SEGMENT_MAGIC)
+                backlog += max(size - start, 0)
+        self._backlog_cache = (now, backlog)
+        return backlog
+
+    def close(self) -> None:
+        for _, fd in self._active.values():
+            os.close(fd)
+        self._active.clear()
+        for fd in self._lock_fds.values():
+            os.close(fd)
+        self._lock_fds.clear()
+
+    def _append_partition(self, partition: int, data: bytes) -> None:
+        with self._locks[partition]:
+            lock_fd = self._lock_fds.get(partition)
+            if lock_fd is None:
+                lock_fd = os.open(os.path.join(self.partition_dir(partition), _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+                self._lock_fds[partition] = lock_fd
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            try:
+                fd = self._active_segment(partition)
+                os.write(fd, data)
+                if self._fsync:
+                    os.fsync(fd)
+            finally:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+
+    def _active_segment(self, partition: int) -> int:
+        # Called under the partition flock. Another process may have rolled the segment since we last wrote,
+        # and consumers delete a segment only once a newer one exists, so never append behind a newer segment.
+        directory = self.partition_dir(partition)
+        sequence, fd = self._active.get(partition, (0, -1))
+        if fd >= 0 and not os.path.exists(_segment_path(directory, sequence + 1)):
+            if os.fstat(fd).st_size < self._segment_bytes:
+                return fd
+        if fd >= 0:
+            os.close(fd)
+            del self._active[partition]
+
+        segments = _list_segments(directory)
+        newest = segments[-1] if segments else 0
+        if newest and os.path.getsize(_segment_path(directory, newest)) < self._segment_bytes:
+            fd = os.open(_segment_path(directory, newest), os.O_WRONLY | os.O_APPEND)
+            self._active[partition] = (newest, fd)
+            return fd
+
+        sequence = newest + 1
+        fd = os.open(_segment_path(directory, sequence), os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_EXCL)
+        os.write(fd, SEGMENT_MAGIC)
+        self._active[partition] = (sequence, fd)
+        return fd
+
+
+class PartitionReader:
+    # Consumer side: exactly one stream processor owns a partition, so positions need no locking.
+    def __init__(self, directory: str):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._position = _read_position(directory)
+        self.corrupt = 0
+
+    def poll(self, max_records: int) -> Tuple[List[BusTelemetry], Optional[LogPosition]]:
+        # Returns the points after the committed position and the position to commit once they are stored.
+        points: List[BusTelemetry] = []
+        position = self._position
+        for sequence in _list_segments(self._directory):
+            if position is not None and sequence < position.segment:
+                continue
+            # Look for a newer segment before reading: once one exists, this segment can no longer grow.
+            sealed = os.path.exists(_segment_path(self._directory, sequence + 1))
+            start = position.offset if position is not None and position.segment == sequence else len(SEGMENT_MAGIC)
+            end = self._read_segment(sequence, start, sealed, max_records - len(points), points)
+            position = LogPosition(sequence, end)
+            if len(points) >= max_records or not sealed:
+                break
+            position = LogPosition(sequence + 1, len(SEGMENT_MAGIC))
+        return points, position
+
+    def commit(self, position: Optional[LogPosition]) -> None:
+        if position is None or position == self._position:
+            return
+        path = os.path.join(self._directory, _POSITION_FILE)
+        with open(path + ".tmp", "w") as handle:
+            handle.write(f"{position.segment} {position.offset}")
+        os.replace(path + ".tmp", path)
+        self._position = position
+        for sequence in _list_segments(self._directory):
+            if sequence >= position.segment:
+                break
+            os.remove(_segment_path(self._directory, sequence))
+
+    def _read_segment(self, sequence: int, start: int, sealed: bool, limit: int, points: List[BusTelemetry]) -> int:
+        path = _segment_path(self._directory, sequence)
+        with open(path, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size <= start:
+                return start
+            with mmap.mmap(handle.fileno(), size, access=mmap.ACCESS_READ) as view:
+                if view[: len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    logger.error("Ingest log segment %s has a bad header; skipping it", path)
+                    self.corrupt += 1
+                    return size
+                offset = start
+                while limit > 0 and offset + _RECORD.size <= size:
+                    length, checksum = _RECORD.unpack_from(view, offset)
+                    end = offset + _RECORD.size + length
+                    payload = view[offset + _RECORD.size : end] if end <= size else b""
+                    if end > size or zlib.crc32(payload) != checksum:
+                        if not sealed:
+                            # A producer may still be mid-write; try again on the next poll.
+                            break
+                        logger.error("Ingest log segment %s is torn at byte %s; skipping the remainder", path, offset)
+                        self.corrupt += 1
+                        return size
+                    points.append(decode_point(payload))
+                    offset = end
+                    limit -= 1
+                if sealed and limit > 0 and offset + _RECORD.size > size and offset < size:
+                    self.corrupt += 1
+                    return size
+                return offset
@@ -0,0 +1,80 @@
+from typing import List, Optional
+
+from db.session import SCHEMA_LOCK_SQL
+from schemas.telemetry import BusTelemetry
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+LATEST_STATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS latest_state (
+    bus_id TEXT PRIMARY KEY,
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    temperature_c DOUBLE PRECISION NOT NULL,
+    smoke_detected BOOLEAN NOT NULL,
+    timestamp TIMESTAMPTZ NOT NULL
+);
+"""
+
+class LatestStateRepository:
+    def __init__(self, session: AsyncSession):
+        self._session = session
+
+    async def init_table(self) -> None:
+        await self._session.execute(text(SCHEMA_LOCK_SQL))
+        await self._session.execute(text(LATEST_STATE_TABLE_SQL))
+        await self._session.commit()
+
+    async def get_all_async(self) -> List[BusTelemetry]:
+        result = await self._session.execute(
+            text("SELECT bus_id, latitude, longitude, temperature_c, smoke_detected, timestamp FROM latest_state")
+        )
+        rows = result.mappings().all()
+        return [BusTelemetry(**row) for row in rows]
+
+    async def get_by_id_async(self, bus_id: str) -> Optional[BusTelemetry]:
+        result = await self._session.execute(
+            text(
+                "SELECT bus_id, latitude, longitude, temperature_c, smoke_detected, timestamp "
+                "FROM latest_state WHERE bus_id = :bus_id"
+            ),
+            {"bus_id": bus_id},
+        )
+        row = result.mappings().first()
+        return BusTelemetry(**row) if row else None
+
+    async def get_many_async(self, bus_ids: List[str]) -> List[BusTelemetry]:
+        if not bus_ids:
+            return []
+        result = await self._session.execute(
+            text(
+                "SELECT bus_id, latitude, longitude, temperature_c, smoke_detected, timestamp "
+                "FROM latest_state WHERE bus_id = ANY(:bus_ids)"
+            ),
+            {"bus_ids": list(bus_ids)},
+        )
+        rows = result.mappings().all()
+        return [BusTelemetry(**row) for row in rows]
+
+    async def upsert_many_async(self, states: List[BusTelemetry]) -> None:
+        if not states:
+            return
+        # Only move a row forward in time so concurrent workers cannot overwrite a newer point.
+        await self._session.execute(
+            text(
+                """
+                INSERT INTO latest_state (bus_id, latitude, longitude, temperature_c, smoke_detected, timestamp)
+                VALUES (:bus_id, :latitude, :longitude, :temperature_c, :smoke_detected, :timestamp)
+                ON CONFLICT (bus_id) DO UPDATE SET
+                    latitude = EXCLUDED.latitude,
+                    longitude = EXCLUDED.longitude,
+                    temperature_c = EXCLUDED.temperature_c,
+                    smoke_detected = EXCLUDED.smoke_detected,
+                    timestamp = EXCLUDED.timestamp
+                WHERE latest_state.timestamp < EXCLUDED.timestamp
+                """
+            ),
+            [state.model_dump() for state in states],
+        )
+        await self._session.commit()
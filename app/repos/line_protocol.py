@@ -0,0 +1,89 @@
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List
+
+from schemas.telemetry import BusTelemetry
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_ESCAPE_MEASUREMENT = str.maketrans({",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+_ESCAPE_TAG = str.maketrans({",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"})
+
+_MAX_CACHED_TAGS = 4096
+
+
+def escape_measurement(value: str) -> str:
+    return value.translate(_ESCAPE_MEASUREMENT)
+
+
+def escape_tag_value(value: str) -> str:
+    escaped = value.translate(_ESCAPE_TAG)
+    # A trailing backslash would escape the separator that follows it.
+    if escaped.endswith("\\"):
+        escaped += " "
+    return escaped
+
+
+def format_float(value: float) -> str:
+    text = str(value)
+    if text.endswith(".0"):
+        text = text[:-2]
+    return text
+
+
+def to_unix_nanos(timestamp: datetime) -> int:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    delta = timestamp - EPOCH
+    return delta.days * 86_400_000_000_000 + delta.seconds * 1_000_000_000 + delta.microseconds * 1_000
+
+
+# Byte-for-byte equal to the Point("bus_telemetry") serialization at nanosecond precision.
+class LineProtocolEncoder:
+    def __init__(self, measurement: str = "bus_telemetry"):
+        self._measurement = escape_measurement(measurement).encode()
+        self._buffer = bytearray()
+        self._series: Dict[str, bytes] = {}
+
+    def encode(self, telemetries: List[BusTelemetry]) -> bytes:
+        buffer = self._buffer
+        buffer.clear()
+        for telemetry in telemetries:
+            self._append(buffer, telemetry)
+        return bytes(buffer)
+
+    def encode_chunks(self, telemetries: List[BusTelemetry], chunk_size: int) -> Iterator[bytes]:
+        for offset in range(0, len(telemetries), chunk_size):
+            yield self.encode(telemetries[offset : offset + chunk_size])
+
+    def _append(self, buffer: bytearray, telemetry: BusTelemetry) -> None:
+        if buffer:
+            buffer += b"\n"
+        buffer += self._series_key(telemetry.bus_id)
+        buffer += (
+            f" latitude={format_float(telemetry.latitude)}"
+            f",longitude={format_float(telemetry.longitude)}"
+            f",smoke_detected={int(telemetry.smoke_detected)}i"
+            f",temperature_c={format_float(telemetry.temperature_c)}"
+            f" {to_unix_nanos(telemetry.timestamp)}"
+        ).encode()
+
+    def _series_key(self, bus_id: str) -> bytes:
+        key = self._series.get(bus_id)
+        if key is None:
+            if len(self._series) >= _MAX_CACHED_TAGS:
+                self._series.clear()
+            key = self._measurement + b",bus_id=" + escape_tag_value(bus_id).encode()
+            self._series[bus_id] = key
+        return key
+
+
+_local = threading.local()
+
+
+def get_line_protocol_encoder() -> LineProtocolEncoder:
+    encoder = getattr(_local, "encoder", None)
+    if encoder is None:
+        encoder = LineProtocolEncoder()
+        _local.encoder = encoder
+    return encoder
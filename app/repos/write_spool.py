@@ -0,0 +1,327 @@
+import fcntl
+import itertools
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
+
+from schemas.telemetry import SpoolStats
+
+logger = logging.getLogger(__name__)
+
+# Segment layout: an 8-byte magic, then records of
+#   payload length u32 | CRC-32 of payload u32 | spooled at (unix ns) i64 | line protocol payload
+# A record whose length or checksum does not add up is a torn tail from a crash; the rest of that segment is dropped.
+SEGMENT_MAGIC = b"BTSPOOL1"
+_RECORD = struct.Struct("<IIq")
+_SEGMENT_SUFFIX = ".seg"
+_POSITION_FILE = "replay.pos"
+_LOCK_FILE = ".lock"
+# Batches Influx refused outright, as line protocol, for an operator to inspect or fix and re-send.
+DEAD_LETTER_FILE = "rejected.lp"
+
+
+class RejectedBatch(Exception):
+    # Raised by a replay writer when the batch itself is refused; sending it again can never succeed.
+    pass
+
+
+def claim_spool_directory(base: str) -> Tuple[str, int]:
+    # One spool per API worker: slot 0 is the base directory a single process has always used, further
+    # workers get worker-N below it. The flock is held for the life of the process, so a replacement
+    # worker takes over whatever backlog the one before it left.
+    for slot in itertools.count():
+        directory = base if slot == 0 else os.path.join(base, f"worker-{slot}")
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(os.path.join(directory, _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return directory, fd
+
+
+def claim_orphan_spool_directories(base: str) -> Iterator[Tuple[str, int]]:
+    # worker-N slots that still hold segments but no live worker has locked, e.g. after the worker count
+    # shrank. Each is yielded locked; the caller drains it and releases the flock by closing its spool.
+    try:
+        names = sorted(name for name in os.listdir(base) if re.fullmatch(r"worker-\d+", name))
+    except FileNotFoundError:
+        return
+    for name in names:
+        directory = os.path.join(base, name)
+        if not any(entry.endswith(_SEGMENT_SUFFIX) for entry in os.listdir(directory)):
+            continue
+        fd = os.open(os.path.join(directory, _LOCK_FILE), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        yield directory, fd
+
+
+class WriteSpool:
+    # Local append-only backlog for line protocol that could not reach Influx.
+    # While anything is spooled (or the batching queue is over its limit) new writes go here too,
+    # so the replayer can drain everything in arrival order.
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int,
+        max_pending_lines: int,
+        max_record_lines: int,
+        fsync: bool = True,
+        lock_fd: Optional[int] = None,
+    ):
+        self._directory = directory
+        self._lock_fd = lock_fd
+        self._segment_bytes = segment_bytes
+        self._max_pending_lines = max_pending_lines
+        self._max_record_lines = max_record_lines
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        self._pending_lines = 0
+        self._diverting = False
+        self._spooled_total = 0
+        self._replayed_total = 0
+        self._corrupt_total = 0
+        self._rejected_total = 0
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)]) for name in os.listdir(directory) if name.endswith(_SEGMENT_SUFFIX)
+        )
+        self._position = self._read_position()
+        self._records, self._bytes = self._scan_backlog()
+        self._active: Optional[Any] = None
+        self._active_size = 0
+        if self._records:
+            self._diverting = True
+            logger.info("Spool holds %s batches (%s bytes) from a previous run", self._records, self._bytes)
+
+    def admit(self, payload: bytes) -> bool:
+        # True when the caller may hand the payload to the batching write API; False means spool it.
+        lines = payload.count(b"\n") + 1
+        with self._lock:
+            if self._diverting or self._pending_lines + lines > self._max_pending_lines:
+                return False
+            self._pending_lines += lines
+            return True
+
+    def on_write_success(self, conf: Tuple[str, str, str], data: Union[bytes, str]) -> None:
+        self._settle(data)
+
+    def on_write_error(self, conf: Tuple[str, str, str], data: Union[bytes, str], exception: Exception) -> None:
+        logger.warning("Influx write failed after retries (%s); spooling batch", exception)
+        self._settle(data)
+        with self._lock:
+            self._diverting = True
+        self.append(data if isinstance(data, bytes) else data.encode())
+
+    def on_write_rejected(self, conf: Tuple[str, str, str], data: Union[bytes, str], exception: Exception) -> None:
+        # A refused batch is not spooled: replaying it would stall every batch behind it.
+        self._settle(data)
+        self.reject(data if isinstance(data, bytes) else data.encode(), exception)
+
+    def reject(self, payload: bytes, reason: Exception) -> None:
+        logger.error("Influx rejected a write batch (%s); moved to %s", reason, DEAD_LETTER_FILE)
+        with self._lock:
+            with open(os.path.join(self._directory, DEAD_LETTER_FILE), "ab") as handle:
+                handle.write(payload.rstrip(b"\n") + b"\n")
+                handle.flush()
+                if self._fsync:
+                    os.fsync(handle.fileno())
+            self._rejected_total += 1
+
+    def append(self, payload: bytes) -> None:
+        # Failed batches can hold many queued chunks; split them so each replayed write stays small.
+        records = self._split(payload)
+        now_ns = time.time_ns()
+        with self._lock:
+            for record in records:
+                if self._active is None or self._active_size >= self._segment_bytes:
+                    self._open_segment()
+                self._active.write(_RECORD.pack(len(record), zlib.crc32(record), now_ns))
+                self._active.write(record)
+                self._active_size += _RECORD.size + len(record)
+                self._records += 1
+                self._bytes += len(record)
+                self._spooled_total += 1
+            self._active.flush()
+            if self._fsync:
+                os.fsync(self._active.fileno())
+            self._diverting = True
+
+    def has_backlog(self) -> bool:
+        with self._lock:
+            return self._records > 0
+
+    def replay(self, write: Callable[[bytes], None]) -> int:
+        # Replays oldest first and stops at the first failure; Influx overwrites identical points,
+        # so a batch replayed twice after a crash is harmless. A batch the writer rejects outright
+        # (RejectedBatch) is dead-lettered and skipped instead of blocking the rest.
+        replayed = 0
+        while True:
+            with self._lock:
+                if not self._segments:
+                    if self._records == 0:
+                        self._diverting = False
+                    return replayed
+                sequence = self._segments[0]
+                if self._active is not None and sequence == self._segments[-1]:
+                    # Seal the segment being appended to; new spooled batches start the next one.
+                    self._close_active()
+            start = self._position[1] if self._position[0] == sequence else len(SEGMENT_MAGIC)
+            for offset, end, payload in self._iter_segment(sequence, start):
+                try:
+                    write(payload)
+                except RejectedBatch as exc:
+                    self.reject(payload, exc)
+                else:
+                    replayed += 1
+                    with self._lock:
+                        self._replayed_total += 1
+                self._write_position(sequence, end)
+                with self._lock:
+                    self._records -= 1
+                    self._bytes -= len(payload)
+            self._drop_segment(sequence)
+
+    def stats(self) -> SpoolStats:
+        oldest = self._oldest_spooled_ns()
+        with self._lock:
+            return SpoolStats(
+                batches=self._records,
+                bytes=self._bytes,
+                segments=len(self._segments),
+                oldest_age_seconds=(time.time_ns() - oldest) / 1e9 if oldest is not None else None,
+                diverting=self._diverting,
+                pending_lines=self._pending_lines,
+                spooled_total=self._spooled_total,
+                replayed_total=self._replayed_total,
+                corrupt_total=self._corrupt_total,
+                rejected_total=self._rejected_total,
+            )
+
+    def pending_lines(self) -> int:
+        return self._pending_lines
+
+    def backlog_bytes(self) -> int:
+        return self._bytes
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_active()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def _settle(self, data: Union[bytes, str]) -> None:
+        lines = data.count(b"\n" if isinstance(data, bytes) else "\n") + 1
+        with self._lock:
+            self._pending_lines = max(self._pending_lines - lines, 0)
+
+    def _split(self, payload: bytes) -> List[bytes]:
+        lines = payload.split(b"\n")
+        if len(lines) <= self._max_record_lines:
+            return [payload]
+        step = self._max_record_lines
+        return [b"\n".join(lines[i : i + step]) for i in range(0, len(lines), step)]
+
+    def _segment_path(self, sequence: int) -> str:
+        return os.path.join(self._directory, f"{sequence:020d}{_SEGMENT_SUFFIX}")
+
+    def _open_segment(self) -> None:
+        self._close_active()
+        sequence = self._segments[-1] + 1 if self._segments else 1
+        self._active = open(self._segment_path(sequence), "ab")
+        self._active.write(SEGMENT_MAGIC)
+        self._active_size = len(SEGMENT_MAGIC)
+        self._segments.append(sequence)
+
+    def _close_active(self) -> None:
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+
+    def _drop_segment(self, sequence: int) -> None:
+        with self._lock:
+            self._segments.remove(sequence)
+        os.remove(self._segment_path(sequence))
+        if self._position[0] == sequence:
+            self._position = (0, 0)
+            try:
+                os.remove(os.path.join(self._directory, _POSITION_FILE))
+            except FileNotFoundError:
+                pass
+
+    def _iter_segment(self, sequence: int, start: int) -> Iterator[Tuple[int, int, bytes]]:
+        with open(self._segment_path(sequence), "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size <= len(SEGMENT_MAGIC):
+                return
+            with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                if view[: len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                    logger.error("Spool segment %s has a bad header; skipping it", sequence)
+                    with self._lock:
+                        self._corrupt_total += 1
+                    return
+                offset = start
+                while offset + _RECORD.size <= size:
+                    length, checksum, _ = _RECORD.unpack_from(view, offset)
+                    end = offset + _RECORD.size + length
+                    payload = view[offset + _RECORD.size : end] if end <= size else b""
+                    if end > size or zlib.crc32(payload) != checksum:
+                        logger.error("Spool segment %s is torn at byte %s; dropping the remainder", sequence, offset)
+                        with self._lock:
+                            self._corrupt_total += 1
+                        return
+                    yield offset, end, payload
+                    offset = end
+
+    def _scan_backlog(self) -> Tuple[int, int]:
+        records = 0
+        total = 0
+        for sequence in self._segments:
+            start = self._position[1] if self._position[0] == sequence else len(SEGMENT_MAGIC)
+            for _, _, payload in self._iter_segment(sequence, start):
+                records += 1
+                total += len(payload)
+        return records, total
+
+    def _oldest_spooled_ns(self) -> Optional[int]:
+        with self._lock:
+            if not self._records or not self._segments:
+                return None
+            sequence = self._segments[0]
+            start = self._position[1] if self._position[0] == sequence else len(SEGMENT_MAGIC)
+        try:
+            with open(self._segment_path(sequence), "rb") as handle:
+                handle.seek(start)
+                header = handle.read(_RECORD.size)
+        except FileNotFoundError:
+            return None
+        if len(header) < _RECORD.size:
+            return None
+        return _RECORD.unpack(header)[2]
+
+    def _read_position(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self._directory, _POSITION_FILE)) as handle:
+                sequence, offset = handle.read().split()
+            return int(sequence), int(offset)
+        except (FileNotFoundError, ValueError):
+            return 0, 0
+
+    def _write_position(self, sequence: int, offset: int) -> None:
+        self._position = (sequence, offset)
+        path = os.path.join(self._directory, _POSITION_FILE)
+        with open(path + ".tmp", "w") as handle:
+            handle.write(f"{sequence} {offset}")
+        os.replace(path + ".tmp", path)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field, field_validator
@@ -19,3 +19,26 @@ class Bus(BaseModel):
         if not cleaned:
             raise ValueError("bus_id must not be empty")
         return cleaned
+
+
+class BusSummary(BaseModel):
+    # A registry listing entry: everything but the device credential.
+    bus_id: str
+    plate_number: Optional[str] = None
+    driver_name: Optional[str] = None
+    route_name: Optional[str] = None
+
+
+class BusImportIssue(BaseModel):
+    # 1-based position among the data rows of the imported file.
+    row: int
+    bus_id: Optional[str] = None
+    reason: str
+
+
+class BusImportResult(BaseModel):
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    conflicts: List[BusImportIssue] = Field(default_factory=list)
+    invalid: List[BusImportIssue] = Field(default_factory=list)
@@ -1,7 +1,11 @@
-from typing import Optional
-from datetime import datetime
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
 from pydantic import BaseModel, Field, StrictBool, field_validator
 
+# Influx stores time as int64 nanoseconds since the epoch; it refuses whole batches holding a point outside this.
+MIN_TIMESTAMP = datetime(1677, 9, 21, 0, 12, 44, tzinfo=timezone.utc)
+MAX_TIMESTAMP = datetime(2262, 4, 11, 23, 47, 16, 854775, tzinfo=timezone.utc)
+
 class BusTelemetryIn(BaseModel):
     bus_id: str = Field(..., min_length=1, max_length=64)
     latitude: float = Field(..., description="Decimal degrees", ge=-90, le=90)
@@ -22,6 +26,16 @@ class BusTelemetryIn(BaseModel):
             raise ValueError("bus_id must not be empty")
         return cleaned
 
+    @field_validator("timestamp")
+    @classmethod
+    def check_timestamp_range(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is None:
+            return value
+        aware = value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+        if not MIN_TIMESTAMP <= aware <= MAX_TIMESTAMP:
+            raise ValueError("timestamp must be between 1677-09-21 and 2262-04-11")
+        return value
+
 
 class BusTelemetry(BaseModel):
     bus_id: str
@@ -39,3 +53,55 @@ class TelemetryAggregates(BaseModel):
     temperature_min: Optional[float] = Field(None, description="Minimum temperature over window")
     temperature_avg: Optional[float] = Field(None, description="Average temperature over window")
     temperature_max: Optional[float] = Field(None, description="Maximum temperature over window")
+    smoke_events: Optional[int] = Field(None, description="Readings with smoke detected over window")
+
+
+class IngestLineError(BaseModel):
+    line: int = Field(..., description="1-based line number in the uploaded stream")
+    error: str
+
+
+class IngestStreamResult(BaseModel):
+    accepted: int = Field(..., description="Lines validated and written")
+    rejected: int = Field(..., description="Lines that failed validation or authorization")
+    duplicates: int = Field(0, description="Lines already ingested (same bus_id and timestamp)")
+    errors: List[IngestLineError] = Field(default_factory=list, description="First rejected lines, capped")
+
+
+class GatewayBatchIn(BaseModel):
+    api_keys: Dict[str, str] = Field(..., description="Per-bus API keys for every bus_id in the batch")
+    telemetry: List[BusTelemetryIn] = Field(..., description="Readings from any number of buses")
+
+
+class RejectedBus(BaseModel):
+    bus_id: str
+    reason: str
+    count: int = Field(..., description="Readings dropped for this bus")
+
+
+class GatewayIngestResult(BaseModel):
+    accepted: int
+    rejected: int
+    duplicates: int = 0
+    rejected_buses: List[RejectedBus] = Field(default_factory=list)
+
+
+class DedupStats(BaseModel):
+    checked: int = Field(..., description="Points passed through the dedup stage")
+    duplicates: int = Field(..., description="Points dropped as already ingested")
+    evicted: int = Field(..., description="Keys evicted by age or per-bus capacity")
+    tracked_buses: int
+    tracked_keys: int
+
+
+class SpoolStats(BaseModel):
+    batches: int = Field(..., description="Spooled write batches waiting for replay")
+    bytes: int = Field(..., description="Line protocol bytes waiting for replay")
+    segments: int
+    oldest_age_seconds: Optional[float] = Field(None, description="Age of the oldest batch waiting for replay")
+    diverting: bool = Field(..., description="New writes go to the spool until the backlog drains")
+    pending_lines: int = Field(..., description="Lines queued in the in-memory batching writer")
+    spooled_total: int
+    replayed_total: int
+    corrupt_total: int = Field(..., description="Torn or corrupt segment tails dropped")
+    rejected_total: int = Field(..., description="Batches Influx refused, moved to the dead-letter file")
@@ -0,0 +1,119 @@
+import math
+import struct
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+# Frame layout (little-endian, packed):
+#   header:  magic "BTLM" | version u8 | bus_id length u8 | bus_id UTF-8 bytes
+#   records: timestamp_ms i64 | latitude f32 | longitude f32 | temperature centi-degrees i16 | flags u8
+# Flags: bit 0 smoke detected, bit 1 timestamp present (otherwise server time is used).
+BINARY_CONTENT_TYPE = "application/vnd.bus-telemetry"
+MAGIC = b"BTLM"
+VERSION = 1
+
+FLAG_SMOKE = 0x01
+FLAG_HAS_TIMESTAMP = 0x02
+
+_HEADER = struct.Struct("<4sBB")
+RECORD = struct.Struct("<qffhB")
+
+BusReading = Tuple[float, float, float, bool, Optional[datetime]]
+
+# Range Influx can store (int64 nanoseconds), in epoch milliseconds.
+_MIN_TIMESTAMP_MS = -9223372036854
+_MAX_TIMESTAMP_MS = 9223372036854
+_MIN_CENTI_DEGREES, _MAX_CENTI_DEGREES = -5000, 10000
+
+
+class TelemetryFrame(NamedTuple):
+    # A decoded frame as one tuple per field, range-checked as a whole; records become BusTelemetry only once,
+    # when normalized.
+    bus_id: str
+    timestamps_ms: Tuple[int, ...]
+    latitudes: Tuple[float, ...]
+    longitudes: Tuple[float, ...]
+    centi_degrees: Tuple[int, ...]
+    flags: Tuple[int, ...]
+
+    @property
+    def count(self) -> int:
+        return len(self.flags)
+
+
+class BinaryTelemetryError(ValueError):
+    pass
+
+
+def encode_frame(bus_id: str, readings: Iterable[BusReading]) -> bytes:
+    # Reference encoder used for device firmware test vectors.
+    bus_id_bytes = bus_id.encode("utf-8")
+    if not 0 < len(bus_id_bytes) <= 64:
+        raise BinaryTelemetryError("bus_id must be 1-64 bytes")
+    frame = bytearray(_HEADER.pack(MAGIC, VERSION, len(bus_id_bytes)))
+    frame += bus_id_bytes
+    for latitude, longitude, temperature_c, smoke_detected, timestamp in readings:
+        flags = FLAG_SMOKE if smoke_detected else 0
+        timestamp_ms = 0
+        if timestamp is not None:
+            if timestamp.tzinfo is None:
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            flags |= FLAG_HAS_TIMESTAMP
+            timestamp_ms = round(timestamp.timestamp() * 1000)
+        centi_degrees = round(temperature_c * 100)
+        if not -32768 <= centi_degrees <= 32767:
+            raise BinaryTelemetryError(f"temperature {temperature_c} does not fit the frame")
+        try:
+            frame += RECORD.pack(timestamp_ms, latitude, longitude, centi_degrees, flags)
+        except struct.error as exc:
+            raise BinaryTelemetryError(f"Reading does not fit the frame: {exc}") from exc
+    return bytes(frame)
+
+
+def decode_frame(data: bytes) -> TelemetryFrame:
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise BinaryTelemetryError("Frame is shorter than its header")
+    magic, version, bus_id_length = _HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise BinaryTelemetryError("Unknown frame magic")
+    if version != VERSION:
+        raise BinaryTelemetryError(f"Unsupported frame version {version}")
+
+    records_offset = _HEADER.size + bus_id_length
+    try:
+        bus_id = bytes(view[_HEADER.size : records_offset]).decode("utf-8").strip()
+    except UnicodeDecodeError as exc:
+        raise BinaryTelemetryError("bus_id is not valid UTF-8") from exc
+    if not bus_id or len(bus_id) > 64 or len(view) < records_offset:
+        raise BinaryTelemetryError("Invalid bus_id")
+
+    records = view[records_offset:]
+    if len(records) % RECORD.size:
+        raise BinaryTelemetryError(f"Record section is not a multiple of {RECORD.size} bytes")
+    if not records:
+        return TelemetryFrame(bus_id, (), (), (), (), ())
+
+    timestamps_ms, latitudes, longitudes, centi_degrees, flags = zip(*RECORD.iter_unpack(records))
+    # Whole-column checks; the record is only looked up to word the error.
+    if not (all(map(math.isfinite, latitudes)) and -90 <= min(latitudes) and max(latitudes) <= 90):
+        raise BinaryTelemetryError(f"Record {_first(latitudes, lambda v: not -90 <= v <= 90)}: latitude out of range")
+    if not (all(map(math.isfinite, longitudes)) and -180 <= min(longitudes) and max(longitudes) <= 180):
+        raise BinaryTelemetryError(
+            f"Record {_first(longitudes, lambda v: not -180 <= v <= 180)}: longitude out of range"
+        )
+    if not (_MIN_CENTI_DEGREES <= min(centi_degrees) and max(centi_degrees) <= _MAX_CENTI_DEGREES):
+        raise BinaryTelemetryError(
+            f"Record {_first(centi_degrees, lambda v: not _MIN_CENTI_DEGREES <= v <= _MAX_CENTI_DEGREES)}: "
+            "temperature out of range"
+        )
+    if not (_MIN_TIMESTAMP_MS <= min(timestamps_ms) and max(timestamps_ms) <= _MAX_TIMESTAMP_MS):
+        # Timestamps without the flag are ignored, whatever they hold.
+        for index, (timestamp_ms, flag) in enumerate(zip(timestamps_ms, flags)):
+            if flag & FLAG_HAS_TIMESTAMP and not _MIN_TIMESTAMP_MS <= timestamp_ms <= _MAX_TIMESTAMP_MS:
+                raise BinaryTelemetryError(f"Record {index}: timestamp out of range")
+    return TelemetryFrame(bus_id, timestamps_ms, latitudes, longitudes, centi_degrees, flags)
+
+
+def _first(values: Tuple, invalid) -> int:
+    # NaN fails every comparison, so it counts as invalid here too.
+    return next(index for index, value in enumerate(values) if not (value == value) or invalid(value))
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from schemas.telemetry import BusTelemetry
+
+# Rows as Influx returns them in CSV: strings only, no model objects.
+#   bus_id | timestamp (RFC3339) | latitude | longitude | temperature_c | smoke_detected
+TelemetryRow = Tuple[str, str, str, str, str, str]
+ROW_FIELDS = ("bus_id", "timestamp", "latitude", "longitude", "temperature_c", "smoke_detected")
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.bus-telemetry.columnar+json"
+CSV_MEDIA_TYPE = "text/csv"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+HISTORY_FORMATS = {
+    "json": JSON_MEDIA_TYPE,
+    "columnar": COLUMNAR_JSON_MEDIA_TYPE,
+    "csv": CSV_MEDIA_TYPE,
+    "arrow": ARROW_MEDIA_TYPE,
+    "ndjson": NDJSON_MEDIA_TYPE,
+}
+
+_SMOKE_TRUE = frozenset(("1", "true"))
+
+
+def negotiate_media_type(accept: Optional[str], offered: Sequence[str]) -> Optional[str]:
+    # Highest q wins, ties go to the order in `offered`; None means nothing acceptable.
+    if not accept:
+        return offered[0]
+    best: Optional[str] = None
+    best_rank: Tuple[float, int] = (0.0, 0)
+    for part in accept.split(","):
+        media_range, _, params = part.strip().partition(";")
+        media_range = media_range.strip().lower()
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        for index, media_type in enumerate(offered):
+            if media_range in (media_type, "*/*") or media_range == media_type.split("/")[0] + "/*":
+                rank = (quality, -index)
+                if best is None or rank > best_rank:
+                    best, best_rank = media_type, rank
+                break
+    return best
+
+
+def rows_from_telemetry(items: Iterable[BusTelemetry]) -> List[TelemetryRow]:
+    return [
+        (
+            item.bus_id,
+            item.timestamp.isoformat(),
+            repr(item.latitude),
+            repr(item.longitude),
+            repr(item.temperature_c),
+            "true" if item.smoke_detected else "false",
+        )
+        for item in items
+    ]
+
+
+def _floats(values: Iterable[str]) -> List[Optional[float]]:
+    return [float(value) if value else None for value in values]
+
+
+def encode_columnar_json(bus_id: str, rows: List[TelemetryRow], message: str = "Success") -> bytes:
+    # Same envelope as ResponseModel, but one array per field instead of one object per point.
+    columns = list(zip(*rows)) if rows else [()] * len(ROW_FIELDS)
+    data = {
+        "bus_id": bus_id,
+        "count": len(rows),
+        "timestamp": list(columns[1]),
+        "latitude": _floats(columns[2]),
+        "longitude": _floats(columns[3]),
+        "temperature_c": _floats(columns[4]),
+        "smoke_detected": [value in _SMOKE_TRUE for value in columns[5]],
+    }
+    return json.dumps({"status": 200, "message": message, "data": data}, separators=(",", ":")).encode()
+
+
+def encode_csv(rows: List[TelemetryRow], header: bool = True) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(ROW_FIELDS)
+    writer.writerows(
+        (bus_id, timestamp, latitude, longitude, temperature_c, "true" if smoke in _SMOKE_TRUE else "false")
+        for bus_id, timestamp, latitude, longitude, temperature_c, smoke in rows
+    )
+    return buffer.getvalue().encode()
+
+
+class ArrowStreamEncoder:
+    # Arrow IPC stream: schema once, then one record batch per call. pyarrow is only needed when asked for.
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        self._pa = pa
+        self._pc = pc
+        self._schema = pa.schema(
+            [
+                ("bus_id", pa.string()),
+                ("timestamp", pa.timestamp("ns", tz="UTC")),
+                ("latitude", pa.float64()),
+                ("longitude", pa.float64()),
+                ("temperature_c", pa.float64()),
+                ("smoke_detected", pa.bool_()),
+            ]
+        )
+        self._sink = io.BytesIO()
+        self._writer = pa.ipc.new_stream(self._sink, self._schema)
+
+    def encode(self, rows: List[TelemetryRow]) -> bytes:
+        # Parsing happens column-wise inside Arrow's casts rather than per value in Python.
+        pa, pc = self._pa, self._pc
+        if rows:
+            columns = list(zip(*rows))
+            strings = [pa.array(column, type=pa.string()) for column in columns]
+            smoke = pc.is_in(strings[5], value_set=pa.array(sorted(_SMOKE_TRUE)))
+            batch = pa.record_batch(
+                [
+                    strings[0],
+                    pc.cast(strings[1], pa.timestamp("ns", tz="UTC")),
+                    self._floats(strings[2]),
+                    self._floats(strings[3]),
+                    self._floats(strings[4]),
+                    smoke,
+                ],
+                schema=self._schema,
+            )
+            self._writer.write_batch(batch)
+        return self._drain()
+
+    def _floats(self, strings):
+        # Influx leaves a pivoted field empty when a point lacks it.
+        pa, pc = self._pa, self._pc
+        present = pc.if_else(pc.equal(strings, ""), pa.scalar(None, pa.string()), strings)
+        return pc.cast(present, pa.float64())
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+
+def encode_arrow(rows: List[TelemetryRow]) -> bytes:
+    encoder = ArrowStreamEncoder()
+    return encoder.encode(rows) + encoder.close()
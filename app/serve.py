@@ -0,0 +1,61 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from typing import List, Optional
+
+import uvicorn
+
+from core.config import get_settings, worker_count
+
+# Production entry point: WEB_CONCURRENCY API workers (0 = one per CPU) behind one listening socket.
+# uvicorn spawns each worker as a fresh interpreter, so every worker builds its own Influx client, write API,
+# DB pool and caches in its lifespan and flushes them on its own shutdown.
+#   WEB_CONCURRENCY=0 python serve.py
+#   WEB_RELOAD=true python serve.py            # development: one auto-reloading process
+
+
+def _prepare_multiprocess_metrics(directory: Optional[str]) -> str:
+    # prometheus_client reads this before any metric exists, so it must be set before the workers start;
+    # files left by a previous run would be summed into this one.
+    directory = directory or os.path.join(tempfile.gettempdir(), "telemetry-metrics")
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    return directory
+
+
+def serve(argv: Optional[List[str]] = None) -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Run the telemetry API")
+    parser.add_argument("--app", default="main:app", help="ASGI application as module:attribute")
+    parser.add_argument("--host", default=settings.web_host)
+    parser.add_argument("--port", type=int, default=settings.web_port)
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency, help="0 = one per CPU")
+    parser.add_argument("--reload", action="store_true", default=settings.web_reload)
+    args = parser.parse_args(argv)
+
+    workers = 1 if args.reload else worker_count(settings.model_copy(update={"web_concurrency": args.workers}))
+    # Workers inherit the environment; with the count resolved they all agree on running alongside others.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    # A single worker runs in this process and must not keep the settings read before the line above.
+    get_settings.cache_clear()
+    if workers > 1 or settings.prometheus_multiproc_dir:
+        _prepare_multiprocess_metrics(settings.prometheus_multiproc_dir)
+
+    if args.reload:
+        uvicorn.run(args.app, host=args.host, port=args.port, reload=True)
+        return
+    uvicorn.run(
+        args.app,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        access_log=settings.web_access_log,
+        timeout_graceful_shutdown=settings.web_graceful_shutdown_seconds,
+    )
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1:])
@@ -0,0 +1,131 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, status
+
+from core.config import get_settings, worker_count
+from db.session import get_ingest_log, get_write_spool
+from repos.ingest_log import PartitionedLog
+from repos.write_spool import WriteSpool
+
+
+class TokenBucketLimiter:
+    # One bucket per bus, refilled at `rate` points per second up to `burst`; idle buckets are evicted LRU.
+    def __init__(self, rate: float, burst: float, max_keys: int, clock=time.monotonic):
+        self._rate = rate
+        self._burst = burst
+        self._max_keys = max_keys
+        self._clock = clock
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate > 0
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        # Returns 0 when admitted, otherwise the seconds until `cost` tokens will be available.
+        if not self.enabled:
+            return 0.0
+        # A batch bigger than the burst would never fit; let it through whenever the bucket is full.
+        cost = min(cost, self._burst)
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - updated) * self._rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self._rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self._max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class IngestAdmission:
+    # Sheds load before the body is read when the write pipeline cannot keep up.
+    def __init__(
+        self,
+        spool: WriteSpool,
+        max_pending_lines: int,
+        max_spool_bytes: int,
+        retry_after: float,
+        ingest_log: Optional[PartitionedLog] = None,
+        max_log_backlog_bytes: int = 0,
+    ):
+        self._spool = spool
+        self._max_pending_lines = max_pending_lines
+        self._max_spool_bytes = max_spool_bytes
+        self._retry_after = retry_after
+        self._ingest_log = ingest_log
+        self._max_log_backlog_bytes = max_log_backlog_bytes
+        self.shed = 0
+
+    def saturation(self) -> Optional[str]:
+        if self._spool.pending_lines() >= self._max_pending_lines:
+            return "Ingest queue is full"
+        if self._max_spool_bytes and self._spool.backlog_bytes() >= self._max_spool_bytes:
+            return "Ingest backlog is draining"
+        if (
+            self._ingest_log is not None
+            and self._max_log_backlog_bytes
+            and self._ingest_log.backlog_bytes() >= self._max_log_backlog_bytes
+        ):
+            return "Stream processors are behind"
+        return None
+
+    def check(self) -> None:
+        reason = self.saturation()
+        if reason is not None:
+            self.shed += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=reason,
+                headers={"Retry-After": _retry_after_header(self._retry_after)},
+            )
+
+
+def rate_limited(wait: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Bus is sending faster than its rate limit",
+        headers={"Retry-After": _retry_after_header(wait)},
+    )
+
+
+def _retry_after_header(seconds: float) -> str:
+    return str(max(math.ceil(seconds), 1))
+
+
+@lru_cache()
+def get_ingest_rate_limiter() -> TokenBucketLimiter:
+    # The configured limits are per bus across the server; connections spread a bus over every worker,
+    # so each worker enforces its share.
+    settings = get_settings()
+    workers = worker_count(settings)
+    return TokenBucketLimiter(
+        rate=settings.ingest_rate_per_bus / workers,
+        burst=settings.ingest_burst_per_bus / workers,
+        max_keys=settings.ingest_rate_limiter_max_buses,
+    )
+
+
+@lru_cache()
+def get_ingest_admission() -> IngestAdmission:
+    settings = get_settings()
+    return IngestAdmission(
+        spool=get_write_spool(),
+        max_pending_lines=int(settings.influx_write_max_pending_lines * settings.ingest_admission_queue_ratio),
+        max_spool_bytes=settings.ingest_admission_max_spool_bytes,
+        retry_after=settings.ingest_retry_after_seconds,
+        ingest_log=get_ingest_log(),
+        max_log_backlog_bytes=settings.ingest_admission_max_log_backlog_bytes,
+    )
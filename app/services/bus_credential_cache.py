@@ -0,0 +1,146 @@
+import asyncio
+import hmac
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import get_settings
+from core.metrics import CREDENTIALS_HIT, CREDENTIALS_MISS
+from db.session import get_session_factory
+from repos.bus_repository import BUS_CHANGES_CHANNEL, BusRepository
+
+logger = logging.getLogger(__name__)
+
+class BusCredentialCache:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_size: int,
+        ttl: float,
+        negative_ttl: float,
+    ):
+        self._session_factory = session_factory
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        # bus_id -> (api_key or None for unknown buses, expires_at)
+        self._entries: OrderedDict[str, Tuple[Optional[str], float]] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, bus_id: str) -> Tuple[bool, Optional[str]]:
+        with self._lock:
+            entry = self._entries.get(bus_id)
+            if entry is None:
+                return False, None
+            api_key, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[bus_id]
+                return False, None
+            self._entries.move_to_end(bus_id)
+            return True, api_key
+
+    def put(self, bus_id: str, api_key: Optional[str]) -> None:
+        ttl = self._ttl if api_key is not None else self._negative_ttl
+        with self._lock:
+            self._entries[bus_id] = (api_key, time.monotonic() + ttl)
+            self._entries.move_to_end(bus_id)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, bus_id: str) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.pop(bus_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    async def get_api_key(self, bus_id: str) -> Optional[str]:
+        found, api_key = self.lookup(bus_id)
+        if found:
+            CREDENTIALS_HIT.inc()
+            return api_key
+        CREDENTIALS_MISS.inc()
+
+        # Coalesce concurrent misses for the same bus into a single query.
+        pending = self._inflight.get(bus_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[bus_id] = future
+        version = self._version
+        try:
+            async with self._session_factory() as session:
+                bus = await BusRepository(session).get_by_id_async(bus_id)
+            api_key = str(bus.api_key) if bus is not None else None
+            # Skip caching if the bus was changed while we were reading it.
+            if version == self._version:
+                self.put(bus_id, api_key)
+            future.set_result(api_key)
+            return api_key
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception retrieved when nobody else was waiting on it.
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(bus_id, None)
+
+    async def run_invalidation_listener(self, dsn: str, interval: float) -> None:
+        # Keys change through other workers and hosts too; Postgres tells every listener which bus changed.
+        # The cache is cleared whenever listening (re)starts, since notifications sent meanwhile are lost.
+        def on_change(connection, pid, channel, bus_id) -> None:
+            self.invalidate(bus_id)
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(BUS_CHANGES_CHANNEL, on_change)
+                self.clear()
+                # Listening alone never notices a dead socket.
+                while True:
+                    await asyncio.sleep(interval)
+                    await connection.fetchval("SELECT 1")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Bus change listener failed (%s); reconnecting in %ss", exc, interval)
+            finally:
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(interval)
+
+    async def verify(self, bus_id: str, api_key: str) -> bool:
+        expected = await self.get_api_key(bus_id)
+        if expected is None:
+            return False
+        return hmac.compare_digest(expected.encode(), api_key.encode())
+
+
+@lru_cache()
+def get_bus_credential_cache() -> BusCredentialCache:
+    settings = get_settings()
+    return BusCredentialCache(
+        get_session_factory(),
+        max_size=settings.bus_credential_cache_size,
+        ttl=settings.bus_credential_cache_ttl,
+        negative_ttl=settings.bus_credential_negative_ttl,
+    )
@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from db.session import get_engine, get_session_factory
+from schemas.bus import BusImportResult
+from services.bus_service import BusService
+
+# Bulk fleet onboarding: a CSV with a header row (bus_id, plate_number, driver_name, route_name, api_key) or a
+# JSON array of bus objects, written in one transaction.
+#   python -m services.bus_import fleet.csv
+#   python -m services.bus_import fleet.json --overwrite    # update existing buses instead of reporting them
+# The same files can be sent to POST /api/v1/buses/import with the admin key.
+IMPORT_FORMATS = ("csv", "json")
+
+
+def parse_bus_rows(content: bytes, format: str) -> List[Dict[str, Any]]:
+    # Raises ValueError when the file as a whole cannot be read; bad rows are left to the import to report.
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError as exc:
+        raise ValueError("File is not UTF-8 text") from exc
+    if format == "csv":
+        reader = csv.DictReader(io.StringIO(text, newline=""))
+        if not reader.fieldnames or "bus_id" not in reader.fieldnames:
+            raise ValueError("CSV needs a header row with a bus_id column")
+        # Empty cells are missing values, not empty strings.
+        return [{key: value or None for key, value in row.items() if key} for row in reader]
+    if format == "json":
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON: {exc}") from exc
+        if not isinstance(rows, list):
+            raise ValueError("JSON import must be an array of bus objects")
+        return rows
+    raise ValueError(f"Unsupported import format: {format}")
+
+
+def print_result(result: BusImportResult) -> None:
+    print(
+        f"created {result.created}, updated {result.updated}, unchanged {result.unchanged}, "
+        f"conflicts {len(result.conflicts)}, invalid {len(result.invalid)}"
+    )
+    for label, issues in (("conflict", result.conflicts), ("invalid", result.invalid)):
+        for issue in issues:
+            print(f"  row {issue.row} {label} ({issue.bus_id or '-'}): {issue.reason}")
+
+
+async def _import(rows: List[Dict[str, Any]], overwrite: bool) -> BusImportResult:
+    try:
+        return await BusService(get_session_factory()).import_buses(rows, overwrite=overwrite)
+    finally:
+        await get_engine().dispose()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import buses from a CSV or JSON file")
+    parser.add_argument("path", help="File to import")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="Defaults to the file extension")
+    parser.add_argument(
+        "--overwrite", action="store_true", help="Update buses that already exist instead of reporting them"
+    )
+    args = parser.parse_args(argv)
+
+    file_format = args.format or args.path.rsplit(".", 1)[-1].lower()
+    with open(args.path, "rb") as handle:
+        content = handle.read()
+    try:
+        rows = parse_bus_rows(content, file_format)
+    except ValueError as exc:
+        print(exc, file=sys.stderr)
+        return 2
+    result = asyncio.run(_import(rows, overwrite=args.overwrite))
+    print_result(result)
+    return 1 if result.conflicts or result.invalid else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,115 @@
-from typing import List
-from schemas.bus import Bus
+import base64
+import binascii
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from schemas.bus import Bus, BusImportIssue, BusImportResult, BusSummary
 from repos.bus_repository import BusRepository
+from services.bus_credential_cache import BusCredentialCache, get_bus_credential_cache
+
+class BusPage(NamedTuple):
+    items: List[BusSummary]
+    next_cursor: Optional[str]
+
 
 class BusService:
-    def __init__(self, repository: BusRepository):
-        self._repository = repository
+    # A session (and its pooled connection) is held per query, never across the rest of a request.
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        credential_cache: Optional[BusCredentialCache] = None,
+    ):
+        self._session_factory = session_factory
+        # Compared with None: an empty cache has len() 0 and would otherwise be swapped for the global one.
+        self._credential_cache = credential_cache if credential_cache is not None else get_bus_credential_cache()
+
+    async def list_bus_ids(self, route_name: Optional[str] = None) -> List[str]:
+        async with self._session_factory() as session:
+            return await BusRepository(session).get_ids_async(route_name)
 
-    async def list_buses(self) -> List[Bus]:
-        return await self._repository.get_all_async()
+    async def list_buses(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        route_name: Optional[str] = None,
+        plate_prefix: Optional[str] = None,
+        driver_name: Optional[str] = None,
+    ) -> BusPage:
+        # Keyset pagination in bus_id order: the cursor is the last bus_id already returned.
+        after = _decode_cursor(cursor) if cursor is not None else None
+        async with self._session_factory() as session:
+            items = await BusRepository(session).get_page_async(limit, after, route_name, plate_prefix, driver_name)
+        next_cursor = _encode_cursor(items[-1].bus_id) if len(items) == limit else None
+        return BusPage(items, next_cursor)
 
     async def get_bus(self, bus_id: str) -> Bus | None:
-        return await self._repository.get_by_id_async(bus_id)
+        async with self._session_factory() as session:
+            return await BusRepository(session).get_by_id_async(bus_id)
 
     async def upsert_bus(self, bus: Bus) -> Bus:
-        return await self._repository.upsert_async(bus)
+        # Not routed: bus records change through the admin import. Kept for in-process callers.
+        async with self._session_factory() as session:
+            updated = await BusRepository(session).upsert_async(bus)
+        self._credential_cache.invalidate(bus.bus_id)
+        return updated
+
+    async def import_buses(self, rows: List[Dict[str, Any]], overwrite: bool = False) -> BusImportResult:
+        # Valid rows are written in one transaction; invalid rows, repeated bus_ids (the first one wins) and,
+        # without overwrite, buses that already exist come back as per-row issues.
+        result = BusImportResult()
+        buses: Dict[str, Bus] = {}
+        positions: Dict[str, int] = {}
+        for position, row in enumerate(rows, start=1):
+            try:
+                bus = Bus.model_validate(row)
+            except ValidationError as exc:
+                reason = "; ".join(
+                    f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()
+                )
+                bus_id = row.get("bus_id") if isinstance(row, dict) else None
+                result.invalid.append(
+                    BusImportIssue(row=position, bus_id=bus_id if isinstance(bus_id, str) else None, reason=reason)
+                )
+                continue
+            if bus.bus_id in buses:
+                result.conflicts.append(
+                    BusImportIssue(
+                        row=position, bus_id=bus.bus_id, reason=f"bus_id repeats row {positions[bus.bus_id]}"
+                    )
+                )
+                continue
+            buses[bus.bus_id] = bus
+            positions[bus.bus_id] = position
+        if not buses:
+            return result
+
+        async with self._session_factory() as session:
+            written = await BusRepository(session).bulk_upsert_async(list(buses.values()), overwrite=overwrite)
+        for bus_id in written:
+            self._credential_cache.invalidate(bus_id)
+        result.created = sum(1 for created in written.values() if created)
+        result.updated = len(written) - result.created
+        if overwrite:
+            result.unchanged = len(buses) - len(written)
+        else:
+            result.conflicts.extend(
+                BusImportIssue(row=positions[bus_id], bus_id=bus_id, reason="bus already exists")
+                for bus_id in buses
+                if bus_id not in written
+            )
+            result.conflicts.sort(key=lambda issue: issue.row)
+        return result
+
+
+def _encode_cursor(bus_id: str) -> str:
+    return base64.urlsafe_b64encode(bus_id.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, ValueError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+from core.config import get_settings
+from repos.line_protocol import to_unix_nanos
+from schemas.telemetry import BusTelemetry, DedupStats
+
+
+class TelemetryDeduplicator:
+    def __init__(self, window: float, max_keys_per_bus: int):
+        self._window = window
+        self._max_keys_per_bus = max_keys_per_bus
+        # bus_id -> {timestamp_ns: first_seen}; insertion order is arrival order, so eviction pops from the front.
+        self._index: Dict[str, OrderedDict[int, float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._checked = 0
+        self._duplicates = 0
+        self._evicted = 0
+
+    def filter(self, telemetries: Iterable[BusTelemetry]) -> Tuple[List[BusTelemetry], int]:
+        now = time.monotonic()
+        fresh: List[BusTelemetry] = []
+        duplicates = 0
+        with self._lock:
+            if now - self._last_sweep >= self._window:
+                self._sweep(now)
+            for telemetry in telemetries:
+                keys = self._index.get(telemetry.bus_id)
+                if keys is None:
+                    keys = OrderedDict()
+                    self._index[telemetry.bus_id] = keys
+                else:
+                    self._expire(keys, now)
+                key = to_unix_nanos(telemetry.timestamp)
+                if key in keys:
+                    duplicates += 1
+                    continue
+                keys[key] = now
+                if len(keys) > self._max_keys_per_bus:
+                    keys.popitem(last=False)
+                    self._evicted += 1
+                fresh.append(telemetry)
+            self._checked += len(fresh) + duplicates
+            self._duplicates += duplicates
+        return fresh, duplicates
+
+    def forget(self, telemetries: Iterable[BusTelemetry]) -> None:
+        # Undo filter() for points whose write failed, so a client retry is not dropped.
+        with self._lock:
+            for telemetry in telemetries:
+                keys = self._index.get(telemetry.bus_id)
+                if keys is not None:
+                    keys.pop(to_unix_nanos(telemetry.timestamp), None)
+
+    def stats(self) -> DedupStats:
+        with self._lock:
+            return DedupStats(
+                checked=self._checked,
+                duplicates=self._duplicates,
+                evicted=self._evicted,
+                tracked_buses=len(self._index),
+                tracked_keys=sum(len(keys) for keys in self._index.values()),
+            )
+
+    def _expire(self, keys: OrderedDict[int, float], now: float) -> None:
+        cutoff = now - self._window
+        while keys:
+            first_seen = next(iter(keys.values()))
+            if first_seen >= cutoff:
+                break
+            keys.popitem(last=False)
+            self._evicted += 1
+
+    def _sweep(self, now: float) -> None:
+        for bus_id in list(self._index):
+            keys = self._index[bus_id]
+            self._expire(keys, now)
+            if not keys:
+                del self._index[bus_id]
+        self._last_sweep = now
+
+
+@lru_cache()
+def get_telemetry_deduplicator() -> TelemetryDeduplicator:
+    settings = get_settings()
+    return TelemetryDeduplicator(
+        window=settings.dedup_window_seconds,
+        max_keys_per_bus=settings.dedup_max_keys_per_bus,
+    )
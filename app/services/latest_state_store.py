@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.config import get_settings, worker_count
+from core.metrics import STAGE_LATEST_STATE_FLUSH
+from db.session import get_session_factory
+from repos.latest_state_repository import LatestStateRepository
+from schemas.telemetry import BusTelemetry
+
+logger = logging.getLogger(__name__)
+
+
+class LatestStateStore:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        max_age: float = 0.0,
+        miss_ttl: float = 0.0,
+    ):
+        self._session_factory = session_factory
+        # 0 trusts memory for good, which holds while this process sees every point. Alongside other
+        # workers a bus's newer points may land elsewhere, so entries go back to Postgres once this old.
+        self._max_age = max_age
+        self._states: Dict[str, BusTelemetry] = {}
+        self._checked: Dict[str, float] = {}
+        self._dirty: Dict[str, BusTelemetry] = {}
+        # Buses Influx had no recent point for either: their scan is skipped until this long has passed.
+        self._miss_ttl = miss_ttl
+        self._misses: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get(self, bus_id: str) -> Optional[BusTelemetry]:
+        if self._max_age and self._checked.get(bus_id, 0.0) + self._max_age <= time.monotonic():
+            return None
+        return self._states.get(bus_id)
+
+    def update(self, telemetry: BusTelemetry) -> bool:
+        with self._lock:
+            current = self._states.get(telemetry.bus_id)
+            if current is not None and current.timestamp >= telemetry.timestamp:
+                return False
+            self._states[telemetry.bus_id] = telemetry
+            self._checked[telemetry.bus_id] = time.monotonic()
+            self._dirty[telemetry.bus_id] = telemetry
+            self._misses.pop(telemetry.bus_id, None)
+            return True
+
+    def update_many(self, telemetries: Iterable[BusTelemetry]) -> None:
+        newest: Dict[str, BusTelemetry] = {}
+        for telemetry in telemetries:
+            current = newest.get(telemetry.bus_id)
+            if current is None or telemetry.timestamp > current.timestamp:
+                newest[telemetry.bus_id] = telemetry
+        for telemetry in newest.values():
+            self.update(telemetry)
+
+    def warm(self, states: Iterable[BusTelemetry]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for state in states:
+                current = self._states.get(state.bus_id)
+                if current is None or current.timestamp < state.timestamp:
+                    self._states[state.bus_id] = state
+                self._checked[state.bus_id] = now
+                self._misses.pop(state.bus_id, None)
+
+    def remember_misses(self, bus_ids: Iterable[str]) -> None:
+        if not self._miss_ttl:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._misses = {bus_id: until for bus_id, until in self._misses.items() if until > now}
+            for bus_id in bus_ids:
+                self._misses[bus_id] = now + self._miss_ttl
+
+    def without_recent_misses(self, bus_ids: List[str]) -> List[str]:
+        now = time.monotonic()
+        return [bus_id for bus_id in bus_ids if self._misses.get(bus_id, 0.0) <= now]
+
+    async def load(self, bus_id: str) -> Optional[BusTelemetry]:
+        try:
+            async with self._session_factory() as session:
+                state = await LatestStateRepository(session).get_by_id_async(bus_id)
+        except Exception as exc:
+            logger.warning("Latest state lookup for %s failed (%s)", bus_id, exc)
+            return None
+        if state is not None:
+            self.warm([state])
+        # Points this process holds but has not flushed yet are newer than the row.
+        return self._states.get(bus_id)
+
+    async def load_many(self, bus_ids: List[str]) -> List[BusTelemetry]:
+        try:
+            async with self._session_factory() as session:
+                states = await LatestStateRepository(session).get_many_async(bus_ids)
+        except Exception as exc:
+            logger.warning("Latest state lookup for %s buses failed (%s)", len(bus_ids), exc)
+            return []
+        self.warm(states)
+        return [self._states[bus_id] for bus_id in bus_ids if bus_id in self._states]
+
+    async def warm_from_db(self) -> None:
+        async with self._session_factory() as session:
+            states = await LatestStateRepository(session).get_all_async()
+        self.warm(states)
+
+    async def flush(self) -> int:
+        with self._lock:
+            pending: List[BusTelemetry] = list(self._dirty.values())
+            self._dirty = {}
+        if not pending:
+            return 0
+        started = time.perf_counter()
+        try:
+            async with self._session_factory() as session:
+                await LatestStateRepository(session).upsert_many_async(pending)
+        except Exception:
+            self._requeue(pending)
+            raise
+        STAGE_LATEST_STATE_FLUSH.observe(time.perf_counter() - started)
+        return len(pending)
+
+    async def run_flusher(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as exc:
+                logger.warning("Latest state flush failed (%s); will retry", exc)
+
+    def _requeue(self, pending: List[BusTelemetry]) -> None:
+        with self._lock:
+            for state in pending:
+                if state.bus_id not in self._dirty:
+                    self._dirty[state.bus_id] = state
+
+
+@lru_cache()
+def get_latest_state_store() -> LatestStateStore:
+    settings = get_settings()
+    max_age = settings.latest_state_max_age if worker_count(settings) > 1 else 0.0
+    return LatestStateStore(get_session_factory(), max_age=max_age, miss_ttl=settings.latest_state_miss_ttl)
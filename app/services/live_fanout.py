@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List
+
+import asyncpg
+
+from core.config import get_settings
+from schemas.telemetry import BusTelemetry
+from services.live_hub import LiveTelemetryHub, get_live_hub
+
+logger = logging.getLogger(__name__)
+
+LIVE_TELEMETRY_CHANNEL = "live_telemetry"
+# Postgres refuses NOTIFY payloads of 8000 bytes or more; JSON here is pure ASCII, so characters are bytes.
+MAX_NOTIFY_BYTES = 7900
+
+
+class LiveFanout:
+    # A worker's hub only sees what that worker ingests; NOTIFY carries the points to every other worker's hub.
+    # Outgoing points are conflated per bus and flushed each interval, and only while another worker has
+    # subscribers: those announce themselves on the same channel every interval.
+    def __init__(self, hub: LiveTelemetryHub, interval: float):
+        self._hub = hub
+        self._interval = interval
+        self._origin = uuid.uuid4().hex
+        self._pending: Dict[str, BusTelemetry] = {}
+        self._remote_subscribers_until = 0.0
+
+    def offer(self, telemetries: List[BusTelemetry]) -> None:
+        if time.monotonic() >= self._remote_subscribers_until:
+            return
+        for telemetry in telemetries:
+            current = self._pending.get(telemetry.bus_id)
+            if current is None or current.timestamp <= telemetry.timestamp:
+                self._pending[telemetry.bus_id] = telemetry
+
+    def announcement(self) -> str:
+        return json.dumps({"o": self._origin, "s": 1})
+
+    def drain(self) -> List[str]:
+        pending, self._pending = self._pending, {}
+        head = '{"o":"%s","p":[' % self._origin
+        payloads: List[str] = []
+        rows: List[str] = []
+        size = len(head) + 2
+        for telemetry in pending.values():
+            row = json.dumps(
+                [
+                    telemetry.bus_id,
+                    telemetry.latitude,
+                    telemetry.longitude,
+                    telemetry.temperature_c,
+                    telemetry.smoke_detected,
+                    telemetry.timestamp.isoformat(),
+                ],
+                separators=(",", ":"),
+            )
+            if rows and size + len(row) + 1 > MAX_NOTIFY_BYTES:
+                payloads.append(head + ",".join(rows) + "]}")
+                rows = []
+                size = len(head) + 2
+            rows.append(row)
+            size += len(row) + 1
+        if rows:
+            payloads.append(head + ",".join(rows) + "]}")
+        return payloads
+
+    def receive(self, payload: str) -> None:
+        message = json.loads(payload)
+        if message["o"] == self._origin:
+            return
+        if "s" in message:
+            self._remote_subscribers_until = time.monotonic() + 3 * self._interval
+            return
+        self._hub.deliver(
+            [
+                BusTelemetry(
+                    bus_id=bus_id,
+                    latitude=latitude,
+                    longitude=longitude,
+                    temperature_c=temperature_c,
+                    smoke_detected=smoke_detected,
+                    timestamp=datetime.fromisoformat(timestamp),
+                )
+                for bus_id, latitude, longitude, temperature_c, smoke_detected, timestamp in message["p"]
+            ]
+        )
+
+    async def run(self, dsn: str) -> None:
+        def on_notify(connection, pid, channel, payload) -> None:
+            try:
+                self.receive(payload)
+            except Exception as exc:
+                logger.warning("Dropping malformed live telemetry notification (%s)", exc)
+
+        self._hub.forward = self.offer
+        try:
+            while True:
+                connection = None
+                try:
+                    connection = await asyncpg.connect(dsn)
+                    await connection.add_listener(LIVE_TELEMETRY_CHANNEL, on_notify)
+                    while True:
+                        await asyncio.sleep(self._interval)
+                        payloads = self.drain()
+                        if self._hub.subscriber_count:
+                            payloads.append(self.announcement())
+                        if payloads:
+                            await connection.executemany(
+                                "SELECT pg_notify($1, $2)", [(LIVE_TELEMETRY_CHANNEL, p) for p in payloads]
+                            )
+                        else:
+                            # Listening alone never notices a dead socket.
+                            await connection.fetchval("SELECT 1")
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.warning("Live telemetry fan-out failed (%s); reconnecting in %ss", exc, self._interval)
+                finally:
+                    if connection is not None:
+                        connection.terminate()
+                await asyncio.sleep(self._interval)
+        finally:
+            self._hub.forward = None
+
+
+@lru_cache()
+def get_live_fanout() -> LiveFanout:
+    return LiveFanout(get_live_hub(), get_settings().live_fanout_interval)
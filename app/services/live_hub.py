@@ -0,0 +1,103 @@
+import asyncio
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set
+
+from core.config import get_settings
+from schemas.telemetry import BusTelemetry
+
+
+class LiveSubscription:
+    def __init__(self, bus_ids: Optional[FrozenSet[str]], max_pending: int):
+        self.bus_ids = bus_ids
+        self._max_pending = max_pending
+        # Pending updates are conflated per bus: a slow consumer only ever sees the newest point.
+        self._pending: OrderedDict[str, BusTelemetry] = OrderedDict()
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.conflated = 0
+        self.dropped = 0
+
+    def offer(self, telemetry: BusTelemetry) -> None:
+        current = self._pending.get(telemetry.bus_id)
+        if current is not None:
+            if current.timestamp <= telemetry.timestamp:
+                self._pending[telemetry.bus_id] = telemetry
+            self.conflated += 1
+        else:
+            self._pending[telemetry.bus_id] = telemetry
+            if len(self._pending) > self._max_pending:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> List[BusTelemetry]:
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                return []
+        self._ready.clear()
+        batch = list(self._pending.values())
+        self._pending.clear()
+        return batch
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+
+class LiveTelemetryHub:
+    def __init__(self, max_pending: int):
+        self._max_pending = max_pending
+        self._by_bus: Dict[str, Set[LiveSubscription]] = {}
+        self._all: Set[LiveSubscription] = set()
+        # Set while other workers' subscribers need this worker's points (services.live_fanout).
+        self.forward: Optional[Callable[[List[BusTelemetry]], None]] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._all) + sum(len(subs) for subs in self._by_bus.values())
+
+    def subscribe(self, bus_ids: Optional[Iterable[str]] = None) -> LiveSubscription:
+        subscription = LiveSubscription(frozenset(bus_ids) if bus_ids is not None else None, self._max_pending)
+        if subscription.bus_ids is None:
+            self._all.add(subscription)
+        else:
+            for bus_id in subscription.bus_ids:
+                self._by_bus.setdefault(bus_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LiveSubscription) -> None:
+        subscription.close()
+        if subscription.bus_ids is None:
+            self._all.discard(subscription)
+            return
+        for bus_id in subscription.bus_ids:
+            subs = self._by_bus.get(bus_id)
+            if subs is None:
+                continue
+            subs.discard(subscription)
+            if not subs:
+                del self._by_bus[bus_id]
+
+    def publish(self, telemetries: Iterable[BusTelemetry]) -> None:
+        if self.forward is not None:
+            telemetries = list(telemetries)
+            self.forward(telemetries)
+        self.deliver(telemetries)
+
+    # Never blocks: offers only touch in-memory buffers.
+    def deliver(self, telemetries: Iterable[BusTelemetry]) -> None:
+        if not self._all and not self._by_bus:
+            return
+        for telemetry in telemetries:
+            for subscription in self._all:
+                subscription.offer(telemetry)
+            for subscription in self._by_bus.get(telemetry.bus_id, ()):
+                subscription.offer(telemetry)
+
+
+@lru_cache()
+def get_live_hub() -> LiveTelemetryHub:
+    return LiveTelemetryHub(max_pending=get_settings().live_max_pending_per_subscriber)
@@ -0,0 +1,34 @@
+from typing import AsyncIterator, Optional
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    # Yields one item per line; None marks a line that exceeded max_line_bytes and was discarded.
+    buffer = bytearray()
+    overflow = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline == -1:
+                break
+            if overflow:
+                overflow = False
+                yield None
+            else:
+                buffer += chunk[start:newline]
+                if len(buffer) > max_line_bytes:
+                    yield None
+                else:
+                    yield bytes(buffer)
+            buffer.clear()
+            start = newline + 1
+        if overflow:
+            continue
+        buffer += chunk[start:]
+        if len(buffer) > max_line_bytes:
+            buffer.clear()
+            overflow = True
+    if overflow:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
@@ -0,0 +1,113 @@
+import asyncio
+from functools import lru_cache
+from typing import Dict
+
+from prometheus_client import REGISTRY, Counter, Gauge
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from db.session import get_engine, get_ingest_log, get_write_spool
+from services.admission import get_ingest_admission, get_ingest_rate_limiter
+from services.bus_credential_cache import get_bus_credential_cache
+from services.dedup import get_telemetry_deduplicator
+from services.live_hub import get_live_hub
+
+
+def _counter(name: str, documentation: str, value: float) -> CounterMetricFamily:
+    return CounterMetricFamily(name, documentation, value=value)
+
+
+def _gauge(name: str, documentation: str, value: float) -> GaugeMetricFamily:
+    return GaugeMetricFamily(name, documentation, value=value)
+
+
+class PipelineCollector:
+    # Reads the counters the pipeline already keeps, so none of this costs anything between scrapes.
+    def describe(self):
+        return []
+
+    def collect(self):
+        dedup = get_telemetry_deduplicator().stats()
+        yield _counter("telemetry_dedup_checked", "Points passed through the dedup stage", dedup.checked)
+        yield _counter("telemetry_dedup_duplicates", "Points dropped as already ingested", dedup.duplicates)
+        yield _counter("telemetry_dedup_evicted", "Dedup keys evicted by age or capacity", dedup.evicted)
+        yield _gauge("telemetry_dedup_tracked_keys", "Dedup keys currently held", dedup.tracked_keys)
+
+        spool = get_write_spool().stats()
+        yield _gauge("influx_spool_batches", "Spooled write batches waiting for replay", spool.batches)
+        yield _gauge("influx_spool_bytes", "Line protocol bytes waiting for replay", spool.bytes)
+        yield _gauge("influx_spool_oldest_age_seconds", "Age of the oldest spooled batch", spool.oldest_age_seconds or 0)
+        yield _gauge("influx_spool_diverting", "1 while new writes go to the spool", int(spool.diverting))
+        yield _gauge("influx_write_pending_lines", "Points queued in the batching write API", spool.pending_lines)
+        yield _counter("influx_spool_spooled", "Batches written to the spool", spool.spooled_total)
+        yield _counter("influx_spool_replayed", "Spooled batches replayed to Influx", spool.replayed_total)
+        yield _counter("influx_spool_corrupt", "Torn or corrupt spool records dropped", spool.corrupt_total)
+        yield _counter("influx_spool_rejected", "Batches Influx refused, dead-lettered", spool.rejected_total)
+
+        shed = get_ingest_admission().shed
+        yield _counter("ingest_admission_shed", "Requests rejected because the pipeline was saturated", shed)
+        limited = get_ingest_rate_limiter().limited
+        yield _counter("ingest_rate_limited", "Token bucket acquisitions that had to wait", limited)
+        ingest_log = get_ingest_log()
+        if ingest_log is not None:
+            backlog = ingest_log.backlog_bytes()
+            yield _gauge("ingest_log_backlog_bytes", "Ingest log bytes not yet committed by stream processors", backlog)
+
+        yield _gauge("live_subscribers", "Open live telemetry subscriptions", get_live_hub().subscriber_count)
+        yield _gauge("bus_credential_cache_entries", "Bus credentials held in memory", len(get_bus_credential_cache()))
+
+        pool = get_engine().pool
+        yield _gauge("db_pool_size", "Configured Postgres pool size", pool.size())
+        yield _gauge("db_pool_checked_out", "Postgres connections in use", pool.checkedout())
+        yield _gauge("db_pool_overflow", "Postgres connections opened beyond the pool size", pool.overflow())
+
+
+# Figures every worker reads from the same place rather than holding a share of.
+_SHARED_GAUGES = frozenset({"ingest_log_backlog_bytes"})
+
+
+class PipelinePublisher:
+    # With several workers a scrape reads the shared multiprocess files, not one worker's pipeline, so each
+    # worker copies its pipeline figures there on an interval: counters by increment, gauges per live process.
+    def __init__(self, collector: PipelineCollector):
+        self._collector = collector
+        self._counters: Dict[str, Counter] = {}
+        self._gauges: Dict[str, Gauge] = {}
+        self._published: Dict[str, float] = {}
+
+    def publish(self) -> None:
+        for family in self._collector.collect():
+            value = family.samples[0].value
+            if family.type == "counter":
+                counter = self._counters.get(family.name)
+                if counter is None:
+                    counter = Counter(family.name, family.documentation, registry=None)
+                    self._counters[family.name] = counter
+                delta = value - self._published.get(family.name, 0.0)
+                if delta > 0:
+                    counter.inc(delta)
+                self._published[family.name] = value
+                continue
+            gauge = self._gauges.get(family.name)
+            if gauge is None:
+                mode = "livemax" if family.name in _SHARED_GAUGES else "livesum"
+                gauge = Gauge(family.name, family.documentation, registry=None, multiprocess_mode=mode)
+                self._gauges[family.name] = gauge
+            gauge.set(value)
+
+    async def run(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.publish)
+            await asyncio.sleep(interval)
+
+
+@lru_cache()
+def get_pipeline_publisher() -> PipelinePublisher:
+    return PipelinePublisher(PipelineCollector())
+
+
+@lru_cache()
+def get_pipeline_collector() -> PipelineCollector:
+    collector = PipelineCollector()
+    REGISTRY.register(collector)
+    return collector
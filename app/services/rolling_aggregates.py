@@ -0,0 +1,117 @@
+import math
+import threading
+import time
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+from core.config import get_settings, worker_count
+from schemas.telemetry import BusTelemetry
+
+
+def window_start_minute(now: float, window_seconds: float) -> int:
+    # Aggregate windows have minute resolution on every path: the last ceil(window / 1m) minutes, the current
+    # partial one included. The Influx fallback starts at the same minute, so answers do not depend on which path
+    # served them.
+    return int(now // 60) - math.ceil(window_seconds / 60) + 1
+
+
+class _MinuteRing:
+    # One slot per minute, reused modulo the ring size; a slot is valid only while its minute tag matches.
+    __slots__ = ("minutes", "counts", "sums", "mins", "maxs", "smoke")
+
+    def __init__(self, size: int):
+        self.minutes = array("i", [-1]) * size
+        self.counts = array("I", [0]) * size
+        self.sums = array("d", [0.0]) * size
+        self.mins = array("f", [0.0]) * size
+        self.maxs = array("f", [0.0]) * size
+        self.smoke = array("I", [0]) * size
+
+
+class RollingAggregates:
+    def __init__(self, retention_minutes: int, clock=time.time):
+        self._size = retention_minutes
+        self._clock = clock
+        self._rings: Dict[str, _MinuteRing] = {}
+        self._lock = threading.Lock()
+        # Minutes before this one may have data we never saw, so windows reaching back there fall back to Influx.
+        self._first_full_minute = int(clock() // 60) + 1
+
+    def add_many(self, telemetries: Iterable[BusTelemetry]) -> None:
+        now_minute = int(self._clock() // 60)
+        oldest = now_minute - self._size + 1
+        with self._lock:
+            for telemetry in telemetries:
+                minute = int(telemetry.timestamp.timestamp() // 60)
+                # Future timestamps would share a slot with a live minute and wipe its counts; no window reaches
+                # them yet, and Influx still has them once it does.
+                if minute < oldest or minute > now_minute:
+                    continue
+                ring = self._rings.get(telemetry.bus_id)
+                if ring is None:
+                    ring = _MinuteRing(self._size)
+                    self._rings[telemetry.bus_id] = ring
+                slot = minute % self._size
+                value = telemetry.temperature_c
+                if ring.minutes[slot] != minute:
+                    ring.minutes[slot] = minute
+                    ring.counts[slot] = 1
+                    ring.sums[slot] = value
+                    ring.mins[slot] = value
+                    ring.maxs[slot] = value
+                    ring.smoke[slot] = int(telemetry.smoke_detected)
+                    continue
+                ring.counts[slot] += 1
+                ring.sums[slot] += value
+                if value < ring.mins[slot]:
+                    ring.mins[slot] = value
+                if value > ring.maxs[slot]:
+                    ring.maxs[slot] = value
+                if telemetry.smoke_detected:
+                    ring.smoke[slot] += 1
+
+    def covers(self, window_seconds: float) -> bool:
+        if not 0 < math.ceil(window_seconds / 60) <= self._size:
+            return False
+        return window_start_minute(self._clock(), window_seconds) >= self._first_full_minute
+
+    def query(self, bus_id: str, window_seconds: float) -> Optional[Dict[str, float]]:
+        now = self._clock()
+        now_minute = int(now // 60)
+        count = 0
+        total = 0.0
+        smoke = 0
+        low = math.inf
+        high = -math.inf
+        with self._lock:
+            ring = self._rings.get(bus_id)
+            if ring is None:
+                return None
+            for minute in range(window_start_minute(now, window_seconds), now_minute + 1):
+                slot = minute % self._size
+                if ring.minutes[slot] != minute:
+                    continue
+                count += ring.counts[slot]
+                total += ring.sums[slot]
+                smoke += ring.smoke[slot]
+                low = min(low, ring.mins[slot])
+                high = max(high, ring.maxs[slot])
+        if count == 0:
+            return None
+        return {
+            "count": float(count),
+            "temperature_sum": total,
+            "temperature_min": round(low, 2),
+            "temperature_max": round(high, 2),
+            "smoke_events": float(smoke),
+        }
+
+
+@lru_cache()
+def get_rolling_aggregates() -> Optional[RollingAggregates]:
+    # None when other API workers take part of the ingest: no single process would see every point.
+    settings = get_settings()
+    if worker_count(settings) > 1:
+        return None
+    return RollingAggregates(retention_minutes=settings.rolling_aggregate_retention_minutes)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from typing import Dict, List, Optional
+
+from core.config import get_settings
+from db.session import get_influx_client, get_session_factory
+from repos.ingest_log import PartitionReader, PartitionedLog
+from repos.influx_repository import TelemetryRepository
+from services.dedup import TelemetryDeduplicator
+from services.latest_state_store import LatestStateStore
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionWorker:
+    # Owns a fixed set of partitions, so every bus is handled by exactly one worker in arrival order.
+    def __init__(
+        self,
+        readers: List[PartitionReader],
+        repository: TelemetryRepository,
+        deduplicator: TelemetryDeduplicator,
+        latest_state: LatestStateStore,
+        batch_size: int,
+        poll_interval: float,
+    ):
+        self._readers = readers
+        self._repository = repository
+        self._deduplicator = deduplicator
+        self._latest_state = latest_state
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+
+    async def run(self, stop: asyncio.Event) -> None:
+        failures = 0
+        while not stop.is_set():
+            try:
+                processed = await self.process_once()
+                failures = 0
+            except Exception as exc:
+                # Nothing was committed, so the same points are read again after the backoff.
+                failures += 1
+                delay = min(2 ** failures, 30)
+                logger.warning("Stream processing failed (%s); retrying in %ss", exc, delay)
+                processed = 0
+                await _wait(stop, delay)
+                continue
+            if not processed:
+                await _wait(stop, self._poll_interval)
+
+    async def process_once(self) -> int:
+        loop = asyncio.get_running_loop()
+        processed = 0
+        for reader in self._readers:
+            points, position = reader.poll(self._batch_size)
+            if points:
+                fresh, _ = self._deduplicator.filter(points)
+                if fresh:
+                    try:
+                        await loop.run_in_executor(None, self._repository.write_bus_telemetry_batch_sync, fresh)
+                    except Exception:
+                        self._deduplicator.forget(fresh)
+                        raise
+                    self._latest_state.update_many(fresh)
+                processed += len(points)
+            reader.commit(position)
+        if processed:
+            try:
+                await self._latest_state.flush()
+            except Exception as exc:
+                logger.warning("Latest state flush failed (%s); will retry", exc)
+        return processed
+
+
+async def _wait(stop: asyncio.Event, seconds: float) -> None:
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+def assign_partitions(partitions: int, workers: int) -> List[List[int]]:
+    return [[partition for partition in range(partitions) if partition % workers == index] for index in range(workers)]
+
+
+async def _run_worker(partitions: List[int]) -> None:
+    settings = get_settings()
+    log = PartitionedLog(settings.ingest_log_dir, settings.ingest_log_partitions, settings.ingest_log_segment_bytes)
+    worker = PartitionWorker(
+        readers=[PartitionReader(log.partition_dir(partition)) for partition in partitions],
+        repository=TelemetryRepository(),
+        deduplicator=TelemetryDeduplicator(
+            window=settings.dedup_window_seconds, max_keys_per_bus=settings.dedup_max_keys_per_bus
+        ),
+        latest_state=LatestStateStore(get_session_factory()),
+        batch_size=settings.stream_processor_batch_size,
+        poll_interval=settings.stream_processor_poll_interval,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await worker.run(stop)
+    finally:
+        get_influx_client().close()
+
+
+def worker_main(partitions: List[int]) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    asyncio.run(_run_worker(partitions))
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    settings = get_settings()
+    if settings.ingest_log_partitions <= 0:
+        raise SystemExit("Set INGEST_LOG_PARTITIONS to run stream processors")
+    workers = max(1, min(settings.stream_processor_workers, settings.ingest_log_partitions))
+    assignments = assign_partitions(settings.ingest_log_partitions, workers)
+    # spawn, not fork: each worker builds its own Influx client, DB engine and event loop.
+    context = multiprocessing.get_context("spawn")
+    processes: Dict[int, Optional[multiprocessing.process.BaseProcess]] = {index: None for index in range(workers)}
+    stopping = False
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        for index, process in processes.items():
+            if process is not None and process.is_alive():
+                continue
+            if process is not None:
+                logger.warning("Stream processor %s exited with %s; restarting", index, process.exitcode)
+            process = context.Process(
+                target=worker_main, args=(assignments[index],), name=f"stream-processor-{index}", daemon=False
+            )
+            process.start()
+            processes[index] = process
+            logger.info("Stream processor %s owns partitions %s", index, assignments[index])
+        time.sleep(1.0)
+
+    for process in processes.values():
+        if process is not None and process.is_alive():
+            process.terminate()
+    for process in processes.values():
+        if process is not None:
+            process.join(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
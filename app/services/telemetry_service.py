@@ -1,46 +1,386 @@
-from typing import List, Optional
+import asyncio
+import base64
+import binascii
+import json
+import math
+import re
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
 from fastapi import HTTPException, status
 from datetime import datetime, timedelta, timezone
-from repos.influx_repository import TelemetryRepository
-from schemas.telemetry import BusTelemetryIn, BusTelemetry, TelemetryAggregates
+from pydantic import TypeAdapter, ValidationError
+from core.config import get_settings
+from core.metrics import (
+    LATEST_STATE_DB,
+    LATEST_STATE_HIT,
+    LATEST_STATE_MISS,
+    ROLLING_AGGREGATES_HIT,
+    ROLLING_AGGREGATES_MISS,
+    STAGE_DEDUP,
+    STAGE_INGEST_LOG_APPEND,
+    STAGE_NORMALIZE,
+)
+from db.session import get_ingest_log
+from repos.influx_repository import AsyncTelemetryRepository
+from repos.ingest_log import PartitionedLog
+from repos.influx_rollups import RollupRegistry, RollupTier, align_down, align_up, get_rollup_registry, rollup_boundary
+from schemas.telemetry import (
+    BusTelemetryIn,
+    BusTelemetry,
+    IngestLineError,
+    IngestStreamResult,
+    TelemetryAggregates,
+)
+from schemas.telemetry_binary import FLAG_HAS_TIMESTAMP, FLAG_SMOKE, TelemetryFrame
+from schemas.telemetry_formats import TelemetryRow, rows_from_telemetry
+from services.dedup import TelemetryDeduplicator, get_telemetry_deduplicator
+from services.latest_state_store import LatestStateStore, get_latest_state_store
+from services.live_hub import LiveTelemetryHub, get_live_hub
+from services.rolling_aggregates import RollingAggregates, get_rolling_aggregates, window_start_minute
+
+
+class IngestOutcome(NamedTuple):
+    # Every normalized point, duplicates included, so a retried request gets the same answer.
+    telemetry: List[BusTelemetry]
+    duplicates: int
+
+
+DURATION_PATTERN = re.compile(r"(?:[0-9]+(?:ms|s|m|h|d|w))+")
+DURATION_PART = re.compile(r"([0-9]+)(ms|s|m|h|d|w)")
+DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+_TELEMETRY_LIST_ADAPTER = TypeAdapter(List[BusTelemetry])
+
+
+class HistoryPage(NamedTuple):
+    items: List[BusTelemetry]
+    next_cursor: Optional[str]
+
+
+class RowPage(NamedTuple):
+    rows: List[TelemetryRow]
+    next_cursor: Optional[str]
+
+
+class RangeSegment(NamedTuple):
+    start: datetime
+    stop: datetime
+    # None reads the raw bucket.
+    bucket: Optional[str]
+
 
 class TelemetryService:
-    def __init__(self, repository: TelemetryRepository):
+    def __init__(
+        self,
+        repository: AsyncTelemetryRepository,
+        latest_state: Optional[LatestStateStore] = None,
+        deduplicator: Optional[TelemetryDeduplicator] = None,
+        live_hub: Optional[LiveTelemetryHub] = None,
+        aggregates: Optional[RollingAggregates] = None,
+        rollups: Optional[RollupRegistry] = None,
+        ingest_log: Optional[PartitionedLog] = None,
+    ):
         self._repository = repository
+        self._latest_state = latest_state or get_latest_state_store()
+        self._deduplicator = deduplicator or get_telemetry_deduplicator()
+        self._live_hub = live_hub or get_live_hub()
+        self._aggregates = aggregates or get_rolling_aggregates()
+        self._rollups = rollups or get_rollup_registry()
+        self._ingest_log = ingest_log or get_ingest_log()
 
-    def ingest_bus_telemetry(self, payload: BusTelemetryIn) -> BusTelemetry:
+    async def ingest_bus_telemetry(self, payload: BusTelemetryIn) -> IngestOutcome:
+        started = time.perf_counter()
         normalized = self._normalize(payload)
-        try:
-            self._repository.write_bus_telemetry(normalized)
-        except Exception as exc:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail="Failed to persist telemetry",
-            ) from exc
-        return normalized
+        STAGE_NORMALIZE.observe(time.perf_counter() - started)
+        duplicates = await self._persist([normalized], "Failed to persist telemetry")
+        return IngestOutcome([normalized], duplicates)
 
-    def ingest_bus_telemetry_batch(self, payloads: List[BusTelemetryIn]) -> List[BusTelemetry]:
+    async def ingest_bus_telemetry_batch(self, payloads: List[BusTelemetryIn]) -> IngestOutcome:
         if not payloads:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No telemetry provided")
+        started = time.perf_counter()
         normalized = [self._normalize(payload) for payload in payloads]
-        try:
-            self._repository.write_bus_telemetry_batch(normalized)
-        except Exception as exc:
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail="Failed to persist telemetry batch",
-            ) from exc
-        return normalized
+        STAGE_NORMALIZE.observe(time.perf_counter() - started)
+        duplicates = await self._persist(normalized, "Failed to persist telemetry batch")
+        return IngestOutcome(normalized, duplicates)
+
+    async def ingest_bus_telemetry_frame(self, frame: TelemetryFrame) -> IngestOutcome:
+        if not frame.count:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No telemetry provided")
+        started = time.perf_counter()
+        normalized = self._normalize_frame(frame)
+        STAGE_NORMALIZE.observe(time.perf_counter() - started)
+        duplicates = await self._persist(normalized, "Failed to persist telemetry batch")
+        return IngestOutcome(normalized, duplicates)
 
-    def get_latest_bus_telemetry(self, bus_id: str) -> BusTelemetry:
-        latest = self._repository.get_latest_bus_telemetry(bus_id)
+    async def ingest_bus_telemetry_stream(
+        self,
+        lines: AsyncIterator[Optional[bytes]],
+        authorize: Callable[[str], Awaitable[None]],
+        throttle: Optional[Callable[[str, int], Awaitable[None]]] = None,
+    ) -> IngestStreamResult:
+        settings = get_settings()
+        chunk: List[BusTelemetry] = []
+        errors: List[IngestLineError] = []
+        accepted = 0
+        rejected = 0
+        duplicates = 0
+        stream_bus_id: Optional[str] = None
+        line_number = 0
+
+        def reject(error: str) -> None:
+            nonlocal rejected
+            rejected += 1
+            if len(errors) < settings.ingest_stream_max_errors:
+                errors.append(IngestLineError(line=line_number, error=error))
+
+        async for line in lines:
+            line_number += 1
+            if line is None:
+                reject("Line exceeds maximum length")
+                continue
+            if not line.strip():
+                continue
+            try:
+                payload = BusTelemetryIn.model_validate_json(line)
+            except ValidationError as exc:
+                reject(_summarize_validation_error(exc))
+                continue
+
+            # The first valid record authenticates the stream; it may only carry that bus.
+            if stream_bus_id is None:
+                await authorize(payload.bus_id)
+                stream_bus_id = payload.bus_id
+            elif payload.bus_id != stream_bus_id:
+                reject("Stream telemetry must belong to a single bus")
+                continue
+
+            chunk.append(self._normalize(payload))
+            if len(chunk) >= settings.ingest_stream_chunk_size:
+                if throttle is not None:
+                    await throttle(stream_bus_id, len(chunk))
+                chunk_duplicates = await self._persist(chunk, self._stream_failure(accepted))
+                accepted += len(chunk) - chunk_duplicates
+                duplicates += chunk_duplicates
+                chunk = []
+
+        if chunk:
+            if throttle is not None:
+                await throttle(stream_bus_id, len(chunk))
+            chunk_duplicates = await self._persist(chunk, self._stream_failure(accepted))
+            accepted += len(chunk) - chunk_duplicates
+            duplicates += chunk_duplicates
+
+        if accepted == 0 and rejected == 0 and duplicates == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No telemetry provided")
+        return IngestStreamResult(accepted=accepted, rejected=rejected, duplicates=duplicates, errors=errors)
+
+    async def get_latest_bus_telemetry(self, bus_id: str) -> BusTelemetry:
+        latest = self._latest_state.get(bus_id)
+        if latest is not None:
+            LATEST_STATE_HIT.inc()
+            return latest
+
+        latest = await self._latest_state.load(bus_id)
+        if latest is not None:
+            LATEST_STATE_DB.inc()
+            return latest
+
+        LATEST_STATE_MISS.inc()
+        try:
+            latest = await self._repository.get_latest_bus_telemetry(bus_id)
+        except TimeoutError as exc:
+            raise self._query_timeout() from exc
         if latest is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No telemetry found")
+        self._latest_state.update(latest)
         return latest
 
-    def get_bus_telemetry_history(
-        self, bus_id: str, start: Optional[datetime], end: Optional[datetime], limit: int
-    ) -> List[BusTelemetry]:
+    async def get_fleet_latest_telemetry(self, bus_ids: List[str]) -> List[BusTelemetry]:
+        snapshot: Dict[str, BusTelemetry] = {}
+        missing: List[str] = []
+        for bus_id in bus_ids:
+            latest = self._latest_state.get(bus_id)
+            if latest is not None:
+                snapshot[bus_id] = latest
+            else:
+                missing.append(bus_id)
+        LATEST_STATE_HIT.inc(len(snapshot))
+
+        if missing:
+            loaded = await self._latest_state.load_many(missing)
+            for latest in loaded:
+                snapshot[latest.bus_id] = latest
+            LATEST_STATE_DB.inc(len(loaded))
+            missing = [bus_id for bus_id in missing if bus_id not in snapshot]
+
+        # Silent buses stay missing from Postgres too; each one costs the Influx scan only once per miss TTL.
+        missing = self._latest_state.without_recent_misses(missing)
+        if missing:
+            LATEST_STATE_MISS.inc(len(missing))
+            try:
+                found = await self._repository.get_latest_fleet_telemetry(missing)
+            except TimeoutError as exc:
+                raise self._query_timeout() from exc
+            for latest in found:
+                snapshot[latest.bus_id] = latest
+            self._latest_state.update_many(found)
+            self._latest_state.remember_misses(bus_id for bus_id in missing if bus_id not in snapshot)
+
+        return [snapshot[bus_id] for bus_id in bus_ids if bus_id in snapshot]
+
+    async def get_bus_telemetry_history(
+        self,
+        bus_id: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        limit: int,
+        cursor: Optional[str] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[str] = None,
+    ) -> HistoryPage:
+        start, end = self._resolve_range(start, end)
+
+        if resolution is not None or max_points is not None:
+            # A downsampled range is a single page; a cursor from a raw page would be silently dropped.
+            if cursor is not None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="cursor cannot be combined with max_points or resolution",
+                )
+            return await self._get_downsampled_history(bus_id, start, end, max_points, resolution)
+
+        # Keyset pagination: pages run newest first, so the cursor becomes the exclusive stop.
+        if cursor is not None:
+            end = min(end, _decode_cursor(cursor))
+            if start >= end:
+                return HistoryPage([], None)
+
+        # Protect Influx from excessive responses
+        limit = min(max(limit, 1), 5000)
+
+        try:
+            items = await self._repository.get_bus_telemetry_history(bus_id, start, end, limit)
+        except TimeoutError as exc:
+            raise self._query_timeout() from exc
+
+        next_cursor = _encode_cursor(items[-1].timestamp) if len(items) == limit else None
+        return HistoryPage(items, next_cursor)
+
+    async def get_bus_telemetry_history_rows(
+        self,
+        bus_id: str,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        limit: int,
+        cursor: Optional[str] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[str] = None,
+    ) -> RowPage:
+        # Same paging as get_bus_telemetry_history, but raw string rows for the columnar/CSV/Arrow encoders.
+        if resolution is not None or max_points is not None:
+            page = await self.get_bus_telemetry_history(
+                bus_id, start, end, limit, cursor=cursor, max_points=max_points, resolution=resolution
+            )
+            return RowPage(rows_from_telemetry(page.items), None)
+
+        start, end = self._resolve_range(start, end)
+        if cursor is not None:
+            end = min(end, _decode_cursor(cursor))
+            if start >= end:
+                return RowPage([], None)
+        limit = min(max(limit, 1), 5000)
+
+        try:
+            rows = await self._repository.get_bus_telemetry_history_rows(bus_id, start, end, limit)
+        except TimeoutError as exc:
+            raise self._query_timeout() from exc
+
+        next_cursor = _encode_cursor(_parse_rfc3339(rows[-1][1])) if len(rows) == limit else None
+        return RowPage(rows, next_cursor)
+
+    async def _get_downsampled_history(
+        self,
+        bus_id: str,
+        start: datetime,
+        end: datetime,
+        max_points: Optional[int],
+        resolution: Optional[str],
+    ) -> HistoryPage:
+        # Every window is returned, never truncated: dropping the oldest could drop the one that saw smoke.
+        max_points = min(max(max_points or 5000, 1), 5000)
+        if resolution is not None:
+            resolution = resolution.strip()
+            every_seconds = _duration_seconds(resolution)
+            every = resolution
+            windows = _window_count(start, end, every_seconds)
+            if windows > max_points:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"resolution {resolution} gives {windows} windows over this range; at most {max_points}",
+                )
+        else:
+            every_seconds = _window_seconds(start, end, max_points)
+            every = f"{every_seconds}s"
+
+        segments = self._plan_segments(start, end, every_seconds)
+        try:
+            parts = await asyncio.gather(
+                *(
+                    self._repository.get_bus_telemetry_downsampled(
+                        bus_id, segment.start, segment.stop, every, max_points, segment.bucket
+                    )
+                    for segment in segments
+                )
+            )
+        except TimeoutError as exc:
+            raise self._query_timeout() from exc
+        if len(parts) == 1:
+            return HistoryPage(parts[0], None)
+        return HistoryPage(_merge_split_windows([item for part in parts for item in part], every_seconds), None)
+
+    def _plan_segments(self, start: datetime, end: datetime, granularity_seconds: float) -> List[RangeSegment]:
+        # Serve the settled middle of the range from the coarsest rollup tier and the ragged edges from raw data.
+        now = datetime.now(timezone.utc)
+        tier: Optional[RollupTier] = None
+        if get_settings().influx_rollups_enabled:
+            tier = self._rollups.coarsest_for(start, granularity_seconds, now)
+        if tier is None:
+            return [RangeSegment(start, end, None)]
+
+        rollup_start = align_up(tier, start)
+        rollup_stop = min(rollup_boundary(tier, now), align_down(tier, end))
+        if rollup_start >= rollup_stop:
+            return [RangeSegment(start, end, None)]
+
+        segments = [RangeSegment(rollup_start, rollup_stop, tier.bucket)]
+        if start < rollup_start:
+            segments.append(RangeSegment(start, rollup_start, None))
+        if rollup_stop < end:
+            segments.append(RangeSegment(rollup_stop, end, None))
+        return segments
+
+    def stream_bus_telemetry_history(
+        self, bus_id: str, start: Optional[datetime], end: Optional[datetime]
+    ) -> AsyncIterator[bytes]:
+        # Validate eagerly so a bad range is a 400, not a broken stream.
+        start, end = self._resolve_range(start, end)
+        return self._stream_history_rows(bus_id, start, end)
+
+    def stream_bus_telemetry_history_rows(
+        self, bus_id: str, start: Optional[datetime], end: Optional[datetime]
+    ) -> AsyncIterator[List[TelemetryRow]]:
+        start, end = self._resolve_range(start, end)
+        batch_size = get_settings().influx_stream_batch_size
+        return self._repository.iter_bus_telemetry_history_rows(bus_id, start, end, batch_size)
+
+    async def _stream_history_rows(self, bus_id: str, start: datetime, end: datetime) -> AsyncIterator[bytes]:
+        batch_size = get_settings().influx_stream_batch_size
+        async for batch in self._repository.iter_bus_telemetry_history(bus_id, start, end, batch_size):
+            yield b"".join(telemetry.model_dump_json().encode() + b"\n" for telemetry in batch)
+
+    def _resolve_range(self, start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
         if end is None:
             end = datetime.now(timezone.utc)
         if end.tzinfo is None:
@@ -53,30 +393,93 @@ class TelemetryService:
 
         if start >= end:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start must be before end")
+        return start, end
 
-        # Protect Influx from excessive responses
-        limit = min(max(limit, 1), 5000)
-
-        return self._repository.get_bus_telemetry_history(bus_id, start, end, limit)
-
-    def get_bus_telemetry_aggregates(self, bus_id: str, window: str) -> TelemetryAggregates:
+    async def get_bus_telemetry_aggregates(self, bus_id: str, window: str) -> TelemetryAggregates:
         window = window.strip()
         if not window:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="window is required")
+        window_seconds = _duration_seconds(window)
 
-        metrics = self._repository.get_bus_telemetry_aggregates(bus_id, window)
-        if metrics is None:
+        # The in-process engine only sees points when this process stores them itself.
+        if self._ingest_log is None and self._aggregates is not None and self._aggregates.covers(window_seconds):
+            ROLLING_AGGREGATES_HIT.inc()
+            totals = self._aggregates.query(bus_id, window_seconds)
+        else:
+            ROLLING_AGGREGATES_MISS.inc()
+            end = datetime.now(timezone.utc)
+            start = datetime.fromtimestamp(window_start_minute(end.timestamp(), window_seconds) * 60, tz=timezone.utc)
+            segments = self._plan_segments(
+                start,
+                end,
+                window_seconds / get_settings().rollup_min_windows,
+            )
+            try:
+                parts = await asyncio.gather(
+                    *(
+                        self._repository.get_rollup_aggregates(bus_id, segment.bucket, segment.start, segment.stop)
+                        if segment.bucket
+                        else self._repository.get_bus_telemetry_aggregates(bus_id, segment.start, segment.stop)
+                        for segment in segments
+                    )
+                )
+            except TimeoutError as exc:
+                raise self._query_timeout() from exc
+            totals = _merge_totals([part for part in parts if part])
+        if totals is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No telemetry found")
 
+        count = int(totals["count"])
         return TelemetryAggregates(
             bus_id=bus_id,
             window=window,
-            count=int(metrics.get("count", 0)),
-            temperature_min=metrics.get("temperature_min"),
-            temperature_avg=metrics.get("temperature_avg"),
-            temperature_max=metrics.get("temperature_max"),
+            count=count,
+            temperature_min=totals.get("temperature_min"),
+            temperature_avg=totals["temperature_sum"] / count,
+            temperature_max=totals.get("temperature_max"),
+            smoke_events=int(totals.get("smoke_events", 0)),
         )
 
+    async def _persist(self, normalized: List[BusTelemetry], failure_detail: str) -> int:
+        if self._ingest_log is not None:
+            return await self._enqueue(normalized, failure_detail)
+        started = time.perf_counter()
+        fresh, duplicates = self._deduplicator.filter(normalized)
+        STAGE_DEDUP.observe(time.perf_counter() - started)
+        if not fresh:
+            return duplicates
+        try:
+            await self._repository.write_bus_telemetry_batch(fresh)
+        except Exception as exc:
+            self._deduplicator.forget(fresh)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=failure_detail,
+            ) from exc
+        self._latest_state.update_many(fresh)
+        if self._aggregates is not None:
+            self._aggregates.add_many(fresh)
+        self._live_hub.publish(fresh)
+        return duplicates
+
+    async def _enqueue(self, normalized: List[BusTelemetry], failure_detail: str) -> int:
+        # Stream-processor mode: the partition owner dedups and stores the points, so duplicates are not known here.
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._ingest_log.append, normalized)
+        except OSError as exc:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=failure_detail) from exc
+        STAGE_INGEST_LOG_APPEND.observe(time.perf_counter() - started)
+        self._latest_state.warm(normalized)
+        self._live_hub.publish(normalized)
+        return 0
+
+    def _stream_failure(self, accepted: int) -> str:
+        return f"Failed to persist telemetry stream after {accepted} accepted lines"
+
+    def _query_timeout(self) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Telemetry query timed out")
+
     def _normalize(self, payload: BusTelemetryIn) -> BusTelemetry:
         lat = round(payload.latitude, 6)
         lon = round(payload.longitude, 6)
@@ -94,3 +497,115 @@ class TelemetryService:
             smoke_detected=bool(payload.smoke_detected),
             timestamp=timestamp,
         )
+
+    def _normalize_frame(self, frame: TelemetryFrame) -> List[BusTelemetry]:
+        # Straight from the decoded columns, already range-checked, to the records _normalize would produce.
+        # One validation call over plain dicts beats building each model on its own.
+        now = datetime.now(timezone.utc)
+        return _TELEMETRY_LIST_ADAPTER.validate_python(
+            [
+                {
+                    "bus_id": frame.bus_id,
+                    "latitude": round(latitude, 6),
+                    "longitude": round(longitude, 6),
+                    "temperature_c": centi_degrees / 100,
+                    "smoke_detected": bool(flags & FLAG_SMOKE),
+                    "timestamp": (
+                        datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc)
+                        if flags & FLAG_HAS_TIMESTAMP
+                        else now
+                    ),
+                }
+                for timestamp_ms, latitude, longitude, centi_degrees, flags in zip(
+                    frame.timestamps_ms, frame.latitudes, frame.longitudes, frame.centi_degrees, frame.flags
+                )
+            ]
+        )
+
+
+def _summarize_validation_error(exc: ValidationError) -> str:
+    first = exc.errors()[0]
+    location = ".".join(str(part) for part in first.get("loc", ()))
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+def _merge_totals(parts: List[Dict[str, float]]) -> Optional[Dict[str, float]]:
+    parts = [part for part in parts if part.get("count")]
+    if not parts:
+        return None
+    return {
+        "count": sum(part["count"] for part in parts),
+        "temperature_sum": sum(part["temperature_sum"] for part in parts),
+        "temperature_min": min(part["temperature_min"] for part in parts),
+        "temperature_max": max(part["temperature_max"] for part in parts),
+        "smoke_events": sum(part.get("smoke_events", 0.0) for part in parts),
+    }
+
+
+def _window_count(start: datetime, end: datetime, every_seconds: int) -> int:
+    # aggregateWindow aligns windows to the epoch, so [start, end) can touch one more than range / every.
+    return max(math.ceil(end.timestamp() / every_seconds) - math.floor(start.timestamp() / every_seconds), 1)
+
+
+def _window_seconds(start: datetime, end: datetime, max_points: int) -> int:
+    # The finest whole-second window whose aligned windows over the range number at most max_points.
+    every = max(math.ceil((end - start).total_seconds() / max_points), 1)
+    while _window_count(start, end, every) > max_points:
+        every += 1
+    return every
+
+
+def _merge_split_windows(items: List[BusTelemetry], every_seconds: int) -> List[BusTelemetry]:
+    # A window straddling a rollup/raw segment boundary comes back once from each side: keep the later fix,
+    # average the two means and keep smoke if either half saw it. Newest first, like a single query.
+    merged: Dict[int, BusTelemetry] = {}
+    for item in sorted(items, key=lambda t: t.timestamp):
+        window = math.floor(item.timestamp.timestamp() / every_seconds)
+        earlier = merged.get(window)
+        if earlier is not None:
+            item = item.model_copy(
+                update={
+                    "timestamp": earlier.timestamp,
+                    "temperature_c": round((earlier.temperature_c + item.temperature_c) / 2, 2),
+                    "smoke_detected": earlier.smoke_detected or item.smoke_detected,
+                }
+            )
+        merged[window] = item
+    return sorted(merged.values(), key=lambda t: t.timestamp, reverse=True)
+
+
+def _encode_cursor(timestamp: datetime) -> str:
+    raw = json.dumps({"t": timestamp.isoformat()}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> datetime:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp = datetime.fromisoformat(json.loads(raw)["t"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor") from exc
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def _parse_rfc3339(value: str) -> datetime:
+    # Influx sends up to nanoseconds; datetime keeps microseconds.
+    head, dot, fraction = value.rstrip("Z").partition(".")
+    if dot:
+        head = f"{head}.{fraction[:6]}"
+    return datetime.fromisoformat(head).replace(tzinfo=timezone.utc)
+
+
+def _duration_seconds(duration: str) -> float:
+    # Also keeps anything that is not a plain Flux duration literal out of the query text.
+    if not DURATION_PATTERN.fullmatch(duration):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Duration must look like 30s, 15m, 1h or 1h30m",
+        )
+    seconds = sum(int(amount) * DURATION_SECONDS[unit] for amount, unit in DURATION_PART.findall(duration))
+    if seconds <= 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Duration must be positive")
+    return seconds
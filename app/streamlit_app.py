@@ -69,33 +69,41 @@ with st.sidebar:
         bus_keys[bus_id] = st.text_input(f"{bus_id} key", value=default_key)
 
     st.subheader("Load Test")
-    total_requests = st.number_input("Total requests", min_value=1, max_value=20000, value=10000, step=500)
-    concurrency = st.number_input("Concurrency", min_value=1, max_value=1000, value=100, step=10)
+    fleet_buses = st.number_input("Simulated buses", min_value=1, max_value=20000, value=2000, step=100)
+    sample_interval = st.number_input("Seconds between fixes", min_value=0.1, max_value=60.0, value=5.0, step=0.5)
+    query_rate = st.number_input("Queries per second", min_value=0.0, max_value=5000.0, value=20.0, step=5.0)
+    duration = st.number_input("Duration (s)", min_value=5, max_value=3600, value=60, step=10)
+    admin_key = st.text_input("Admin API key", value=os.getenv("ADMIN_API_KEY", ""), type="password")
+    st.caption("Simulated buses are provisioned through the admin bus import (the server's ADMIN_API_KEY).")
     if st.button("Run load test", type="primary"):
-        env = os.environ.copy()
-        env.update(
-            {
-                "INGEST_TOTAL": str(total_requests),
-                "INGEST_CONCURRENCY": str(concurrency),
-                "INGEST_BASE_URL": base_url,
-                "INGEST_API_KEY_BUS1": bus_keys.get("bus-1", ""),
-                "INGEST_API_KEY_BUS2": bus_keys.get("bus-2", ""),
-                "INGEST_API_KEY_BUS3": bus_keys.get("bus-3", ""),
-            }
-        )
-        with st.spinner("Running load test..."):
-            result = subprocess.run(
-                [sys.executable, "-u", "tests/load_ingest.py"],
-                cwd=os.path.dirname(os.path.abspath(__file__)),
-                capture_output=True,
-                text=True,
-                env=env,
-            )
-        if result.returncode == 0:
-            st.success(result.stdout or "Load test completed")
+        if not admin_key:
+            st.error("Set the admin API key to the server's ADMIN_API_KEY to provision the simulated buses.")
         else:
-            st.error("Load test failed")
-            st.code(result.stdout + "\n" + result.stderr)
+            env = os.environ.copy()
+            env.update(
+                {
+                    "FLEET_BASE_URL": base_url,
+                    "FLEET_BUSES": str(fleet_buses),
+                    "FLEET_SAMPLE_INTERVAL": str(sample_interval),
+                    "FLEET_QUERY_RATE": str(query_rate),
+                    "FLEET_DURATION": str(duration),
+                    "FLEET_ADMIN_API_KEY": admin_key,
+                }
+            )
+            with st.spinner("Running load test..."):
+                result = subprocess.run(
+                    [sys.executable, "-u", "tests/load_fleet.py"],
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                    capture_output=True,
+                    text=True,
+                    env=env,
+                )
+            if result.returncode == 0:
+                st.success("Load test completed")
+                st.code(result.stdout)
+            else:
+                st.error("Load test failed")
+                st.code(result.stdout + "\n" + result.stderr)
 
 
 st.markdown("### Manual Ingest")
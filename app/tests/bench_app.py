@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The real app with both databases faked as in tests/bench_fakes.py, for benchmarks that need actual server
+# processes. Every worker imports this afresh, so each installs its own fakes:
+#   python serve.py --app tests.bench_app:app --workers 4
+os.environ.setdefault("INFLUX_SPOOL_DIR", tempfile.mkdtemp(prefix="bench-spool-"))
+os.environ["INGEST_LOG_PARTITIONS"] = "0"
+os.environ["INGEST_RATE_PER_BUS"] = "0"
+os.environ["INFLUX_URL"] = "http://influx.bench:8086"
+os.environ["INFLUX_ROLLUPS_ENABLED"] = "false"
+os.environ["BUS_CREDENTIAL_LISTEN"] = "false"
+
+from core.config import get_settings
+
+# A single worker runs inside serve.py, which has already read the settings.
+get_settings.cache_clear()
+
+import main
+from controllers import bus_controller, live_controller
+from db.session import get_influx_client
+from repos import influx_repository
+from services import bus_credential_cache, latest_state_store
+from tests.bench_fakes import FakeInfluxPool, FakeSessionFactory, NullWriteApi
+
+sessions = FakeSessionFactory()
+for module in (main, bus_controller, live_controller, bus_credential_cache, latest_state_store):
+    module.get_session_factory = lambda: sessions
+
+get_influx_client().api_client.rest_client.pool_manager = FakeInfluxPool(rows=100)
+write_api = NullWriteApi()
+influx_repository.get_influx_write_api = lambda: write_api
+main.get_influx_write_api = lambda: write_api
+
+app = main.app
@@ -0,0 +1,201 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import urllib3
+
+from db.session import get_write_spool
+from repos.bus_repository import DEFAULT_BUS_KEYS
+
+# In-process stand-ins for the two databases. Influx is faked below the client library (its urllib3 pool),
+# so query building, CSV parsing and record mapping all run for real; Postgres is faked at the session.
+
+_ANNOTATED_HEADER = (
+    "#datatype,string,long,dateTime:RFC3339,dateTime:RFC3339,dateTime:RFC3339,string,string,"
+    "double,double,long,double\r\n"
+    "#group,false,false,true,true,false,true,true,false,false,false,false\r\n"
+    "#default,_result,,,,,,,,,,\r\n"
+    ",result,table,_start,_stop,_time,_measurement,bus_id,latitude,longitude,smoke_detected,temperature_c\r\n"
+)
+_PLAIN_HEADER = ",result,table,bus_id,_time,latitude,longitude,smoke_detected,temperature_c\r\n"
+# reduce() output of the aggregate queries: one row per field.
+_AGGREGATES = (
+    "#datatype,string,long,string,double,double,double,double\r\n"
+    "#group,false,false,true,false,false,false,false\r\n"
+    "#default,_result,,,,,,\r\n"
+    ",result,table,_field,count,sum,min,max\r\n"
+    ",,0,temperature_c,3600,86400,18.5,29.5\r\n"
+    ",,1,smoke_detected,3600,12,0,1\r\n"
+    "\r\n"
+).encode()
+_BUS_COLUMNS = ("bus_id", "plate_number", "driver_name", "route_name", "api_key")
+
+
+class FakeInfluxPool:
+    # Answers history queries with the same pivoted telemetry rows and aggregate queries with fixed totals;
+    # writes and pings succeed.
+    def __init__(self, rows: int, bus_id: str = "bus-1"):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        stop = start + timedelta(days=1)
+        annotated = [_ANNOTATED_HEADER]
+        plain = [_PLAIN_HEADER]
+        for index in range(rows):
+            timestamp = (stop - timedelta(seconds=index + 1)).isoformat().replace("+00:00", "Z")
+            values = f"{25.0 + index * 1e-5:.6f},{55.0 + index * 1e-5:.6f},{index % 2},{20 + index % 100 / 10:.2f}"
+            annotated.append(
+                f",,0,{start.isoformat()},{stop.isoformat()},{timestamp},bus_telemetry,{bus_id},{values}\r\n"
+            )
+            plain.append(f",_result,0,{bus_id},{timestamp},{values}\r\n")
+        annotated.append("\r\n")
+        plain.append("\r\n")
+        self._annotated = "".join(annotated).encode()
+        self._plain = "".join(plain).encode()
+        self.requests = 0
+
+    def request(self, method: str, url: str, body: Any = None, preload_content: bool = True, **kwargs):
+        self.requests += 1
+        if "/api/v2/query" in url:
+            query = json.loads(body)
+            if "reduce(" in query["query"]:
+                data = _AGGREGATES
+            elif (query.get("dialect") or {}).get("annotations") == []:
+                data = self._plain
+            else:
+                data = self._annotated
+            return self._response(200, data, preload_content)
+        return self._response(204, b"", preload_content)
+
+    @staticmethod
+    def _response(status: int, data: bytes, preload_content: bool) -> urllib3.HTTPResponse:
+        return urllib3.HTTPResponse(
+            body=io.BytesIO(data),
+            status=status,
+            headers={"Content-Type": "text/csv; charset=utf-8"},
+            preload_content=preload_content,
+        )
+
+
+class NullWriteApi:
+    # Stands in for the batching write API: accepts each chunk and reports it flushed straight away.
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, bucket: str, record: bytes, **kwargs) -> None:
+        self.lines += record.count(b"\n") + 1
+        get_write_spool().on_write_success((bucket, "", "ns"), record)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeResult:
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self._rows = rows
+
+    def mappings(self) -> "FakeResult":
+        return self
+
+    def first(self) -> Optional[Dict[str, Any]]:
+        return self._rows[0] if self._rows else None
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self._rows)
+
+
+Respond = Callable[[str, Dict[str, Any]], List[Dict[str, Any]]]
+
+
+class FakeSession:
+    # Answers each statement with respond(sql, params); with a log, records every statement and commit.
+    def __init__(self, respond: Respond, log: Optional[List[str]] = None):
+        self._respond = respond
+        self._log = log
+
+    async def __aenter__(self) -> "FakeSession":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+    async def execute(self, statement: Any, params: Optional[Dict[str, Any]] = None) -> FakeResult:
+        sql = str(statement)
+        if self._log is not None:
+            self._log.append(sql)
+        return FakeResult(self._respond(sql, params or {}))
+
+    async def commit(self) -> None:
+        if self._log is not None:
+            self._log.append("COMMIT")
+
+    async def rollback(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeSessionFactory:
+    def __init__(self, respond: Optional[Respond] = None, log: Optional[List[str]] = None):
+        self.respond = respond if respond is not None else BusRegistry()
+        self.log = log
+
+    def __call__(self) -> FakeSession:
+        return FakeSession(self.respond, self.log)
+
+
+class BusRegistry:
+    # The buses table in memory: lookups, filtered keyset listings and the bulk upsert behave as the SQL does.
+    def __init__(self, buses: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.buses = buses if buses is not None else default_buses()
+
+    def __call__(self, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if "INSERT INTO buses" in sql and isinstance(params["bus_id"], str):
+            self.buses[params["bus_id"]] = {column: params[column] for column in _BUS_COLUMNS}
+            return []
+        if "INSERT INTO buses" in sql:
+            return self._bulk_upsert(sql, params)
+        if "WHERE bus_id = :bus_id" in sql:
+            bus = self.buses.get(params["bus_id"])
+            return [bus] if bus else []
+        if sql.startswith("SELECT bus_id") and "FROM buses" in sql:
+            return self._select(params)
+        return []
+
+    def _select(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rows = sorted(self.buses.values(), key=lambda bus: bus["bus_id"])
+        if "after" in params:
+            rows = [bus for bus in rows if bus["bus_id"] > params["after"]]
+        if "route_name" in params:
+            rows = [bus for bus in rows if bus["route_name"] == params["route_name"]]
+        if "driver_name" in params:
+            rows = [bus for bus in rows if bus["driver_name"] == params["driver_name"]]
+        if "plate_pattern" in params:
+            prefix = params["plate_pattern"][:-1].replace("\\", "")
+            rows = [bus for bus in rows if (bus["plate_number"] or "").startswith(prefix)]
+        return rows[:params.get("limit")]
+
+    def _bulk_upsert(self, sql: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Rows are written only when they change, and never over an existing bus with DO NOTHING.
+        written = []
+        for values in zip(*(params[column] for column in _BUS_COLUMNS)):
+            bus = dict(zip(_BUS_COLUMNS, values))
+            existing = self.buses.get(bus["bus_id"])
+            if existing == bus or (existing is not None and "DO NOTHING" in sql):
+                continue
+            self.buses[bus["bus_id"]] = bus
+            written.append({"bus_id": bus["bus_id"], "created": existing is None})
+        return written
+
+
+def default_buses() -> Dict[str, Dict[str, Any]]:
+    return {
+        bus_id: {
+            "bus_id": bus_id,
+            "plate_number": f"ABC-00{index}",
+            "driver_name": "Driver",
+            "route_name": "North Route",
+            "api_key": str(api_key),
+        }
+        for index, (bus_id, api_key) in enumerate(DEFAULT_BUS_KEYS.items(), start=1)
+    }
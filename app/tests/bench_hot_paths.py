@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Offline micro-benchmarks for the ingest and query hot paths; see tests/bench_fakes.py for what is faked.
+#   python tests/bench_hot_paths.py --output bench.json
+#   python tests/bench_hot_paths.py --save-baseline tests/bench_baseline.json
+#   python tests/bench_hot_paths.py --baseline tests/bench_baseline.json   # exits 1 on a regression
+# The settings below must be in place before the app modules read them.
+os.environ.setdefault("INFLUX_SPOOL_DIR", tempfile.mkdtemp(prefix="bench-spool-"))
+os.environ["INGEST_LOG_PARTITIONS"] = "0"
+os.environ["INGEST_RATE_PER_BUS"] = "0"
+os.environ["INFLUX_URL"] = "http://influx.bench:8086"
+
+import httpx
+from pydantic import TypeAdapter
+
+import main
+from controllers import bus_controller, telemetry_controller
+from db.session import get_influx_client
+from repos import influx_repository
+from repos.bus_repository import DEFAULT_BUS_KEYS
+from repos.influx_repository import AsyncTelemetryRepository, TelemetryRepository
+from schemas.telemetry import BusTelemetry, BusTelemetryIn
+from schemas.telemetry_binary import decode_frame, encode_frame
+from services.bus_credential_cache import BusCredentialCache
+from services.bus_service import BusService
+from services.latest_state_store import get_latest_state_store
+from services.telemetry_service import TelemetryService
+from tests.bench_fakes import FakeInfluxPool, FakeSessionFactory, NullWriteApi
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "7"))
+# Calls per round are scaled up until a round takes at least this long, as timeit's autorange does.
+MIN_ROUND_SECONDS = float(os.getenv("BENCH_MIN_ROUND_SECONDS", "0.05"))
+THRESHOLD = float(os.getenv("BENCH_REGRESSION_THRESHOLD", "0.25"))
+HISTORY_ROWS = 500
+BATCH_SIZE = 100
+ENCODE_BATCH_SIZE = 5000
+
+BUS_ID = "bus-1"
+API_KEY = str(DEFAULT_BUS_KEYS[BUS_ID])
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # A plain callable, or a coroutine function run on the benchmark's event loop.
+    run: Callable[[], Any]
+    # Minimum calls per timed round, and points handled per call for the throughput column.
+    number: int
+    points: int
+
+
+def _payload(index: int, timestamp: Optional[datetime] = None) -> Dict[str, Any]:
+    payload = {
+        "bus_id": BUS_ID,
+        "latitude": 25.0 + index * 1e-6,
+        "longitude": 55.0 + index * 1e-6,
+        "temperature_c": 20 + index % 100 / 10,
+        "smoke_detected": index % 50 == 0,
+    }
+    if timestamp is not None:
+        payload["timestamp"] = timestamp.isoformat()
+    return payload
+
+
+def _batch_bodies() -> Iterator[bytes]:
+    # Fresh timestamps per body, otherwise every repeat after the first is dropped by dedup.
+    # Building one costs well under 1% of the request it feeds.
+    for body in itertools.count():
+        yield json.dumps(
+            [_payload(i, START + timedelta(milliseconds=body * BATCH_SIZE + i)) for i in range(BATCH_SIZE)]
+        ).encode()
+
+
+def _telemetry(count: int) -> List[BusTelemetry]:
+    return [
+        BusTelemetry(timestamp=START + timedelta(milliseconds=i), **_payload(i)) for i in range(count)
+    ]
+
+
+def build_benchmarks() -> List[Benchmark]:
+    influx = FakeInfluxPool(rows=HISTORY_ROWS, bus_id=BUS_ID)
+    get_influx_client().api_client.rest_client.pool_manager = influx
+    write_api = NullWriteApi()
+    influx_repository.get_influx_write_api = lambda: write_api
+
+    sessions = FakeSessionFactory()
+    credentials = BusCredentialCache(sessions, max_size=1000, ttl=300, negative_ttl=30)
+    service = TelemetryService(AsyncTelemetryRepository())
+    repository = TelemetryRepository()
+    get_latest_state_store().warm(_telemetry(1))
+
+    single_body = json.dumps(_payload(1, START)).encode()
+    bodies = _batch_bodies()
+    batch_body = next(bodies)
+    batch_adapter = TypeAdapter(List[BusTelemetryIn])
+    payloads = batch_adapter.validate_json(batch_body)
+    frame = encode_frame(
+        BUS_ID, [(p.latitude, p.longitude, p.temperature_c, p.smoke_detected, p.timestamp) for p in payloads]
+    )
+    decoded_frame = decode_frame(frame)
+    encode_batch = _telemetry(ENCODE_BATCH_SIZE)
+
+    async def verify_hit() -> None:
+        await credentials.verify(BUS_ID, API_KEY)
+
+    async def verify_miss() -> None:
+        credentials.clear()
+        await credentials.verify(BUS_ID, API_KEY)
+
+    main.app.dependency_overrides[telemetry_controller.get_credential_cache] = lambda: credentials
+    main.app.dependency_overrides[bus_controller.get_service] = lambda: BusService(sessions, credentials)
+    # No lifespan: the app is driven directly, with the fakes above in place of its connections.
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+    headers = {"X-Bus-Api-Key": API_KEY, "Content-Type": "application/json"}
+
+    def request(method: str, path: str, body_source: Callable[[], Optional[bytes]] = lambda: None):
+        async def send() -> None:
+            response = await client.request(method, path, content=body_source(), headers=headers)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text[:200]}")
+
+        return send
+
+    history = f"/api/v1/buses/{BUS_ID}/telemetry/history?limit={HISTORY_ROWS}"
+    # No timestamp: the server stamps each point, so repeats are not duplicates.
+    single_ingest = json.dumps(_payload(1)).encode()
+    return [
+        Benchmark("validate_single_json", lambda: BusTelemetryIn.model_validate_json(single_body), 2000, 1),
+        Benchmark("validate_batch_json", lambda: batch_adapter.validate_json(batch_body), 200, BATCH_SIZE),
+        Benchmark("decode_binary_frame", lambda: decode_frame(frame), 500, BATCH_SIZE),
+        Benchmark("normalize_batch", lambda: [service._normalize(p) for p in payloads], 200, BATCH_SIZE),
+        Benchmark("normalize_binary_frame", lambda: service._normalize_frame(decoded_frame), 200, BATCH_SIZE),
+        Benchmark(
+            "write_batch_encode",
+            lambda: repository.write_bus_telemetry_batch(encode_batch),
+            5,
+            ENCODE_BATCH_SIZE,
+        ),
+        Benchmark(
+            "parse_history_records",
+            lambda: repository.get_bus_telemetry_history(BUS_ID, START, START + timedelta(days=1), HISTORY_ROWS),
+            10,
+            HISTORY_ROWS,
+        ),
+        Benchmark(
+            "parse_history_rows",
+            lambda: repository.get_bus_telemetry_history_rows(BUS_ID, START, START + timedelta(days=1), HISTORY_ROWS),
+            20,
+            HISTORY_ROWS,
+        ),
+        Benchmark("api_key_verify_hit", verify_hit, 5000, 1),
+        Benchmark("api_key_verify_miss", verify_miss, 1000, 1),
+        Benchmark("asgi_ingest_single", request("POST", "/api/v1/ingest/bus", lambda: single_ingest), 300, 1),
+        Benchmark(
+            "asgi_ingest_batch",
+            request("POST", "/api/v1/ingest/bus/batch", lambda: next(bodies)),
+            20,
+            BATCH_SIZE,
+        ),
+        Benchmark("asgi_latest", request("GET", f"/api/v1/buses/{BUS_ID}/telemetry/latest"), 300, 1),
+        Benchmark("asgi_history_json", request("GET", history), 10, HISTORY_ROWS),
+        Benchmark("asgi_history_columnar", request("GET", history + "&format=columnar"), 20, HISTORY_ROWS),
+        Benchmark("asgi_aggregates", request("GET", f"/api/v1/buses/{BUS_ID}/telemetry/aggregates?window=1h"), 300, 1),
+    ]
+
+
+def measure(benchmark: Benchmark, loop: asyncio.AbstractEventLoop, rounds: int) -> Dict[str, float]:
+    if asyncio.iscoroutinefunction(benchmark.run):
+        async def repeat(number: int) -> None:
+            for _ in range(number):
+                await benchmark.run()
+
+        def timed_round(number: int) -> float:
+            started = time.perf_counter()
+            loop.run_until_complete(repeat(number))
+            return time.perf_counter() - started
+    else:
+        def timed_round(number: int) -> float:
+            started = time.perf_counter()
+            for _ in range(number):
+                benchmark.run()
+            return time.perf_counter() - started
+
+    # The warm-up round also sizes the timed ones.
+    number = benchmark.number
+    elapsed = timed_round(number)
+    if elapsed < MIN_ROUND_SECONDS:
+        number = math.ceil(number * MIN_ROUND_SECONDS / max(elapsed, 1e-9))
+        timed_round(number)
+
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            samples.append(timed_round(number) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    best = min(samples)
+    return {
+        "best_us": best * 1e6,
+        "median_us": statistics.median(samples) * 1e6,
+        "points_per_second": benchmark.points / best,
+        "points": benchmark.points,
+        "rounds": rounds,
+        "number": number,
+    }
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    # Compares best times: the least noisy figure a shared machine gives.
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            result["change"] = None
+            continue
+        change = result["best_us"] / previous["best_us"] - 1
+        result["change"] = change
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, float]], regressions: List[str]) -> None:
+    print(f"{'benchmark':<26}{'best µs':>12}{'median µs':>12}{'points/s':>14}{'vs baseline':>14}")
+    for name, result in results.items():
+        change = result.get("change")
+        delta = "" if change is None else f"{change * 100:+.1f}%"
+        flag = "  REGRESSION" if name in regressions else ""
+        print(
+            f"{name:<26}{result['best_us']:>12.1f}{result['median_us']:>12.1f}"
+            f"{result['points_per_second']:>14,.0f}{delta:>14}{flag}"
+        )
+
+
+def run_benchmark(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline hot-path micro-benchmarks")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare against a stored results file and exit 1 on regressions")
+    parser.add_argument("--save-baseline", help="Store these results as the new baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=THRESHOLD, help="Allowed slowdown of the best time, 0.25 = 25%%"
+    )
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("-k", dest="only", help="Only run benchmarks whose name contains this")
+    args = parser.parse_args(argv)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    results: Dict[str, Dict[str, float]] = {}
+    for benchmark in build_benchmarks():
+        if args.only and args.only not in benchmark.name:
+            continue
+        results[benchmark.name] = measure(benchmark, loop, args.rounds)
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline) as handle:
+            regressions = compare(results, json.load(handle), args.threshold)
+    print_table(results, regressions)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_benchmark())
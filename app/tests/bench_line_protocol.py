@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from influxdb_client.client.write.point import Point
+
+from repos.line_protocol import LineProtocolEncoder
+from schemas.telemetry import BusTelemetry
+
+BATCH_SIZE = int(os.getenv("BENCH_BATCH_SIZE", "5000"))
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "20"))
+
+
+def build_batch() -> list[BusTelemetry]:
+    base_time = datetime.now(timezone.utc)
+    return [
+        BusTelemetry(
+            bus_id="bus-1",
+            latitude=round(25.0 + random.random(), 6),
+            longitude=round(55.0 + random.random(), 6),
+            temperature_c=round(20 + random.random() * 10, 2),
+            smoke_detected=random.random() < 0.01,
+            timestamp=base_time + timedelta(seconds=i),
+        )
+        for i in range(BATCH_SIZE)
+    ]
+
+
+def encode_with_points(batch: list[BusTelemetry]) -> bytes:
+    points = [
+        Point("bus_telemetry")
+        .tag("bus_id", t.bus_id)
+        .field("latitude", t.latitude)
+        .field("longitude", t.longitude)
+        .field("temperature_c", t.temperature_c)
+        .field("smoke_detected", int(t.smoke_detected))
+        .time(t.timestamp)
+        for t in batch
+    ]
+    return "\n".join(p.to_line_protocol() for p in points).encode()
+
+
+def best_of(fn, batch: list[BusTelemetry]) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(batch)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark() -> None:
+    batch = build_batch()
+    encoder = LineProtocolEncoder()
+    assert encoder.encode(batch) == encode_with_points(batch)
+
+    point_time = best_of(encode_with_points, batch)
+    encoder_time = best_of(encoder.encode, batch)
+    print(f"Point objects:  {point_time * 1000:8.2f} ms per {BATCH_SIZE}-point batch")
+    print(f"Line encoder:   {encoder_time * 1000:8.2f} ms per {BATCH_SIZE}-point batch")
+    print(f"Speedup:        {point_time / encoder_time:8.2f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark()
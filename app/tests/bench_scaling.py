@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+from core.config import get_settings, worker_count
+from repos.bus_repository import DEFAULT_BUS_KEYS
+
+# Batch ingest throughput of `serve.py` by worker count, with both databases faked (tests/bench_app.py),
+# so the figure is the API's own CPU cost per point.
+#   python tests/bench_scaling.py                                  # 1, 2, 4 ... workers up to the CPU count
+#   python tests/bench_scaling.py --workers 1 2 4 8 --clients 4 --output scaling.json
+# The load generator needs CPU as well; give it enough --clients processes, and read the results knowing
+# it shares the host with the server.
+BUSES = list(DEFAULT_BUS_KEYS.items())
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _batch(stream: int, sequence: int, batch_size: int) -> bytes:
+    # One day of distinct millisecond timestamps per stream keeps every point clear of dedup.
+    bus_id = BUSES[stream % len(BUSES)][0]
+    first = START + timedelta(days=stream, milliseconds=sequence * batch_size)
+    return json.dumps(
+        [
+            {
+                "bus_id": bus_id,
+                "latitude": 25.0 + index * 1e-6,
+                "longitude": 55.0 + index * 1e-6,
+                "temperature_c": 20 + index % 100 / 10,
+                "smoke_detected": False,
+                "timestamp": (first + timedelta(milliseconds=index)).isoformat(),
+            }
+            for index in range(batch_size)
+        ]
+    ).encode()
+
+
+async def _drive(
+    base_url: str, client: int, connections: int, batch_size: int, warmup: float, duration: float
+) -> Dict[str, float]:
+    totals = {"requests": 0, "points": 0, "errors": 0}
+    measure_from = time.monotonic() + warmup
+    stop_at = measure_from + duration
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as http:
+        async def connection(index: int) -> None:
+            stream = client * connections + index
+            headers = {"X-Bus-Api-Key": str(BUSES[stream % len(BUSES)][1]), "Content-Type": "application/json"}
+            for sequence in range(sys.maxsize):
+                now = time.monotonic()
+                if now >= stop_at:
+                    return
+                try:
+                    body = _batch(stream, sequence, batch_size)
+                    response = await http.post("/api/v1/ingest/bus/batch", content=body, headers=headers)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                if now < measure_from:
+                    continue
+                if failed:
+                    totals["errors"] += 1
+                else:
+                    totals["requests"] += 1
+                    totals["points"] += batch_size
+
+        await asyncio.gather(*(connection(index) for index in range(connections)))
+    return totals
+
+
+def _client_process(
+    base_url: str, client: int, connections: int, batch_size: int, warmup: float, duration: float, results
+) -> None:
+    results.put(asyncio.run(_drive(base_url, client, connections, batch_size, warmup, duration)))
+
+
+def _wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        try:
+            if httpx.get(base_url + "/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def measure(workers: int, args: argparse.Namespace, scratch: str) -> Dict[str, Any]:
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = os.environ.copy()
+    env.update({"INFLUX_SPOOL_DIR": os.path.join(scratch, f"spool-{workers}"), "WEB_ACCESS_LOG": "false"})
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    if workers > 1:
+        env["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(scratch, f"metrics-{workers}")
+    command = [
+        sys.executable, "serve.py", "--app", "tests.bench_app:app",
+        "--host", "127.0.0.1", "--port", str(args.port), "--workers", str(workers),
+    ]
+    with open(os.path.join(scratch, f"server-{workers}.log"), "wb") as log:
+        server = subprocess.Popen(command, cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            _wait_ready(base_url, server)
+            context = multiprocessing.get_context("spawn")
+            results = context.Queue()
+            clients = [
+                context.Process(
+                    target=_client_process,
+                    args=(base_url, client, args.connections, args.batch_size, args.warmup, args.duration, results),
+                )
+                for client in range(args.clients)
+            ]
+            for process in clients:
+                process.start()
+            totals = [results.get() for _ in clients]
+            for process in clients:
+                process.join()
+        finally:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    points = sum(total["points"] for total in totals)
+    return {
+        "workers": workers,
+        "requests_per_second": sum(total["requests"] for total in totals) / args.duration,
+        "points_per_second": points / args.duration,
+        "errors": sum(total["errors"] for total in totals),
+    }
+
+
+def default_worker_counts() -> List[int]:
+    cpus = worker_count(get_settings().model_copy(update={"web_concurrency": 0}))
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def run_benchmark(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest throughput by API worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=None, help="Worker counts to measure")
+    parser.add_argument("--clients", type=int, default=max(os.cpu_count() or 1, 2) // 2, help="Load processes")
+    parser.add_argument("--connections", type=int, default=32, help="Concurrent requests per load process")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench-scaling-") as scratch:
+        for workers in args.workers or default_worker_counts():
+            results.append(measure(workers, args, scratch))
+            result = results[-1]
+            speedup = result["points_per_second"] / max(results[0]["points_per_second"], 1e-9)
+            result["speedup"] = speedup
+            result["efficiency"] = speedup / workers * results[0]["workers"]
+            if len(results) == 1:
+                print(f"{'workers':>8}{'requests/s':>13}{'points/s':>13}{'speedup':>10}{'efficiency':>12}{'errors':>8}")
+            print(
+                f"{workers:>8}{result['requests_per_second']:>13,.0f}{result['points_per_second']:>13,.0f}"
+                f"{speedup:>10.2f}{result['efficiency']:>12.0%}{result['errors']:>8}"
+            )
+
+    if args.output:
+        report = {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "cpus": os.cpu_count(),
+            "clients": args.clients,
+            "connections": args.connections,
+            "batch_size": args.batch_size,
+            "results": results,
+        }
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_benchmark())
@@ -0,0 +1,48 @@
+from datetime import datetime, timezone
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schemas.telemetry_binary import encode_frame
+
+VECTORS = [
+    ("single-reading", "bus-1", [(25.2048, 55.2708, 24.5, False, datetime(2024, 1, 1, tzinfo=timezone.utc))]),
+    ("smoke-negative-temp", "bus-2", [(-33.8688, 151.2093, -12.25, True, datetime(2024, 6, 30, 23, 59, 59, 999000, tzinfo=timezone.utc))]),
+    ("server-timestamp", "bus-3", [(0.0, 0.0, 0.0, False, None)]),
+    (
+        "batch",
+        "bus-1",
+        [
+            (25.2048, 55.2708, 24.5, False, datetime(2024, 1, 1, 0, 0, 0, tzinfo=timezone.utc)),
+            (25.2049, 55.2709, 24.51, False, datetime(2024, 1, 1, 0, 0, 5, tzinfo=timezone.utc)),
+            (25.2050, 55.2710, 99.99, True, datetime(2024, 1, 1, 0, 0, 10, tzinfo=timezone.utc)),
+        ],
+    ),
+]
+
+
+def build_vectors() -> list[dict]:
+    return [
+        {
+            "name": name,
+            "bus_id": bus_id,
+            "readings": [
+                {
+                    "latitude": lat,
+                    "longitude": lon,
+                    "temperature_c": temp,
+                    "smoke_detected": smoke,
+                    "timestamp": ts.isoformat() if ts else None,
+                }
+                for lat, lon, temp, smoke, ts in readings
+            ],
+            "frame_hex": encode_frame(bus_id, readings).hex(),
+        }
+        for name, bus_id, readings in VECTORS
+    ]
+
+
+if __name__ == "__main__":
+    print(json.dumps(build_vectors(), indent=2))
@@ -0,0 +1,383 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+# Open-loop fleet simulator: every send and query has a scheduled time that does not depend on earlier responses,
+# and latency is measured from that time, so a stalled server shows up in the tail instead of slowing the load.
+#   FLEET_BUSES=5000 FLEET_SAMPLE_INTERVAL=2 FLEET_DURATION=120 python tests/load_fleet.py
+BASE_URL = os.getenv("FLEET_BASE_URL", "http://localhost:8000")
+BUSES = int(os.getenv("FLEET_BUSES", "2000"))
+ROUTES = int(os.getenv("FLEET_ROUTES", "40"))
+BUS_PREFIX = os.getenv("FLEET_BUS_PREFIX", "sim")
+# Seconds between GPS fixes on each bus; a single-mode bus sends every fix, a batch-mode bus every FLEET_BATCH_POINTS.
+SAMPLE_INTERVAL = float(os.getenv("FLEET_SAMPLE_INTERVAL", "5"))
+BATCH_SHARE = float(os.getenv("FLEET_BATCH_SHARE", "0.25"))
+BATCH_POINTS = int(os.getenv("FLEET_BATCH_POINTS", "12"))
+# Queries per second across the fleet, as Poisson arrivals, split by the weights in FLEET_QUERY_MIX.
+QUERY_RATE = float(os.getenv("FLEET_QUERY_RATE", "20"))
+QUERY_MIX = os.getenv("FLEET_QUERY_MIX", "latest=5,fleet=2,history=2,aggregates=1")
+DURATION = float(os.getenv("FLEET_DURATION", "60"))
+# Requests scheduled before this many seconds are sent but not recorded.
+WARMUP = float(os.getenv("FLEET_WARMUP", "10"))
+TIMEOUT = float(os.getenv("FLEET_TIMEOUT", "10"))
+MAX_CONNECTIONS = int(os.getenv("FLEET_MAX_CONNECTIONS", "1000"))
+# Past this many outstanding requests new arrivals are counted as dropped rather than queued in the client.
+MAX_INFLIGHT = int(os.getenv("FLEET_MAX_INFLIGHT", "20000"))
+# Buses are provisioned through the admin bus import, which the server only enables with ADMIN_API_KEY set.
+ADMIN_API_KEY = os.getenv("FLEET_ADMIN_API_KEY") or os.getenv("ADMIN_API_KEY")
+PROVISION_BATCH = int(os.getenv("FLEET_PROVISION_BATCH", "5000"))
+SMOKE_PROBABILITY = float(os.getenv("FLEET_SMOKE_PROBABILITY", "0.001"))
+SEED = int(os.getenv("FLEET_SEED", "7"))
+OUTPUT = os.getenv("FLEET_OUTPUT")
+
+CENTER = (25.2, 55.3)
+METRES_PER_DEGREE = 111_320.0
+PERCENTILES = (50.0, 90.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    # HDR-style: values in whole microseconds go to log-linear buckets, 2**precision_bits per power of two, so
+    # every percentile is exact to within 2**(1 - precision_bits) relative error and memory does not grow with
+    # the sample count.
+    def __init__(self, precision_bits: int = 8):
+        self._precision_bits = precision_bits
+        self._counts: Dict[Tuple[int, int], int] = defaultdict(int)
+        self.count = 0
+        self.max_us = 0
+
+    def record(self, seconds: float) -> None:
+        value = max(int(seconds * 1_000_000), 0)
+        shift = max(value.bit_length() - self._precision_bits, 0)
+        self._counts[shift, value >> shift] += 1
+        self.count += 1
+        self.max_us = max(self.max_us, value)
+
+    def percentile(self, percent: float) -> float:
+        # Seconds; reports the top of the bucket holding the rank, as HdrHistogram does.
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(percent / 100 * self.count), 1)
+        seen = 0
+        for shift, sub_bucket in sorted(self._counts):
+            seen += self._counts[shift, sub_bucket]
+            if seen >= rank:
+                return min(((sub_bucket + 1) << shift) - 1, self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+
+class Route:
+    # A closed loop of waypoints; positions are interpolated by distance travelled.
+    def __init__(self, name: str, waypoints: List[Tuple[float, float]]):
+        self.name = name
+        self._waypoints = waypoints + waypoints[:1]
+        self._distances = [0.0]
+        for (lat1, lon1), (lat2, lon2) in zip(self._waypoints, self._waypoints[1:]):
+            self._distances.append(self._distances[-1] + _distance(lat1, lon1, lat2, lon2))
+        self.length = self._distances[-1]
+
+    def position(self, travelled: float) -> Tuple[float, float]:
+        travelled %= self.length
+        index = max(bisect.bisect_right(self._distances, travelled) - 1, 0)
+        segment = self._distances[index + 1] - self._distances[index]
+        fraction = (travelled - self._distances[index]) / segment if segment else 0.0
+        (lat1, lon1), (lat2, lon2) = self._waypoints[index], self._waypoints[index + 1]
+        return lat1 + (lat2 - lat1) * fraction, lon1 + (lon2 - lon1) * fraction
+
+
+def _distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Equirectangular metres; plenty for routes a few kilometres long.
+    dx = (lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    return math.hypot(lat2 - lat1, dx) * METRES_PER_DEGREE
+
+
+def build_routes(count: int, rng: random.Random) -> List[Route]:
+    routes = []
+    for index in range(count):
+        lat = CENTER[0] + rng.uniform(-0.15, 0.15)
+        lon = CENTER[1] + rng.uniform(-0.15, 0.15)
+        radius = rng.uniform(0.01, 0.04)
+        stops = rng.randint(8, 16)
+        waypoints = [
+            (
+                lat + radius * math.sin(2 * math.pi * stop / stops) * rng.uniform(0.7, 1.3),
+                lon + radius * math.cos(2 * math.pi * stop / stops) * rng.uniform(0.7, 1.3),
+            )
+            for stop in range(stops)
+        ]
+        routes.append(Route(f"Sim Route {index + 1}", waypoints))
+    return routes
+
+
+class SimulatedBus:
+    def __init__(self, index: int, route: Route, rng: random.Random):
+        self.bus_id = f"{BUS_PREFIX}-{index:05d}"
+        self.api_key = str(uuid.uuid4())
+        self.route = route
+        self.batch_points = BATCH_POINTS if rng.random() < BATCH_SHARE else 1
+        # Spread first fixes over one interval so the fleet does not send in lockstep.
+        self.phase = rng.uniform(0, SAMPLE_INTERVAL)
+        self._speed = rng.uniform(6.0, 14.0)
+        self._offset = rng.uniform(0, route.length)
+        self._base_temperature = rng.uniform(21.0, 29.0)
+        self._temperature_phase = rng.uniform(0, 2 * math.pi)
+        self._rng = rng
+        self.pending: List[Dict[str, Any]] = []
+
+    def provision_body(self, index: int) -> Dict[str, Any]:
+        return {
+            "bus_id": self.bus_id,
+            "plate_number": f"SIM-{index:05d}",
+            "driver_name": f"Simulated Driver {index}",
+            "route_name": self.route.name,
+            "api_key": self.api_key,
+        }
+
+    def fix(self, elapsed: float, timestamp: datetime) -> Dict[str, Any]:
+        latitude, longitude = self.route.position(self._offset + self._speed * elapsed)
+        temperature = self._base_temperature + 2 * math.sin(elapsed / 600 * 2 * math.pi + self._temperature_phase)
+        return {
+            "bus_id": self.bus_id,
+            "latitude": round(latitude, 6),
+            "longitude": round(longitude, 6),
+            "temperature_c": round(temperature + self._rng.gauss(0, 0.2), 2),
+            "smoke_detected": self._rng.random() < SMOKE_PROBABILITY,
+            "timestamp": timestamp.isoformat(),
+        }
+
+
+class OperationStats:
+    def __init__(self):
+        # Response time counts from the scheduled start, service time from when the request was actually sent.
+        self.response = LatencyHistogram()
+        self.service = LatencyHistogram()
+        self.scheduled = 0
+        self.dropped = 0
+        self.errors: Counter = Counter()
+
+    def summary(self, window: float) -> Dict[str, Any]:
+        return {
+            "scheduled": self.scheduled,
+            "completed": self.response.count,
+            "dropped": self.dropped,
+            "errors": dict(self.errors),
+            "offered_per_second": self.scheduled / window,
+            "completed_per_second": self.response.count / window,
+            "response_seconds": {f"p{p:g}": self.response.percentile(p) for p in PERCENTILES},
+            "response_max_seconds": self.response.max_us / 1_000_000,
+            "service_p99_seconds": self.service.percentile(99.0),
+        }
+
+
+def _parse_mix(spec: str) -> Tuple[List[str], List[float]]:
+    weights = dict(item.split("=", 1) for item in spec.split(",") if item.strip())
+    unknown = set(weights).difference(("latest", "fleet", "history", "aggregates"))
+    if unknown:
+        raise SystemExit(f"Unknown query kinds in FLEET_QUERY_MIX: {', '.join(sorted(unknown))}")
+    return list(weights), [float(weight) for weight in weights.values()]
+
+
+class FleetSimulator:
+    def __init__(self, client: httpx.AsyncClient, buses: List[SimulatedBus], routes: List[Route], rng: random.Random):
+        self._client = client
+        self._buses = buses
+        self._routes = routes
+        self._rng = rng
+        self._query_kinds, self._query_weights = _parse_mix(QUERY_MIX)
+        self._stats: Dict[str, OperationStats] = defaultdict(OperationStats)
+        self._lag = LatencyHistogram()
+        self._inflight: set = set()
+
+    async def run(self) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        self._started = loop.time()
+        self._wall_start = datetime.now(timezone.utc)
+        self._measure_from = self._started + WARMUP
+        stop_at = self._started + WARMUP + DURATION
+
+        # One heap of (due, tie-break, source) drives every bus and the query stream from a single timer.
+        sequence = itertools.count()
+        schedule: List[Tuple[float, int, Optional[SimulatedBus]]] = [
+            (self._started + bus.phase, next(sequence), bus) for bus in self._buses
+        ]
+        if QUERY_RATE > 0:
+            schedule.append((self._started + self._rng.expovariate(QUERY_RATE), next(sequence), None))
+        heapq.heapify(schedule)
+
+        while schedule and schedule[0][0] < stop_at:
+            due, _, bus = heapq.heappop(schedule)
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if due >= self._measure_from:
+                self._lag.record(loop.time() - due)
+            if bus is None:
+                self._query(due)
+                heapq.heappush(schedule, (due + self._rng.expovariate(QUERY_RATE), next(sequence), None))
+            else:
+                self._sample(bus, due)
+                heapq.heappush(schedule, (due + SAMPLE_INTERVAL, next(sequence), bus))
+
+        if self._inflight:
+            await asyncio.wait(set(self._inflight), timeout=TIMEOUT * 2)
+        return self._report()
+
+    def _sample(self, bus: SimulatedBus, due: float) -> None:
+        elapsed = due - self._started
+        bus.pending.append(bus.fix(elapsed, self._wall_start + timedelta(seconds=elapsed)))
+        if len(bus.pending) < bus.batch_points:
+            return
+        headers = {"X-Bus-Api-Key": bus.api_key}
+        if bus.batch_points == 1:
+            self._dispatch("ingest_single", due, "POST", "/api/v1/ingest/bus", json=bus.pending[0], headers=headers)
+        else:
+            self._dispatch("ingest_batch", due, "POST", "/api/v1/ingest/bus/batch", json=bus.pending, headers=headers)
+        bus.pending = []
+
+    def _query(self, due: float) -> None:
+        kind = self._rng.choices(self._query_kinds, self._query_weights)[0]
+        bus = self._rng.choice(self._buses)
+        if kind == "latest":
+            self._dispatch("query_latest", due, "GET", f"/api/v1/buses/{bus.bus_id}/telemetry/latest")
+        elif kind == "fleet":
+            params = {"route": bus.route.name, "fields": "latitude,longitude"}
+            self._dispatch("query_fleet", due, "GET", "/api/v1/buses/telemetry/latest", params=params)
+        elif kind == "history":
+            start = (self._wall_start - timedelta(hours=1)).isoformat()
+            self._dispatch(
+                "query_history",
+                due,
+                "GET",
+                f"/api/v1/buses/{bus.bus_id}/telemetry/history",
+                params={"start": start, "limit": 100},
+            )
+        else:
+            path = f"/api/v1/buses/{bus.bus_id}/telemetry/aggregates"
+            self._dispatch("query_aggregates", due, "GET", path, params={"window": "15m"})
+
+    def _dispatch(self, operation: str, due: float, method: str, path: str, **kwargs: Any) -> None:
+        stats = self._stats[operation] if due >= self._measure_from else None
+        if stats is not None:
+            stats.scheduled += 1
+        if len(self._inflight) >= MAX_INFLIGHT:
+            if stats is not None:
+                stats.dropped += 1
+            return
+        task = asyncio.create_task(self._request(stats, due, method, path, kwargs))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _request(
+        self, stats: Optional[OperationStats], due: float, method: str, path: str, kwargs: Dict[str, Any]
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        sent = loop.time()
+        error = None
+        try:
+            response = await self._client.request(method, path, **kwargs)
+            if response.status_code >= 400:
+                error = str(response.status_code)
+        except httpx.HTTPError as exc:
+            error = type(exc).__name__
+        if stats is None:
+            return
+        done = loop.time()
+        if error is not None:
+            stats.errors[error] += 1
+        stats.response.record(done - due)
+        stats.service.record(done - sent)
+
+    def _report(self) -> Dict[str, Any]:
+        return {
+            "config": {
+                "buses": len(self._buses),
+                "routes": len(self._routes),
+                "sample_interval": SAMPLE_INTERVAL,
+                "batch_share": BATCH_SHARE,
+                "batch_points": BATCH_POINTS,
+                "query_rate": QUERY_RATE,
+                "duration": DURATION,
+                "warmup": WARMUP,
+            },
+            "scheduler_lag_seconds": {f"p{p:g}": self._lag.percentile(p) for p in PERCENTILES},
+            "operations": {name: stats.summary(DURATION) for name, stats in sorted(self._stats.items())},
+        }
+
+
+async def provision(client: httpx.AsyncClient, buses: List[SimulatedBus]) -> None:
+    if not ADMIN_API_KEY:
+        raise SystemExit(
+            "Cannot provision buses: set FLEET_ADMIN_API_KEY (or ADMIN_API_KEY) to the server's ADMIN_API_KEY"
+        )
+    bodies = [bus.provision_body(index) for index, bus in enumerate(buses, start=1)]
+    for start in range(0, len(bodies), PROVISION_BATCH):
+        # Simulated buses get fresh keys on every run, so earlier runs' buses are overwritten.
+        response = await client.post(
+            "/api/v1/buses/import",
+            params={"overwrite": "true"},
+            json=bodies[start:start + PROVISION_BATCH],
+            headers={"X-Admin-Api-Key": ADMIN_API_KEY},
+        )
+        if response.status_code in (401, 403):
+            raise SystemExit(
+                f"Cannot provision buses: the bus import answered {response.status_code} "
+                f"({response.json().get('detail')}); FLEET_ADMIN_API_KEY must match the server's ADMIN_API_KEY"
+            )
+        response.raise_for_status()
+        result = response.json()["data"]
+        if result["invalid"] or result["conflicts"]:
+            raise SystemExit(f"Provisioning rejected rows: {result['invalid'] + result['conflicts']}")
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    config = report["config"]
+    print(
+        f"{config['buses']} buses on {config['routes']} routes, a fix every {config['sample_interval']:g}s, "
+        f"{config['query_rate']:g} queries/s, {config['duration']:g}s measured after {config['warmup']:g}s warm-up"
+    )
+    header = f"{'operation':<18}{'offered/s':>11}{'done/s':>10}{'errors':>8}{'dropped':>9}"
+    header += "".join(f"{'p' + format(p, 'g') + ' ms':>11}" for p in PERCENTILES) + f"{'max ms':>11}{'svc p99 ms':>12}"
+    print(header)
+    for name, stats in report["operations"].items():
+        percentiles = "".join(f"{value * 1000:>11.1f}" for value in stats["response_seconds"].values())
+        print(
+            f"{name:<18}{stats['offered_per_second']:>11.1f}{stats['completed_per_second']:>10.1f}"
+            f"{sum(stats['errors'].values()):>8}{stats['dropped']:>9}{percentiles}"
+            f"{stats['response_max_seconds'] * 1000:>11.1f}{stats['service_p99_seconds'] * 1000:>12.1f}"
+        )
+        if stats["errors"]:
+            print(f"{'':<18}errors: {', '.join(f'{key}={count}' for key, count in sorted(stats['errors'].items()))}")
+    lag = report["scheduler_lag_seconds"]
+    # A late scheduler means this process, not the server, was the bottleneck.
+    print(f"scheduler lag p99 {lag['p99'] * 1000:.1f} ms, p99.9 {lag['p99.9'] * 1000:.1f} ms")
+
+
+async def run_load_test() -> None:
+    rng = random.Random(SEED)
+    routes = build_routes(ROUTES, rng)
+    buses = [SimulatedBus(index, routes[index % len(routes)], rng) for index in range(1, BUSES + 1)]
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+
+    async with httpx.AsyncClient(base_url=BASE_URL, timeout=TIMEOUT, limits=limits) as client:
+        await provision(client, buses)
+        print(f"Provisioned {len(buses)} buses")
+        report = await FleetSimulator(client, buses, routes, rng).run()
+
+    print_report(report)
+    if OUTPUT:
+        with open(OUTPUT, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_load_test())
@@ -0,0 +1,76 @@
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from controllers import telemetry_controller
+from core.config import get_settings
+from services.admission import TokenBucketLimiter, get_ingest_rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_at_rate():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=10, burst=20, max_keys=10, clock=clock)
+    assert limiter.acquire("bus-1", 20) == 0
+    assert limiter.acquire("bus-1", 5) == 0.5
+    clock.now = 0.5
+    assert limiter.acquire("bus-1", 5) == 0
+
+
+def test_buses_do_not_share_tokens():
+    limiter = TokenBucketLimiter(rate=1, burst=5, max_keys=10, clock=FakeClock())
+    assert limiter.acquire("noisy", 5) == 0
+    assert limiter.acquire("noisy", 1) > 0
+    assert limiter.acquire("quiet", 1) == 0
+
+
+def test_oversized_batch_needs_a_full_bucket():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(rate=100, burst=50, max_keys=10, clock=clock)
+    assert limiter.acquire("bus-1", 500) == 0
+    assert limiter.acquire("bus-1", 500) == 0.5
+
+
+def test_disabled_limiter_admits_everything():
+    limiter = TokenBucketLimiter(rate=0, burst=0, max_keys=10)
+    assert limiter.acquire("bus-1", 10_000) == 0
+
+
+def test_per_bus_limits_are_split_across_workers(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("INGEST_RATE_PER_BUS", "40")
+    monkeypatch.setenv("INGEST_BURST_PER_BUS", "400")
+    get_settings.cache_clear()
+    get_ingest_rate_limiter.cache_clear()
+    try:
+        limiter = get_ingest_rate_limiter()
+        assert (limiter._rate, limiter._burst) == (10, 100)
+    finally:
+        get_settings.cache_clear()
+        get_ingest_rate_limiter.cache_clear()
+
+
+def test_saturated_pipeline_rejects_before_reading_the_body():
+    def saturated():
+        raise HTTPException(status_code=503, detail="Write pipeline saturated")
+
+    app = FastAPI()
+    app.include_router(telemetry_controller.router)
+    app.dependency_overrides[telemetry_controller.admit_ingest] = saturated
+    client = TestClient(app)
+    read = []
+
+    def body():
+        read.append(True)
+        yield b"{}"
+
+    for path in ("/bus", "/bus/batch", "/gateway/batch"):
+        response = client.post(f"/api/v1/ingest{path}", content=body(), headers={"Content-Type": "application/json"})
+        assert response.status_code == 503
+    assert read == []
@@ -0,0 +1,121 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from controllers import bus_controller
+from core.config import get_settings
+from schemas.bus import Bus
+from services.bus_credential_cache import BusCredentialCache
+from services.bus_import import parse_bus_rows
+from services.bus_service import BusService
+from tests.bench_fakes import BusRegistry, FakeSessionFactory
+
+
+def bus(bus_id, plate_number, route_name, api_key):
+    return {
+        "bus_id": bus_id,
+        "plate_number": plate_number,
+        "driver_name": None,
+        "route_name": route_name,
+        "api_key": api_key,
+    }
+
+
+def run_import(table, rows, overwrite=True):
+    log = []
+    factory = FakeSessionFactory(BusRegistry(table), log)
+    service = BusService(factory, BusCredentialCache(factory, max_size=10, ttl=60, negative_ttl=60))
+    return asyncio.run(service.import_buses(rows, overwrite=overwrite)), log
+
+
+def test_csv_and_json_rows():
+    key = uuid4()
+    rows = parse_bus_rows(
+        f"\ufeffbus_id,plate_number,driver_name,route_name,api_key\nbus-9,P-9,,North,{key}\n".encode(), "csv"
+    )
+    assert rows == [
+        {"bus_id": "bus-9", "plate_number": "P-9", "driver_name": None, "route_name": "North", "api_key": str(key)}
+    ]
+    assert parse_bus_rows(b'[{"bus_id": "bus-9"}]', "json") == [{"bus_id": "bus-9"}]
+    with pytest.raises(ValueError):
+        parse_bus_rows(b"plate_number\nP-1\n", "csv")
+    with pytest.raises(ValueError):
+        parse_bus_rows(b'{"bus_id": "bus-9"}', "json")
+
+
+def test_import_reports_each_row_and_commits_once():
+    key = str(uuid4())
+    table = {"bus-1": bus("bus-1", "P-1", "North", key), "bus-2": bus("bus-2", "P-2", "North", key)}
+    rows = [
+        {"bus_id": "bus-1", "plate_number": "P-1", "route_name": "North", "api_key": key},
+        {"bus_id": "bus-2", "plate_number": "P-2b", "route_name": "North", "api_key": key},
+        {"bus_id": "bus-3", "api_key": key},
+        {"bus_id": "bus-3", "api_key": str(uuid4())},
+        {"bus_id": "bus-4", "api_key": "not-a-uuid"},
+    ]
+    result, log = run_import(table, rows)
+    assert (result.created, result.updated, result.unchanged) == (1, 1, 1)
+    assert [(issue.row, issue.bus_id) for issue in result.conflicts] == [(4, "bus-3")]
+    assert [(issue.row, issue.bus_id) for issue in result.invalid] == [(5, "bus-4")]
+    assert table["bus-2"]["plate_number"] == "P-2b"
+    assert log.count("COMMIT") == 1
+    assert sum("pg_notify" in sql for sql in log) == 1
+
+    result, _ = run_import(table, [{"bus_id": "bus-2", "api_key": key}, {"bus_id": "bus-5", "api_key": key}], False)
+    assert result.created == 1
+    assert [(issue.row, issue.reason) for issue in result.conflicts] == [(1, "bus already exists")]
+    assert table["bus-2"]["plate_number"] == "P-2b"
+
+
+def test_http_import_needs_the_admin_key_and_keeps_existing_buses(monkeypatch):
+    key = str(uuid4())
+    table = {"bus-1": bus("bus-1", None, None, key)}
+    factory = FakeSessionFactory(BusRegistry(table))
+    app = FastAPI()
+    app.include_router(bus_controller.router)
+    app.dependency_overrides[bus_controller.get_service] = lambda: BusService(
+        factory, BusCredentialCache(factory, max_size=10, ttl=60, negative_ttl=60)
+    )
+    client = TestClient(app)
+    body = f"bus_id,plate_number,api_key\nbus-1,TAKEN,{uuid4()}\n"
+
+    def post(query="", **headers):
+        return client.post(
+            "/api/v1/buses/import" + query, content=body, headers={"Content-Type": "text/csv", **headers}
+        )
+
+    get_settings.cache_clear()
+    assert post(**{"X-Admin-Api-Key": "anything"}).status_code == 403
+
+    monkeypatch.setenv("ADMIN_API_KEY", "secret")
+    get_settings.cache_clear()
+    try:
+        assert post().status_code == 401
+        assert post(**{"X-Admin-Api-Key": "wrong"}).status_code == 403
+        response = post(**{"X-Admin-Api-Key": "secret"})
+        assert response.json()["data"]["conflicts"][0]["reason"] == "bus already exists"
+        assert table["bus-1"]["api_key"] == key
+        assert post("?overwrite=true", **{"X-Admin-Api-Key": "secret"}).json()["data"]["updated"] == 1
+        assert table["bus-1"]["plate_number"] == "TAKEN"
+    finally:
+        get_settings.cache_clear()
+
+
+def test_upsert_bus_replaces_the_key_and_drops_the_cached_credential():
+    old_key, new_key = uuid4(), uuid4()
+    table = {"bus-1": bus("bus-1", "P-1", "North", str(old_key))}
+    log = []
+    factory = FakeSessionFactory(BusRegistry(table), log)
+    cache = BusCredentialCache(factory, max_size=10, ttl=60, negative_ttl=60)
+    service = BusService(factory, cache)
+
+    async def scenario():
+        assert await cache.verify("bus-1", str(old_key))
+        await service.upsert_bus(Bus(bus_id="bus-1", plate_number="P-1", route_name="North", api_key=new_key))
+        return await cache.verify("bus-1", str(old_key)), await cache.verify("bus-1", str(new_key))
+
+    assert asyncio.run(scenario()) == (False, True)
+    assert any("pg_notify" in sql for sql in log) and "COMMIT" in log
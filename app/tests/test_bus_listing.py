@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services.bus_credential_cache import BusCredentialCache
+from services.bus_service import BusService
+from tests.bench_fakes import BusRegistry, FakeSessionFactory
+
+
+def make_service(buses, statements):
+    factory = FakeSessionFactory(BusRegistry({bus["bus_id"]: bus for bus in buses}), statements)
+    return BusService(factory, BusCredentialCache(factory, max_size=10, ttl=60, negative_ttl=60))
+
+
+def test_pages_follow_bus_id_with_filters():
+    buses = [
+        {"bus_id": f"bus-{index}", "plate_number": f"P_{index}", "driver_name": None, "route_name": "North"}
+        for index in range(5)
+    ]
+    buses.append({"bus_id": "bus-9", "plate_number": "Q-9", "driver_name": None, "route_name": "South"})
+    statements = []
+    service = make_service(buses, statements)
+
+    seen = []
+    cursor = None
+    while True:
+        page = asyncio.run(service.list_buses(2, cursor, route_name="North", plate_prefix="P_"))
+        seen.extend(bus.bus_id for bus in page.items)
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+    assert seen == [f"bus-{index}" for index in range(5)]
+    assert "api_key" not in statements[-1]
+    assert "bus_id > :after" in statements[-1] and "plate_number LIKE :plate_pattern" in statements[-1]
+    assert "driver_name =" not in statements[-1]
+
+
+def test_invalid_cursor_is_rejected():
+    service = make_service([], [])
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(service.list_buses(10, cursor="%%%"))
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,75 @@
+import asyncio
+import csv
+import io
+from datetime import datetime, timezone
+
+import pytest
+from influxdb_client import InfluxDBClient
+
+from repos.influx_repository import AsyncTelemetryRepository, TelemetryRepository
+from tests.bench_fakes import FakeInfluxPool
+
+
+def make_repository(timeout):
+    repository = AsyncTelemetryRepository(repository=object())
+    repository._limiter = asyncio.Semaphore(1)
+    repository._timeout = timeout
+    return repository
+
+
+def test_slot_is_freed_once_rows_are_read():
+    async def scenario():
+        repository = make_repository(timeout=5)
+        stream = repository._stream(lambda: iter(range(3)), batch_size=1)
+        assert await stream.__anext__() == [0]
+        # The client has not read the rest yet, but Influx has been drained into the queue.
+        await asyncio.sleep(0.2)
+        assert not repository._limiter.locked()
+        assert [batch async for batch in stream] == [[1], [2]]
+
+    asyncio.run(scenario())
+
+
+def test_stalled_client_abandons_the_query():
+    async def scenario():
+        repository = make_repository(timeout=0.3)
+        closed = []
+
+        def rows():
+            try:
+                yield from range(100)
+            finally:
+                closed.append(True)
+
+        stream = repository._stream(rows, batch_size=1)
+        assert await stream.__anext__() == [0]
+        await asyncio.sleep(1.2)
+        assert not repository._limiter.locked() and closed == [True]
+        with pytest.raises(TimeoutError):
+            async for _ in stream:
+                pass
+
+    asyncio.run(scenario())
+
+
+def test_row_queries_skip_the_blank_lines_between_tables():
+    pool = FakeInfluxPool(rows=3)
+    # Two tables, each followed by a blank line, as Influx sends them.
+    pool._plain += pool._plain
+    client = InfluxDBClient(url="http://influx.test", token="token", org="org")
+    client.api_client.rest_client.pool_manager = pool
+    repository = TelemetryRepository()
+    repository._query_api = client.query_api()
+    start, end = datetime(2024, 1, 1, tzinfo=timezone.utc), datetime(2024, 1, 2, tzinfo=timezone.utc)
+
+    rows = repository.get_bus_telemetry_history_rows("bus-1", start, end, 10)
+    assert len(rows) == 6 and rows[0][0] == "bus-1"
+    assert list(repository.iter_bus_telemetry_history_rows("bus-1", start, end)) == rows
+
+    # The same response read by a plain csv.reader, which keeps the blank lines the client drops.
+    class RawCsvQueryApi:
+        def query_csv(self, flux, dialect=None):
+            return csv.reader(io.StringIO(pool._plain.decode(), newline=""))
+
+    repository._query_api = RawCsvQueryApi()
+    assert repository.get_bus_telemetry_history_rows("bus-1", start, end, 10) == rows
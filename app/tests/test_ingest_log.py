@@ -0,0 +1,111 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+from repos.ingest_log import PartitionReader, PartitionedLog, partition_for
+from schemas.telemetry import BusTelemetry
+from services.dedup import TelemetryDeduplicator
+from services.stream_processor import PartitionWorker, assign_partitions
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_points(count, buses=3):
+    return [
+        BusTelemetry(
+            bus_id=f"bus-{i % buses}",
+            latitude=21.0 + i,
+            longitude=105.5,
+            temperature_c=30.25,
+            smoke_detected=i % 2 == 0,
+            timestamp=START + timedelta(microseconds=i),
+        )
+        for i in range(count)
+    ]
+
+
+class FakeRepository:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.written = []
+
+    def write_bus_telemetry_batch_sync(self, telemetries):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("influx down")
+        self.written.extend(telemetries)
+
+
+class FakeLatestState:
+    def update_many(self, telemetries):
+        pass
+
+    async def flush(self):
+        return 0
+
+
+def test_round_trip_keeps_per_bus_order_across_segments(tmp_path):
+    log = PartitionedLog(str(tmp_path), partitions=2, segment_bytes=128, fsync=False)
+    points = make_points(20)
+    log.append(points)
+
+    partition = partition_for("bus-1", 2)
+    reader = PartitionReader(log.partition_dir(partition))
+    read, position = reader.poll(1000)
+    expected = [point for point in points if partition_for(point.bus_id, 2) == partition]
+    assert read == expected
+    reader.commit(position)
+    assert len([name for name in os.listdir(log.partition_dir(partition)) if name.endswith(".log")]) == 1
+
+    late = [points[1].model_copy(update={"timestamp": START + timedelta(seconds=1)})]
+    log.append(late)
+    assert PartitionReader(log.partition_dir(partition)).poll(1000)[0] == late
+
+
+def test_torn_tail_waits_until_segment_is_sealed(tmp_path):
+    log = PartitionedLog(str(tmp_path), partitions=1, segment_bytes=1 << 20, fsync=False)
+    log.append(make_points(2))
+    segment = os.path.join(log.partition_dir(0), "00000000000000000001.log")
+    with open(segment, "ab") as handle:
+        handle.write(b"\x40\x00")
+
+    reader = PartitionReader(log.partition_dir(0))
+    points, position = reader.poll(100)
+    assert len(points) == 2 and reader.corrupt == 0
+    reader.commit(position)
+
+    open(os.path.join(log.partition_dir(0), "00000000000000000002.log"), "wb").write(b"BTINGLG1")
+    points, _ = reader.poll(100)
+    assert points == [] and reader.corrupt == 1
+
+
+def test_worker_commits_only_after_influx_write(tmp_path):
+    log = PartitionedLog(str(tmp_path), partitions=2, segment_bytes=1 << 20, fsync=False)
+    points = make_points(10)
+    log.append(points)
+    log.append(points[:4])
+    repository = FakeRepository(failures=1)
+    worker = PartitionWorker(
+        readers=[PartitionReader(log.partition_dir(partition)) for partition in range(2)],
+        repository=repository,
+        deduplicator=TelemetryDeduplicator(window=900, max_keys_per_bus=1000),
+        latest_state=FakeLatestState(),
+        batch_size=100,
+        poll_interval=0.01,
+    )
+
+    async def drain():
+        try:
+            await worker.process_once()
+        except ConnectionError:
+            pass
+        while await worker.process_once():
+            pass
+
+    asyncio.run(drain())
+    assert sorted(repository.written, key=lambda point: point.timestamp) == points
+    assert log.backlog_bytes(max_age=0) == 0
+
+
+def test_partitions_are_split_across_workers():
+    assert assign_partitions(5, 2) == [[0, 2, 4], [1, 3]]
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from schemas.telemetry import BusTelemetry
+from services.latest_state_store import LatestStateStore
+from tests.bench_fakes import FakeSessionFactory
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_state(seconds):
+    return BusTelemetry(
+        bus_id="bus-1",
+        latitude=25.0,
+        longitude=55.0,
+        temperature_c=21.5,
+        smoke_detected=False,
+        timestamp=START + timedelta(seconds=seconds),
+    )
+
+
+def test_entries_go_back_to_postgres_once_stale():
+    # The latest_state table, as flushed there by another worker.
+    table = {}
+
+    def respond(sql, params):
+        state = table.get(params["bus_id"])
+        return [state.model_dump()] if state else []
+
+    store = LatestStateStore(FakeSessionFactory(respond), max_age=0.05)
+    store.update(make_state(1))
+    assert store.get("bus-1") == make_state(1)
+
+    table["bus-1"] = make_state(2)
+    time.sleep(0.06)
+    assert store.get("bus-1") is None
+    assert asyncio.run(store.load("bus-1")) == make_state(2)
+    assert store.get("bus-1") == make_state(2)
+
+    # A point this worker has not flushed yet beats an older row.
+    store.update(make_state(3))
+    time.sleep(0.06)
+    assert asyncio.run(store.load("bus-1")) == make_state(3)
+
+
+def test_single_process_store_trusts_memory():
+    store = LatestStateStore(lambda: FakeSession({}))
+    store.update(make_state(1))
+    time.sleep(0.01)
+    assert store.get("bus-1") == make_state(1)
+
+
+def test_silent_buses_skip_the_influx_scan_until_the_miss_expires():
+    store = LatestStateStore(lambda: FakeSession({}), miss_ttl=0.05)
+    store.remember_misses(["bus-1", "bus-2"])
+    assert store.without_recent_misses(["bus-1", "bus-2", "bus-3"]) == ["bus-3"]
+
+    # A point arriving for a bus counts for more than the remembered miss.
+    store.update(make_state(1))
+    assert store.without_recent_misses(["bus-1", "bus-2"]) == ["bus-1"]
+
+    time.sleep(0.06)
+    assert store.without_recent_misses(["bus-1", "bus-2"]) == ["bus-1", "bus-2"]
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta, timezone
+
+from influxdb_client.client.write.point import Point
+
+from repos.line_protocol import LineProtocolEncoder
+from schemas.telemetry import BusTelemetry
+
+
+def _point_line(t: BusTelemetry) -> str:
+    return (
+        Point("bus_telemetry")
+        .tag("bus_id", t.bus_id)
+        .field("latitude", t.latitude)
+        .field("longitude", t.longitude)
+        .field("temperature_c", t.temperature_c)
+        .field("smoke_detected", int(t.smoke_detected))
+        .time(t.timestamp)
+        .to_line_protocol()
+    )
+
+
+def _sample() -> list[BusTelemetry]:
+    base = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    bus_ids = ["bus-1", "bus 2", "bus,3", "bus=4", "bus\\", "bus\n5", "حافلة-6"]
+    values = [(25.0, 55.0, 21.0), (-33.868820, 151.209296, -4.25), (0.1, -0.000001, 99.99), (89.999999, 179.5, 1e-05)]
+    samples = []
+    for i, bus_id in enumerate(bus_ids):
+        for j, (lat, lon, temp) in enumerate(values):
+            samples.append(
+                BusTelemetry(
+                    bus_id=bus_id,
+                    latitude=lat,
+                    longitude=lon,
+                    temperature_c=temp,
+                    smoke_detected=(i + j) % 2 == 0,
+                    timestamp=base + timedelta(days=i, microseconds=j),
+                )
+            )
+    samples.append(
+        BusTelemetry(
+            bus_id="bus-tz",
+            latitude=1.5,
+            longitude=2.5,
+            temperature_c=3.5,
+            smoke_detected=False,
+            timestamp=datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone(timedelta(hours=4))),
+        )
+    )
+    return samples
+
+
+def test_encoder_matches_point_serialization():
+    samples = _sample()
+    expected = "\n".join(_point_line(t) for t in samples).encode()
+    assert LineProtocolEncoder().encode(samples) == expected
+
+
+def test_encoder_reuses_buffer_between_calls():
+    samples = _sample()
+    encoder = LineProtocolEncoder()
+    first = encoder.encode(samples)
+    encoder.encode(samples[:1])
+    assert encoder.encode(samples) == first
+
+
+def test_encode_chunks_splits_on_line_boundaries():
+    samples = _sample()
+    chunks = list(LineProtocolEncoder().encode_chunks(samples, 5))
+    assert len(chunks) == (len(samples) + 4) // 5
+    assert b"\n".join(chunks) == LineProtocolEncoder().encode(samples)
@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from schemas.telemetry import BusTelemetry
+from services.live_fanout import MAX_NOTIFY_BYTES, LiveFanout
+from services.live_hub import LiveTelemetryHub
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def make_point(bus_id, seconds):
+    return BusTelemetry(
+        bus_id=bus_id,
+        latitude=25.0,
+        longitude=55.0,
+        temperature_c=21.5,
+        smoke_detected=seconds % 2 == 1,
+        timestamp=START + timedelta(seconds=seconds),
+    )
+
+
+def make_worker():
+    hub = LiveTelemetryHub(max_pending=10000)
+    fanout = LiveFanout(hub, interval=60.0)
+    hub.forward = fanout.offer
+    return hub, fanout
+
+
+def test_points_reach_subscribers_on_other_workers():
+    ingesting_hub, ingesting = make_worker()
+    watching_hub, watching = make_worker()
+    subscription = watching_hub.subscribe()
+
+    # Nobody elsewhere is listening yet, so nothing is kept for the channel.
+    ingesting_hub.publish([make_point("bus-1", 1)])
+    assert ingesting.drain() == []
+
+    ingesting.receive(watching.announcement())
+    ingesting_hub.publish([make_point("bus-1", 2), make_point("bus-1", 3), make_point("bus-2", 4)])
+    payloads = ingesting.drain()
+    assert len(payloads) == 1
+    for payload in payloads:
+        # Every worker hears its own notifications too.
+        ingesting.receive(payload)
+        watching.receive(payload)
+
+    batch = asyncio.run(subscription.next_batch(timeout=0))
+    assert sorted(batch, key=lambda point: point.bus_id) == [make_point("bus-1", 3), make_point("bus-2", 4)]
+    assert ingesting.drain() == []
+
+
+def test_large_flushes_split_under_the_notify_limit():
+    hub, fanout = make_worker()
+    fanout.receive(make_worker()[1].announcement())
+    hub.publish([make_point(f"bus-{n}", n) for n in range(500)])
+
+    payloads = fanout.drain()
+    assert len(payloads) > 1
+    assert all(len(payload.encode()) < MAX_NOTIFY_BYTES for payload in payloads)
+
+    watching_hub, watching = make_worker()
+    subscription = watching_hub.subscribe(["bus-7", "bus-499"])
+    for payload in payloads:
+        watching.receive(payload)
+    batch = asyncio.run(subscription.next_batch(timeout=0))
+    assert sorted(point.bus_id for point in batch) == ["bus-499", "bus-7"]
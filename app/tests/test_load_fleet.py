@@ -0,0 +1,45 @@
+import asyncio
+import random
+import re
+
+import httpx
+import pytest
+
+from tests import load_fleet
+from tests.load_fleet import LatencyHistogram, Route, SimulatedBus, build_routes
+
+
+def test_histogram_percentiles_stay_within_bucket_precision():
+    histogram = LatencyHistogram(precision_bits=8)
+    for millis in range(1, 10001):
+        histogram.record(millis / 1000)
+
+    for percent, expected in ((50.0, 5.0), (99.0, 9.9), (99.9, 9.99)):
+        assert expected <= histogram.percentile(percent) <= expected * (1 + 2 ** -7)
+    assert histogram.percentile(100.0) == 10.0
+    assert LatencyHistogram().percentile(99.0) == 0.0
+
+
+def test_route_position_wraps_around_the_loop():
+    route = Route("square", [(0.0, 0.0), (0.0, 0.01), (0.01, 0.01), (0.01, 0.0)])
+    assert route.position(0) == (0.0, 0.0)
+    latitude, longitude = route.position(route.length / 8)
+    assert latitude == 0.0 and abs(longitude - 0.005) < 1e-9
+    latitude, longitude = route.position(route.length * 3 + route.length / 4)
+    assert abs(latitude) < 1e-9 and abs(longitude - 0.01) < 1e-9
+    assert len({route.name for route in build_routes(5, random.Random(1))}) == 5
+
+
+def test_provisioning_explains_a_missing_or_wrong_admin_key(monkeypatch):
+    rng = random.Random(1)
+    buses = [SimulatedBus(1, build_routes(1, rng)[0], rng)]
+    refuse = httpx.MockTransport(lambda request: httpx.Response(403, json={"detail": "Invalid admin API key"}))
+
+    async def provision():
+        async with httpx.AsyncClient(base_url="http://api.test", transport=refuse) as client:
+            await load_fleet.provision(client, buses)
+
+    for key, expected in ((None, "set FLEET_ADMIN_API_KEY"), ("wrong", "answered 403 (Invalid admin API key)")):
+        monkeypatch.setattr(load_fleet, "ADMIN_API_KEY", key)
+        with pytest.raises(SystemExit, match=re.escape(expected)):
+            asyncio.run(provision())
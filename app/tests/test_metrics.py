@@ -0,0 +1,61 @@
+import time
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from core.metrics import MetricsMiddleware, observe_influx_write
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_requests_are_labelled_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics-test/{bus_id}")
+    def read(bus_id: str):
+        return {"bus_id": bus_id}
+
+    labels = {"method": "GET", "route": "/metrics-test/{bus_id}", "status": "200"}
+    before = sample("http_request_duration_seconds_count", **labels)
+    client = TestClient(app)
+    client.get("/metrics-test/bus-1")
+    client.get("/metrics-test/bus-2")
+    client.get("/not-a-route")
+
+    assert sample("http_request_duration_seconds_count", **labels) == before + 2
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+
+
+def test_streamed_responses_are_timed_to_their_first_byte():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics-test-stream")
+    def stream():
+        def chunks():
+            for _ in range(3):
+                time.sleep(0.1)
+                yield b"."
+
+        return StreamingResponse(chunks())
+
+    labels = {"method": "GET", "route": "/metrics-test-stream", "status": "200"}
+    before = sample("http_request_duration_seconds_sum", **labels)
+    assert TestClient(app).get("/metrics-test-stream").content == b"..."
+
+    assert sample("http_request_duration_seconds_count", **labels) == 1
+    assert sample("http_request_duration_seconds_sum", **labels) - before < 0.1
+
+
+def test_write_outcomes_record_batch_lines():
+    before = sample("influx_write_batch_lines_sum", mode="batching")
+    observe_influx_write("batching", "success", b"a 1\nb 2\nc 3")
+    observe_influx_write("batching", "retry", "a 1")
+
+    assert sample("influx_write_batch_lines_sum", mode="batching") == before + 3
+    assert sample("influx_write_batches_total", mode="batching", result="retry") >= 1
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+from schemas.telemetry import BusTelemetry
+from services.rolling_aggregates import RollingAggregates, window_start_minute
+
+START = 1_700_000_040.0  # a minute boundary
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def point(seconds, temperature, smoke=False):
+    return BusTelemetry(
+        bus_id="bus-1",
+        latitude=25.0,
+        longitude=55.0,
+        temperature_c=temperature,
+        smoke_detected=smoke,
+        timestamp=datetime.fromtimestamp(START + seconds, tz=timezone.utc),
+    )
+
+
+def test_windows_sum_whole_minutes_including_the_current_one():
+    clock = FakeClock(START)
+    aggregates = RollingAggregates(retention_minutes=10, clock=clock)
+    clock.now = START + 5 * 60 + 30
+    aggregates.add_many([point(60, 20.0), point(4 * 60, 22.0, smoke=True), point(5 * 60 + 10, 30.0)])
+
+    assert aggregates.covers(120)
+    totals = aggregates.query("bus-1", 120)
+    assert totals == {
+        "count": 2.0,
+        "temperature_sum": 52.0,
+        "temperature_min": 22.0,
+        "temperature_max": 30.0,
+        "smoke_events": 1.0,
+    }
+    assert aggregates.query("bus-1", 300)["count"] == 3.0
+    assert window_start_minute(clock.now, 120) * 60 == START + 4 * 60
+
+
+def test_future_points_do_not_overwrite_live_minutes():
+    clock = FakeClock(START)
+    aggregates = RollingAggregates(retention_minutes=10, clock=clock)
+    clock.now = START + 3 * 60
+    aggregates.add_many([point(3 * 60, 20.0)])
+    # Ten minutes ahead lands in the same slot as the current minute.
+    aggregates.add_many([point(13 * 60, 99.0)])
+
+    assert aggregates.query("bus-1", 60) == {
+        "count": 1.0,
+        "temperature_sum": 20.0,
+        "temperature_min": 20.0,
+        "temperature_max": 20.0,
+        "smoke_events": 0.0,
+    }
+
+
+def test_windows_older_than_startup_or_the_ring_are_not_covered():
+    clock = FakeClock(START + 30)
+    aggregates = RollingAggregates(retention_minutes=10, clock=clock)
+    assert not aggregates.covers(60)
+    clock.now = START + 3 * 60
+    assert aggregates.covers(180) and not aggregates.covers(240)
+    clock.now = START + 60 * 60
+    assert aggregates.covers(600) and not aggregates.covers(660)
+    assert aggregates.query("bus-2", 60) is None
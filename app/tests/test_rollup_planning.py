@@ -0,0 +1,139 @@
+import asyncio
+import math
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from repos.influx_rollups import (
+    RollupRegistry,
+    align_down,
+    get_rollup_tiers,
+    rollup_boundary,
+    rollup_lookback_seconds,
+)
+from schemas.telemetry import BusTelemetry
+from services.telemetry_service import TelemetryService, _merge_totals, _window_count, _window_seconds
+
+MINUTE, HOUR = get_rollup_tiers()
+
+
+def make_service():
+    registry = RollupRegistry()
+    since = datetime.now(timezone.utc) - timedelta(days=30)
+    for tier in get_rollup_tiers():
+        registry.mark_available(tier, since)
+    return TelemetryService(repository=None, rollups=registry)
+
+
+def test_lookback_covers_the_lateness_allowance():
+    assert rollup_lookback_seconds(MINUTE, 3600) == 65 * 60
+    assert rollup_lookback_seconds(HOUR, 3600) == 6 * 3600
+    assert rollup_lookback_seconds(HOUR, 5400) == 7 * 3600
+
+
+def test_boundary_leaves_late_windows_to_raw_data():
+    now = datetime(2024, 1, 1, 12, 30, 30, tzinfo=timezone.utc)
+    # 1h lateness + one 1m window + 10s offset + 60s slack before 12:30:30.
+    assert rollup_boundary(MINUTE, now, max_lateness=3600) == datetime(2024, 1, 1, 11, 28, tzinfo=timezone.utc)
+    assert rollup_boundary(HOUR, now, max_lateness=3600) == datetime(2024, 1, 1, 10, tzinfo=timezone.utc)
+    assert rollup_boundary(MINUTE, now, max_lateness=0) == datetime(2024, 1, 1, 12, 28, tzinfo=timezone.utc)
+
+
+def test_plan_serves_only_settled_aligned_windows_from_rollups():
+    service = make_service()
+    end = datetime.now(timezone.utc)
+    start = end - timedelta(days=7, minutes=17)
+    segments = service._plan_segments(start, end, 3600)
+
+    rollup = [segment for segment in segments if segment.bucket is not None]
+    assert len(rollup) == 1 and rollup[0].bucket == HOUR.bucket
+    assert rollup[0].start == align_down(HOUR, start) + timedelta(hours=1)
+    assert rollup[0].stop <= rollup_boundary(HOUR, datetime.now(timezone.utc))
+    # Raw edges plus the rollup middle cover the range exactly, without overlap.
+    ordered = sorted(segments, key=lambda segment: segment.start)
+    assert ordered[0].start == start and ordered[-1].stop == end
+    assert all(left.stop == right.start for left, right in zip(ordered, ordered[1:]))
+
+
+def test_plan_falls_back_to_raw_for_recent_or_fine_ranges():
+    service = make_service()
+    end = datetime.now(timezone.utc)
+    assert [segment.bucket for segment in service._plan_segments(end - timedelta(minutes=30), end, 60)] == [None]
+    assert [segment.bucket for segment in service._plan_segments(end - timedelta(days=2), end, 1)] == [None]
+
+
+def test_merge_totals_combines_parts_and_skips_empty_ones():
+    parts = [
+        {"count": 2, "temperature_sum": 40.0, "temperature_min": 19.0, "temperature_max": 21.0, "smoke_events": 1},
+        {"count": 0},
+        {"count": 3, "temperature_sum": 75.0, "temperature_min": 24.0, "temperature_max": 26.0},
+    ]
+    assert _merge_totals(parts) == {
+        "count": 5,
+        "temperature_sum": 115.0,
+        "temperature_min": 19.0,
+        "temperature_max": 26.0,
+        "smoke_events": 1,
+    }
+    assert _merge_totals([{"count": 0}]) is None
+    assert _merge_totals([]) is None
+
+
+def test_downsampled_history_rejects_a_cursor():
+    service = make_service()
+    for method in (service.get_bus_telemetry_history, service.get_bus_telemetry_history_rows):
+        for options in ({"max_points": 100}, {"resolution": "1m"}):
+            with pytest.raises(HTTPException) as exc_info:
+                asyncio.run(method("bus-1", None, None, 100, cursor="abc", **options))
+            assert exc_info.value.status_code == 400
+
+
+class WindowedRepository:
+    # One row per epoch-aligned window of each queried segment, newest first and cut at limit, as the Flux does;
+    # only the very first window of the range saw smoke.
+    def __init__(self, start):
+        self._start = start
+
+    async def get_bus_telemetry_downsampled(self, bus_id, start, stop, every, limit, bucket=None):
+        seconds = int(every[:-1])
+        rows = []
+        window = math.floor(start.timestamp() / seconds) * seconds
+        while window < stop.timestamp():
+            row_time = max(datetime.fromtimestamp(window, timezone.utc), start)
+            rows.append(
+                BusTelemetry(
+                    bus_id=bus_id,
+                    latitude=25.0,
+                    longitude=55.0,
+                    temperature_c=20.0,
+                    smoke_detected=row_time == self._start,
+                    timestamp=row_time,
+                )
+            )
+            window += seconds
+        return sorted(rows, key=lambda row: row.timestamp, reverse=True)[:limit]
+
+
+def test_downsampling_keeps_every_window_including_the_oldest():
+    end = datetime.now(timezone.utc).replace(microsecond=0)
+    start = end - timedelta(days=7, seconds=17)
+    service = make_service()
+    service._repository = WindowedRepository(start)
+    assert len(service._plan_segments(start, end, _window_seconds(start, end, 500))) > 1
+
+    items = asyncio.run(service.get_bus_telemetry_history("bus-1", start, end, 100, max_points=500)).items
+    assert len(items) <= 500
+    assert items[-1].timestamp == start and items[-1].smoke_detected
+    assert len({item.timestamp for item in items}) == len(items)
+
+
+def test_window_size_never_yields_an_extra_aligned_window():
+    start = datetime(2024, 1, 1, 0, 0, 30, tzinfo=timezone.utc)
+    end = start + timedelta(minutes=100)
+    # ceil(range / max_points) = 60s would touch 101 minute windows.
+    assert _window_count(start, end, 60) == 101
+    assert _window_count(start, end, _window_seconds(start, end, 100)) <= 100
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(make_service().get_bus_telemetry_history("bus-1", start, end, 100, max_points=100, resolution="1m"))
+    assert exc_info.value.status_code == 400
@@ -0,0 +1,73 @@
+import struct
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import ValidationError
+
+from schemas.telemetry import BusTelemetryIn
+from schemas.telemetry_binary import RECORD, BinaryTelemetryError, decode_frame, encode_frame
+from services.telemetry_service import TelemetryService
+
+
+def test_reference_frame_layout():
+    ts = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    frame = encode_frame("bus-1", [(25.5, 55.25, 24.5, True, ts)])
+    assert frame.hex() == (
+        "42544c4d" "01" "05" "6275732d31"
+        "00f451c28c010000" "0000cc41" "00005d42" "9209" "03"
+    )
+
+
+def test_round_trip_keeps_float32_precision():
+    ts = datetime(2024, 6, 30, 23, 59, 59, 999000, tzinfo=timezone.utc)
+    readings = [(-33.8688, 151.2093, -12.25, True, ts), (0.0, 0.0, 0.0, False, None)]
+    frame = decode_frame(encode_frame("bus-2", readings))
+    assert frame.bus_id == "bus-2" and frame.count == 2
+
+    decoded = TelemetryService(repository=None)._normalize_frame(frame)
+    assert decoded[0].latitude == pytest.approx(-33.8688, abs=1e-5)
+    assert decoded[0].longitude == pytest.approx(151.2093, abs=1e-5)
+    assert decoded[0].temperature_c == -12.25
+    assert decoded[0].smoke_detected is True
+    assert decoded[0].timestamp == ts
+    # No timestamp flag: stamped with server time.
+    assert (datetime.now(timezone.utc) - decoded[1].timestamp).total_seconds() < 5
+
+
+@pytest.mark.parametrize(
+    "frame",
+    [
+        b"XXXX\x01\x05bus-1",
+        b"BTLM\x02\x05bus-1",
+        b"BTLM\x01\x00",
+        encode_frame("bus-1", [(1.0, 2.0, 3.0, False, None)])[:-1],
+        b"BTLM\x01\x05bus-1" + RECORD.pack(0, 91.0, 0.0, 0, 0),
+        b"BTLM\x01\x05bus-1" + RECORD.pack(0, float("nan"), 0.0, 0, 0),
+        b"BTLM\x01\x05bus-1" + RECORD.pack(0, 0.0, 0.0, 10001, 0),
+        b"BTLM\x01\x05bus-1" + RECORD.pack(2**62, 0.0, 0.0, 0, 0x02),
+        # Year 1000: a valid datetime, but before what Influx can store.
+        b"BTLM\x01\x05bus-1" + RECORD.pack(-30610224000000, 0.0, 0.0, 0, 0x02),
+    ],
+)
+def test_invalid_frames_are_rejected(frame):
+    with pytest.raises(BinaryTelemetryError):
+        decode_frame(frame)
+
+
+def test_encoder_rejects_readings_that_do_not_fit():
+    with pytest.raises(BinaryTelemetryError):
+        encode_frame("bus-1", [(0.0, 0.0, 400.0, False, None)])
+    # Out-of-range timestamps are ignored without their flag.
+    assert decode_frame(b"BTLM\x01\x05bus-1" + RECORD.pack(2**62, 0.0, 0.0, 0, 0)).count == 1
+
+
+def test_json_timestamps_outside_influx_range_are_rejected():
+    reading = {"bus_id": "bus-1", "latitude": 0, "longitude": 0, "temperature_c": 20, "smoke_detected": False}
+    for timestamp in ("1000-01-01T00:00:00Z", "2300-01-01T00:00:00"):
+        with pytest.raises(ValidationError):
+            BusTelemetryIn(**reading, timestamp=timestamp)
+    assert BusTelemetryIn(**reading, timestamp="1970-01-01T00:00:00Z").timestamp.year == 1970
+
+
+def test_record_is_packed():
+    assert RECORD.size == struct.calcsize("<qffhB") == 19
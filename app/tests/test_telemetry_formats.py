@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from schemas.telemetry_formats import (
+    ARROW_MEDIA_TYPE,
+    CSV_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    encode_arrow,
+    encode_columnar_json,
+    encode_csv,
+    negotiate_media_type,
+)
+
+ROWS = [
+    ("bus-1", "2024-01-01T00:00:02.123456789Z", "25.5", "55.25", "24.5", "1"),
+    ("bus-1", "2024-01-01T00:00:01Z", "25.4", "55.2", "", "0"),
+]
+
+
+def test_columnar_json_has_one_array_per_field():
+    body = json.loads(encode_columnar_json("bus-1", ROWS))
+    data = body["data"]
+    assert data["count"] == 2
+    assert data["timestamp"] == ["2024-01-01T00:00:02.123456789Z", "2024-01-01T00:00:01Z"]
+    assert data["temperature_c"] == [24.5, None]
+    assert data["smoke_detected"] == [True, False]
+
+
+def test_csv_normalizes_smoke_flags():
+    lines = encode_csv(ROWS).decode().splitlines()
+    assert lines[0] == "bus_id,timestamp,latitude,longitude,temperature_c,smoke_detected"
+    assert lines[1].endswith(",true")
+    assert lines[2] == "bus-1,2024-01-01T00:00:01Z,25.4,55.2,,false"
+
+
+def test_arrow_round_trip_keeps_nanoseconds():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.ipc.open_stream(encode_arrow(ROWS)).read_all()
+    assert table.num_rows == 2
+    assert table.column("timestamp").cast(pa.int64()).to_pylist()[0] == 1704067202123456789
+    assert table.column("temperature_c").to_pylist() == [24.5, None]
+
+
+def test_negotiation_honours_quality_and_wildcards():
+    offered = [JSON_MEDIA_TYPE, CSV_MEDIA_TYPE, ARROW_MEDIA_TYPE]
+    assert negotiate_media_type(None, offered) == JSON_MEDIA_TYPE
+    assert negotiate_media_type("text/csv;q=0.5, application/vnd.apache.arrow.stream", offered) == ARROW_MEDIA_TYPE
+    assert negotiate_media_type("text/*", offered) == CSV_MEDIA_TYPE
+    assert negotiate_media_type("image/png", offered) is None
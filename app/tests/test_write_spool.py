@@ -0,0 +1,136 @@
+import os
+
+import pytest
+from influxdb_client.rest import ApiException
+
+from db.session import is_rejected_write
+from repos.write_spool import (
+    DEAD_LETTER_FILE,
+    RejectedBatch,
+    WriteSpool,
+    claim_orphan_spool_directories,
+    claim_spool_directory,
+)
+
+
+def make_spool(directory, max_pending_lines=1000):
+    return WriteSpool(str(directory), segment_bytes=64, max_pending_lines=max_pending_lines, max_record_lines=2)
+
+
+def test_full_queue_diverts_until_replayed(tmp_path):
+    spool = make_spool(tmp_path, max_pending_lines=2)
+    assert spool.admit(b"a\nb")
+    assert not spool.admit(b"c")
+    spool.append(b"c")
+    assert not spool.admit(b"d")
+
+    replayed = []
+    assert spool.replay(replayed.append) == 1
+    assert replayed == [b"c"]
+    assert not spool.stats().diverting
+
+
+def test_replay_is_ordered_and_survives_restart(tmp_path):
+    spool = make_spool(tmp_path)
+    spool.on_write_error(("telemetry", "demo", "ns"), b"l1\nl2\nl3", RuntimeError("down"))
+    spool.append(b"l4")
+    spool.close()
+
+    def fail_on_l3(payload):
+        if payload == b"l3":
+            raise ConnectionError("still down")
+
+    with pytest.raises(ConnectionError):
+        make_spool(tmp_path).replay(fail_on_l3)
+
+    reopened = make_spool(tmp_path)
+    assert reopened.stats().batches == 2
+    replayed = []
+    reopened.replay(replayed.append)
+    assert replayed == [b"l3", b"l4"]
+    assert reopened.stats().batches == 0
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".seg")]
+
+
+def test_corrupt_record_drops_the_segment_tail(tmp_path):
+    spool = make_spool(tmp_path)
+    spool.append(b"good")
+    spool.append(b"bad!")
+    spool.close()
+    segment = next(name for name in os.listdir(tmp_path) if name.endswith(".seg"))
+    path = tmp_path / segment
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+    reopened = make_spool(tmp_path)
+    replayed = []
+    reopened.replay(replayed.append)
+    assert replayed == [b"good"]
+    assert reopened.stats().corrupt_total >= 1
+
+
+def test_each_process_claims_its_own_spool_directory(tmp_path):
+    first, first_fd = claim_spool_directory(str(tmp_path))
+    second, second_fd = claim_spool_directory(str(tmp_path))
+    assert first == str(tmp_path)
+    assert second == os.path.join(str(tmp_path), "worker-1")
+
+    # Released on close, so the next claimant takes over the slot and its backlog.
+    spool = WriteSpool(second, segment_bytes=64, max_pending_lines=10, max_record_lines=2, lock_fd=second_fd)
+    spool.append(b"left behind")
+    spool.close()
+    directory, fd = claim_spool_directory(str(tmp_path))
+    assert directory == second
+    assert make_spool(directory).stats().batches == 1
+    os.close(fd)
+    os.close(first_fd)
+
+
+def test_unclaimed_slots_with_a_backlog_are_handed_out_for_draining(tmp_path):
+    base = str(tmp_path)
+    claimed = [claim_spool_directory(base) for _ in range(3)]
+    live = WriteSpool(claimed[2][0], segment_bytes=64, max_pending_lines=10, max_record_lines=2, lock_fd=claimed[2][1])
+    live.append(b"still owned")
+    for slot in (3, 4):
+        orphan = make_spool(tmp_path / f"worker-{slot}")
+        orphan.append(b"left by worker %d" % slot)
+        orphan.close()
+    make_spool(tmp_path / "worker-5").close()
+
+    replayed = []
+    for directory, fd in claim_orphan_spool_directories(base):
+        spool = WriteSpool(directory, segment_bytes=64, max_pending_lines=10, max_record_lines=2, lock_fd=fd)
+        spool.replay(replayed.append)
+        spool.close()
+    assert replayed == [b"left by worker 3", b"left by worker 4"]
+    assert list(claim_orphan_spool_directories(base)) == []
+    assert live.stats().batches == 1
+    live.close()
+    for _, fd in claimed[:2]:
+        os.close(fd)
+
+
+def test_rejected_batches_are_dead_lettered_without_blocking_replay(tmp_path):
+    spool = make_spool(tmp_path)
+    for payload in (b"a 1", b"bad 1", b"c 1"):
+        spool.append(payload)
+    replayed = []
+
+    def write(payload):
+        if payload.startswith(b"bad"):
+            raise RejectedBatch("400 Bad Request")
+        replayed.append(payload)
+
+    assert spool.replay(write) == 2
+    assert replayed == [b"a 1", b"c 1"]
+    stats = spool.stats()
+    assert (stats.batches, stats.rejected_total, stats.diverting) == (0, 1, False)
+    assert (tmp_path / DEAD_LETTER_FILE).read_bytes() == b"bad 1\n"
+    assert spool.admit(b"d 1")
+
+
+def test_only_batch_level_client_errors_count_as_rejected():
+    assert is_rejected_write(ApiException(status=400)) and is_rejected_write(ApiException(status=422))
+    assert not any(is_rejected_write(ApiException(status=code)) for code in (401, 404, 429, 500, 503))
+    assert not is_rejected_write(ConnectionError())